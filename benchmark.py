@@ -11,7 +11,12 @@ def benchmark_execution_times(database):
     This method determines for each task the task-sets, that consist only of this task. Then all
     jobs of this task-sets and for the task are read from the database. The execution time of the
     jobs is calculated from the start- and end-date and the average value is built upon this
-    execution times.
+    execution times. Only jobs with a positive execution time are taken into account. A task
+    without a valid job gets its deadline as execution time (pessimistic: the task needs its whole
+    deadline), so that it can still be converted to a Task-object.
+
+    The execution times of all tasks are aggregated by the database in one pass over the jobs and
+    written back with one bulk insert.
 
     Args:
         database -- a Database-object
@@ -21,23 +26,24 @@ def benchmark_execution_times(database):
     start_time = time.time()
 
     task_list = database.read_table_task(convert_to_task_dict=False)  # read table 'Task'
-    c_dict = dict()  # create empty dictionary for execution times
-
-    for task in task_list:  # iterate over all tasks
-        # get all task-sets where the current task is the only task
-        taskset_list = database.read_table_taskset(task_id=task[0], convert=False)
 
-        job_attributes = []  # create empty list for the jobs
+    # get sum and number of the execution times of the jobs of each task
+    # (key = task ID, value = (sum of execution times, number of jobs))
+    job_statistics = {row[0]: (row[1], row[2]) for row in database.read_job_execution_times()}
 
-        for taskset in taskset_list:  # iterate over all task-sets
-            # add all jobs of the current task and task-set
-            job_attributes.extend(database.read_table_job(set_id=taskset[0], task_id=task[0]))
+    c_dict = dict()  # create empty dictionary for execution times
 
-        # calculate execution time of each job
-        job_execution_times = _calculate_executiontimes(job_attributes)
+    for task in task_list:  # iterate over all tasks
+        if task[0] not in job_statistics:  # no valid job found for the task
+            # column 9 is the deadline of the Task-objects (see Database._convert_to_task_dict)
+            logger.warning("Could not find a valid job for task %d, using its deadline %d as "
+                           "execution time", task[0], task[9])
+            c_dict[task[0]] = task[9]
+            continue
 
         # calculate average execution time of current task
-        average_c = sum(job_execution_times) / len(job_execution_times)
+        sum_c, num_jobs = job_statistics[task[0]]
+        average_c = sum_c / num_jobs
 
         # round and add execution time to the dictionary
         c_dict[task[0]] = round(average_c)
@@ -50,32 +56,3 @@ def benchmark_execution_times(database):
     logger.info("Saving calculated execution times to database...")
     database.write_execution_time(c_dict)
     logger.info("Saving successful!")
-
-
-def _calculate_executiontimes(job_attributes):
-    """Calculate the execution times of the given jobs.
-
-    This method calculates the execution times of a list of jobs with the following attributes:
-        Set_ID
-        Task_ID
-        Job_ID
-        Start_Date
-        End_Date
-        Exit_Value
-
-    Args:
-        job_attributes -- list with the job attributes
-    Return:
-        executiontimes -- list with the executiontimes
-    """
-    executiontimes = []  # create empty list for execution times
-
-    # iterate over all jobs
-    for job in job_attributes:
-        execution_time = job[4] - job[3]  # calculate execution time = end_date - start_date
-
-        # check if execution_time is valid
-        if execution_time > 0:
-            executiontimes.append(execution_time)  # append execution time to list
-
-    return executiontimes
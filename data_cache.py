@@ -0,0 +1,163 @@
+"""Module to cache the pre-processed data on disk.
+
+Loading the data from the database and pre-processing it takes minutes for large databases. The
+split arrays (train, validation and test data) are therefore saved as *.npy files and loaded
+memory-mapped on the next run. The cache key is a hash of
+    - the content of the database (tables Task, ExecutionTime and CorrectTaskSet)
+    - the pre-processing settings (features, one hot encoding, scaler, seeds of the splits).
+If the database or the settings change, the key changes and the data is loaded from the database
+again. The feature pipeline fitted on the database is saved in the same entry, so that the pipeline
+always matches the cached data.
+"""
+
+import hashlib
+import json
+import logging
+import os
+import shutil
+
+import numpy as np
+
+import preprocessing
+
+# names of the cached arrays
+DATA_KEYS = ['train_X', 'train_y', 'val_X', 'val_y', 'test_X', 'test_y']
+
+# name of the file of the fitted feature pipeline in a cache entry
+PIPELINE_FILE = 'feature_pipeline.pkl'
+
+
+def get_cache_key(database, settings):
+    """Get the cache key of the data.
+
+    Args:
+        database -- a Database-object
+        settings -- dictionary with the pre-processing settings, must be serializable to JSON
+    Return:
+        key -- hexadecimal hash of the database content and the settings
+    """
+    key_hash = hashlib.sha256()
+    key_hash.update(get_database_fingerprint(database).encode())
+    key_hash.update(json.dumps(settings, sort_keys=True).encode())
+    return key_hash.hexdigest()
+
+
+def get_database_fingerprint(database):
+    """Get the fingerprint of the database content.
+
+    The fingerprint is a hash of the tables Task and ExecutionTime and of aggregates over all
+    columns of the table CorrectTaskSet. As long as the database file is not modified (same size
+    and modification time), the fingerprint is taken from a small file next to the database
+    instead of reading the tables again.
+
+    Args:
+        database -- a Database-object
+    Return:
+        fingerprint -- hexadecimal hash of the database content
+    """
+    db_path = os.path.join(database.db_dir, database.db_name)
+    db_stat = os.stat(db_path)
+    file_state = [db_stat.st_size, db_stat.st_mtime_ns]
+
+    # fingerprint of the unmodified database file
+    fingerprint_path = db_path + '.fingerprint.json'
+    if os.path.exists(fingerprint_path):
+        with open(fingerprint_path, 'r') as fingerprint_file:
+            stored = json.load(fingerprint_file)
+        if stored['file_state'] == file_state:
+            return stored['fingerprint']
+
+    # database was modified: compute fingerprint of the content
+    content_hash = hashlib.sha256()
+    content_hash.update(repr(database.read_table_task(convert_to_task_dict=False)).encode())
+    content_hash.update(repr(sorted(database.read_table_executiontime(
+        convert_to_dict=False))).encode())
+    content_hash.update(repr(database.read_correcttaskset_fingerprint()).encode())
+    fingerprint = content_hash.hexdigest()
+
+    # save fingerprint (not possible e.g. for write protected directories)
+    try:
+        with open(fingerprint_path, 'w') as fingerprint_file:
+            json.dump({'file_state': file_state, 'fingerprint': fingerprint}, fingerprint_file)
+    except OSError as os_err:
+        logging.getLogger('RNN-SA.data_cache.get_database_fingerprint').error(
+            "Could not save fingerprint of the database: %s", os_err)
+
+    return fingerprint
+
+
+def load(cache_dir, name, key):
+    """Load the cached data.
+
+    The arrays are memory-mapped (read-only), i.e. they are only read from disk when they are
+    accessed.
+
+    Args:
+        cache_dir -- directory of the cache
+        name -- name of the cached data, e.g. the name of the database
+        key -- the cache key
+    Return:
+        data -- dictionary with the train, test and validation data or None if nothing is cached
+    """
+    entry_dir = _get_entry_dir(cache_dir, name, key)
+    if not os.path.exists(os.path.join(entry_dir, 'complete')):  # nothing cached
+        return None
+
+    return {data_key: np.load(os.path.join(entry_dir, data_key + '.npy'), mmap_mode='r')
+            for data_key in DATA_KEYS}
+
+
+def load_pipeline(cache_dir, name, key):
+    """Load the feature pipeline of the cached data.
+
+    Args:
+        cache_dir -- directory of the cache
+        name -- name of the cached data, e.g. the name of the database
+        key -- the cache key
+    Return:
+        pipeline -- the fitted FeaturePipeline-object or None if no pipeline is cached
+    """
+    pipeline_path = os.path.join(_get_entry_dir(cache_dir, name, key), PIPELINE_FILE)
+    if not os.path.exists(pipeline_path):  # entry of an older version or nothing cached
+        return None
+
+    return preprocessing.FeaturePipeline.load(pipeline_path)
+
+
+def save(cache_dir, name, key, data, pipeline):
+    """Save the data to the cache.
+
+    Other cached data with the same name (but another key) is outdated and deleted.
+
+    Args:
+        cache_dir -- directory of the cache
+        name -- name of the cached data, e.g. the name of the database
+        key -- the cache key
+        data -- dictionary with the train, test and validation data
+        pipeline -- the FeaturePipeline-object fitted on the database
+    """
+    logger = logging.getLogger('RNN-SA.data_cache.save')
+
+    # delete outdated data
+    if os.path.exists(cache_dir):
+        for entry in os.listdir(cache_dir):
+            if entry.startswith(name + '-'):
+                shutil.rmtree(os.path.join(cache_dir, entry), ignore_errors=True)
+
+    # save arrays, the file 'complete' marks a completely written entry
+    entry_dir = _get_entry_dir(cache_dir, name, key)
+    try:
+        os.makedirs(entry_dir)
+        for data_key in DATA_KEYS:
+            np.save(os.path.join(entry_dir, data_key + '.npy'), np.ascontiguousarray(
+                data[data_key]))
+        pipeline.save(os.path.join(entry_dir, PIPELINE_FILE))
+        open(os.path.join(entry_dir, 'complete'), 'w').close()
+    except OSError as os_err:
+        logger.error("Could not save data to the cache: %s", os_err)
+        shutil.rmtree(entry_dir, ignore_errors=True)
+
+
+def _get_entry_dir(cache_dir, name, key):
+    """Get the directory of a cache entry."""
+    return os.path.join(cache_dir, "%s-%s" % (name, key[:16]))
@@ -0,0 +1,328 @@
+"""Module for feeding the data batch by batch during training.
+
+Instead of loading all task-sets into the memory (main.load_data), a TasksetSequence reads the
+task-sets page by page from the table CorrectTaskSet and replaces the task IDs with the rows of
+the pre-processed task feature matrix. Only the feature matrix and a few pages of task-sets are
+kept in memory, so also databases larger than the memory can be used for training.
+
+The task-sets are split deterministically by Set_ID % NUM_SPLIT_BUCKETS into training, validation
+and test data. For each epoch the order of the pages and the order of the task-sets within each
+page are shuffled. Keras prefetches the next batches on background threads (fit_generator with
+workers > 0), which read different pages from the database at the same time.
+
+A BucketSequence groups task-sets (arrays in memory) by their number of tasks. Each batch contains
+only task-sets with the same number of tasks and is cut to this length, so the recurrent layers
+don't process padded time steps.
+"""
+
+import collections
+import concurrent.futures
+import logging
+import threading
+import time
+
+import keras
+import numpy as np
+
+import preprocessing
+
+# splits of the task-sets by Set_ID % NUM_SPLIT_BUCKETS: 80% training, 10% validation and 10%
+# test data
+NUM_SPLIT_BUCKETS = 10
+SPLIT_BUCKETS = {
+    'train': (0, 1, 2, 3, 4, 5, 6, 7),
+    'val': (8,),
+    'test': (9,)
+}
+
+# number of task columns of the table CorrectTaskSet (TASK1_ID, ..., TASK4_ID)
+NUM_TASK_COLUMNS = 4
+
+
+class TasksetSequence(keras.utils.Sequence):
+    """Sequence of batches of task-sets read from the table CorrectTaskSet.
+
+    The task-sets of a split are divided into pages of batches_per_page batches (consecutive
+    Set_IDs). A page is read with one query over a range of Set_IDs (primary key) and converted to
+    the input tensor at once. Each batch is a tuple (X, y) with the task-sets X [batch_size X
+    time_steps X num_features] and the labels y [batch_size].
+    """
+
+    def __init__(self, database, pipeline, task_attributes, split, batch_size, shuffle=True,
+                 seed=0, batches_per_page=32, time_steps=NUM_TASK_COLUMNS, cached_pages=2):
+        """Constructor of class TasksetSequence.
+
+        Args:
+            database -- a Database-object
+            pipeline -- the fitted FeaturePipeline-object
+            task_attributes -- list with the task attributes (rows of the table Task)
+            split -- name of the split: 'train', 'val' or 'test'
+            batch_size -- number of task-sets per batch
+            shuffle -- whether the pages and the task-sets of a page are shuffled for each epoch
+            seed -- random seed for shuffling
+            batches_per_page -- number of batches read from the database at once
+            time_steps -- number of time steps of the task-sets
+            cached_pages -- number of pages kept in memory (should be at least the number of
+                            prefetching threads + 1)
+        """
+        if split not in SPLIT_BUCKETS:
+            raise ValueError("unknown split %s" % (split,))
+        if batch_size < 1 or batches_per_page < 1 or cached_pages < 1:
+            raise ValueError("batch_size, batches_per_page and cached_pages must be at least 1")
+
+        self.database = database
+        self.split = split
+        self.batch_size = batch_size
+        self.shuffle = shuffle
+        self.seed = seed
+        self.page_size = batch_size * batches_per_page  # number of task-sets per page
+        self.time_steps = time_steps
+        self.cached_pages = cached_pages
+
+        # pre-processed task feature matrix, kept in memory for all batches
+        id_idx = pipeline.default_features.index('Task_ID')  # column of the task ID
+        self._feature_task_ids = [row[id_idx] for row in task_attributes]
+        self._features = pipeline.transform(task_attributes)
+
+        # condition of the split on Set_ID
+        self._split_condition = "Set_ID % {} IN ({})".format(
+            NUM_SPLIT_BUCKETS, ", ".join(str(bucket) for bucket in SPLIT_BUCKETS[split]))
+
+        # pages: first and last Set_ID and number of task-sets of each page
+        self._pages = self._read_pages()
+
+        self._epoch = 0  # number of the current epoch
+        self._batches = None  # (page, offset) of each batch of the current epoch
+        self._page_lock = threading.Lock()  # lock for the page cache
+        self._page_cache = collections.OrderedDict()  # page -> Future of (X, y), LRU order
+        self._order_batches()
+
+    def __len__(self):
+        """Get the number of batches per epoch."""
+        return len(self._batches)
+
+    def __getitem__(self, index):
+        """Get a batch.
+
+        Args:
+            index -- index of the batch in the current epoch
+        Return:
+            x -- float32 numpy array with the task-sets [batch_size X time_steps X num_features]
+            y -- int32 numpy array with the labels [batch_size]
+        """
+        page, offset = self._batches[index]
+        x, y = self._get_page(page)
+        return x[offset:offset + self.batch_size], y[offset:offset + self.batch_size]
+
+    @property
+    def num_tasksets(self):
+        """Number of task-sets of the split."""
+        return int(sum(num_rows for _, _, num_rows in self._pages))
+
+    @property
+    def element_size(self):
+        """Number of features per task."""
+        return self._features.shape[1]
+
+    def on_epoch_end(self):
+        """Shuffle the pages and the task-sets for the next epoch."""
+        self._epoch += 1
+        self._order_batches()
+
+        with self._page_lock:  # the cached pages have the order of the previous epoch
+            self._page_cache.clear()
+
+    def _order_batches(self):
+        """Determine the order of the batches of the current epoch (page by page)."""
+        page_order = np.arange(len(self._pages))
+        if self.shuffle:
+            np.random.RandomState([self.seed, self._epoch]).shuffle(page_order)
+
+        self._batches = [(page, offset) for page in page_order
+                         for offset in range(0, self._pages[page][2], self.batch_size)]
+
+    def _read_pages(self):
+        """Read the Set_IDs of the split and divide them into pages.
+
+        Return:
+            pages -- list with tuples (first Set_ID, last Set_ID, number of task-sets) of the pages
+        """
+        logger = logging.getLogger('RNN-SA.data_stream.TasksetSequence._read_pages')
+        start_time = time.time()
+
+        pages = []
+        with self.database.pooled_connection() as connection:
+            cursor = connection.cursor()
+            cursor.execute("SELECT Set_ID FROM CorrectTaskSet WHERE {} ORDER BY Set_ID".format(
+                self._split_condition))
+
+            while True:
+                set_ids = cursor.fetchmany(self.page_size)  # Set_IDs of the next page
+                if not set_ids:  # all task-sets are read
+                    break
+                pages.append((set_ids[0][0], set_ids[-1][0], len(set_ids)))
+
+        logger.info("Split '%s': %d task-sets in %d pages, time elapsed: %f s", self.split,
+                    sum(num_rows for _, _, num_rows in pages), len(pages),
+                    time.time() - start_time)
+
+        return pages
+
+    def _get_page(self, page):
+        """Get the task-sets of a page (cached for the following batches of the page).
+
+        Only the lookup and the insert of the page cache are locked, the page is read outside of
+        the lock. So the prefetching threads read different pages at the same time, a thread that
+        needs a page which is just being read waits for it.
+
+        Args:
+            page -- index of the page
+        Return:
+            x -- float32 numpy array with the task-sets of the page
+            y -- int32 numpy array with the labels of the page
+        """
+        with self._page_lock:
+            future = self._page_cache.get(page)
+            read_page = future is None  # page is neither cached nor being read
+            if read_page:
+                future = self._page_cache[page] = concurrent.futures.Future()
+                while len(self._page_cache) > self.cached_pages:  # remove least recently used
+                    self._page_cache.popitem(last=False)
+            else:
+                self._page_cache.move_to_end(page)
+            epoch = self._epoch
+
+        if read_page:
+            try:
+                future.set_result(self._read_page(page, epoch))
+            except BaseException as exc:
+                with self._page_lock:  # the page is read again by the next thread
+                    if self._page_cache.get(page) is future:
+                        del self._page_cache[page]
+                future.set_exception(exc)
+                raise
+
+        return future.result()
+
+    def _read_page(self, page, epoch):
+        """Read the task-sets of a page from the database.
+
+        Args:
+            page -- index of the page
+            epoch -- number of the epoch (for shuffling)
+        Return:
+            x -- float32 numpy array with the task-sets of the page
+            y -- int32 numpy array with the labels of the page
+        """
+        first_set_id, last_set_id, num_rows = self._pages[page]
+
+        # each thread uses its own connection
+        with self.database.pooled_connection() as connection:
+            rows = connection.execute(
+                "SELECT Successful, TASK1_ID, TASK2_ID, TASK3_ID, TASK4_ID FROM CorrectTaskSet "
+                "WHERE Set_ID >= ? AND Set_ID <= ? AND {} ORDER BY Set_ID".format(
+                    self._split_condition), (first_set_id, last_set_id)).fetchall()
+
+        if len(rows) != num_rows:
+            raise ValueError("table CorrectTaskSet was modified during training")
+
+        rows = np.asarray(rows, dtype=np.int64).reshape(len(rows), -1)
+        if self.shuffle:  # shuffle task-sets of the page
+            rows = rows[np.random.RandomState([self.seed, epoch, page]).permutation(
+                len(rows))]
+
+        # replace task IDs with the corresponding task attributes
+        x = preprocessing.build_taskset_tensor(rows[:, 1:], self._feature_task_ids,
+                                               self._features, self.time_steps)
+        return x, rows[:, 0].astype(np.int32)
+
+
+class BucketSequence(keras.utils.Sequence):
+    """Sequence of batches of task-sets bucketed by the number of tasks.
+
+    The task-sets are given as padded arrays (post-padding with zeros, e.g. from main.load_data).
+    Each batch contains task-sets of one bucket (same number of tasks) and has the shape
+    [batch_size X num_tasks X num_features].
+    """
+
+    def __init__(self, x, y, batch_size, shuffle=True, seed=0):
+        """Constructor of class BucketSequence.
+
+        Args:
+            x -- numpy array with the padded task-sets [num_tasksets X time_steps X num_features]
+            y -- numpy array with the labels [num_tasksets]
+            batch_size -- maximum number of task-sets per batch
+            shuffle -- whether the task-sets of each bucket and the batches are shuffled for each
+                       epoch
+            seed -- random seed for shuffling
+        """
+        if batch_size < 1:
+            raise ValueError("batch_size must be at least 1")
+
+        self.x = x
+        self.y = y
+        self.batch_size = batch_size
+        self.shuffle = shuffle
+        self.seed = seed
+
+        # number of tasks of each task-set: last time step with a non-zero attribute
+        self.lengths = get_taskset_lengths(x)
+
+        # buckets: indices of the task-sets of each length
+        self.buckets = {int(length): np.flatnonzero(self.lengths == length) for length in
+                        np.unique(self.lengths)}
+
+        self._epoch = 0  # number of the current epoch
+        self._batches = None  # (length, indices) of each batch of the current epoch
+        self._order_batches()
+
+    def __len__(self):
+        """Get the number of batches per epoch."""
+        return len(self._batches)
+
+    def __getitem__(self, index):
+        """Get a batch.
+
+        Args:
+            index -- index of the batch in the current epoch
+        Return:
+            x -- numpy array with the task-sets [batch_size X num_tasks X num_features]
+            y -- numpy array with the labels [batch_size]
+        """
+        length, indices = self._batches[index]
+        # empty task-sets are fed with one (padded) time step
+        return self.x[indices, :max(length, 1)], self.y[indices]
+
+    def on_epoch_end(self):
+        """Shuffle the task-sets and the batches for the next epoch."""
+        self._epoch += 1
+        self._order_batches()
+
+    def _order_batches(self):
+        """Divide the buckets into batches and determine their order for the current epoch."""
+        random_state = np.random.RandomState([self.seed, self._epoch])
+
+        self._batches = []
+        for length in sorted(self.buckets):
+            indices = self.buckets[length]
+            if self.shuffle:
+                indices = random_state.permutation(indices)
+            self._batches.extend((length, np.sort(indices[start:start + self.batch_size]))
+                                 for start in range(0, len(indices), self.batch_size))
+
+        if self.shuffle:  # mix the batches of the buckets
+            order = random_state.permutation(len(self._batches))
+            self._batches = [self._batches[idx] for idx in order]
+
+
+def get_taskset_lengths(x):
+    """Get the number of tasks of padded task-sets.
+
+    Args:
+        x -- numpy array with the task-sets, post-padded with zeros [num_tasksets X time_steps X
+             num_features]
+    Return:
+        lengths -- numpy array with the number of tasks of each task-set [num_tasksets]
+    """
+    non_zero = np.any(np.asarray(x) != 0, axis=2)  # time steps with a task
+    return np.where(non_zero.any(axis=1), x.shape[1] - np.argmax(non_zero[:, ::-1], axis=1), 0)
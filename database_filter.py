@@ -1,59 +1,271 @@
 """Module to filter the database."""
 
 import logging
+import multiprocessing
+import os
+import sqlite3
 import time
 
+import numpy as np
+
 import database_interface
 import logging_config
 import rta
 
+DEFAULT_CACHE_SIZE = 100000  # default maximum number of cached response times
+
 
-def filter_database(database):
+def filter_database(database, chunk_size=None, num_workers=1, cache_size=None):
     """Filter the database.
 
     This method determines all correct task-sets through an exact schedulability analysis method.
-    The method used is currently response time analysis according to Audsley, as it shows better
-    results and is faster than simulation. The correct task-sets are written to the table
-    'CorrectTaskSet' of the database.
+    The method used is currently response time analysis according to Buttazzo, as it shows better
+    results and is faster than simulation. The task-sets are read and analysed in batches of
+    chunk_size task-sets with the schedulability pipeline: fast sufficient tests decide most
+    task-sets, only the remaining ones are checked with the vectorized response time analysis.
+    Optionally the response times are cached and reused for tasks with the same set of higher or
+    same priority tasks in other task-sets. This pays off if the response time analysis needs many
+    iterations, otherwise the vectorized analysis is faster than the lookups. The correct task-sets
+    are written to the table 'CorrectTaskSet' of the database within one transaction.
+
+    If num_workers is greater than 1, the task-sets are analysed in parallel: the range of task-set
+    IDs is split into parts, which are read and analysed by a pool of num_workers processes. The
+    correct task-sets of each part are written by this process as soon as the part is finished.
+    The result is the same as with one worker.
 
     Args:
         database -- a Database-object
+        chunk_size -- number of task-sets that are analysed and written to the database at once
+                      (default: database_interface.DEFAULT_CHUNK_SIZE)
+        num_workers -- number of processes that analyse the task-sets
+        cache_size -- maximum number of cached response times per process (e.g.
+                      DEFAULT_CACHE_SIZE), None to disable the cache
     """
+    if chunk_size is None:  # use default chunk size
+        chunk_size = database_interface.DEFAULT_CHUNK_SIZE
+    if num_workers < 1:
+        raise ValueError("num_workers must be at least 1")
+
     logger = logging.getLogger('RNN-SA.database_filter.filter_database')
     logger.info('Starting to filter task-sets...')
     start_time_filter = time.time()
 
-    # read the data-set from the database
-    logger.info("Reading task-sets from the database...")
-    start_time = time.time()
-    dataset = database.read_table_taskset()  # read table 'TaskSet'
-    end_time = time.time()
-    logger.info("Read %d task-sets from the database.", len(dataset))
-    logger.info("Time elapsed: %f s \n", end_time - start_time)
-
-    # test the data-set with the response time analysis according to Audsley
+    # test the data-set with the response time analysis and write the correct task-sets to the
+    # database
     logger.info('Filtering task-sets...')
-    for taskset in dataset:  # iterate over all task-sets
-        schedulability = rta.rta_buttazzo(taskset)  # check schedulability of task-set
-        real_result = taskset.result  # real result of the task-set
-
-        # compare test result with real result
-        if schedulability is True and real_result == 1:  # true positive
-            # write correct task-set to the database
-            database.write_correct_taskset(taskset)
-        elif schedulability is True and real_result == 0:  # false positive
-            pass
-        elif schedulability is False and real_result == 1:  # false negative
-            pass
-        elif schedulability is False and real_result == 0:  # true negative
-            # write correct task-set to the database
-            database.write_correct_taskset(taskset)
+    statistics = {'num_tasksets': 0}  # number of filtered task-sets
+    # schedulability pipeline: counts the task-sets decided by each test
+    pipeline = rta.SchedulabilityPipeline(_create_response_time_cache(cache_size))
+    if num_workers == 1:
+        # stream the data-set from the database: only chunk_size task-sets are kept in memory
+        batches = database.iter_taskset_batches(chunk_size=chunk_size)  # read table 'TaskSet'
+        correct_tasksets = _select_correct_tasksets(batches, pipeline, statistics)
+    else:
+        correct_tasksets = _select_correct_tasksets_parallel(database, chunk_size, num_workers,
+                                                             cache_size, pipeline, statistics)
+    with database.transaction():
+        if num_workers > 1:
+            # the workers read the table TaskSet while the correct task-sets are written: the
+            # changes are kept in the page cache until the commit, because writing them to the
+            # database file needs an exclusive lock, which would block the workers
+            database.db_cursor.execute("PRAGMA cache_spill = OFF")
+        try:
+            num_correct = database.write_correct_tasksets(correct_tasksets, chunk_size=chunk_size)
+        finally:
+            if num_workers > 1:
+                database.db_cursor.execute("PRAGMA cache_spill = ON")
 
     end_time = time.time()
-    logger.info("Filtering of database finished!")
+    logger.info("Filtering of database finished! Found %d correct task-sets out of %d task-sets.",
+                num_correct, statistics['num_tasksets'])
+    logger.info("Task-sets decided per test: %s", pipeline)
+    if pipeline.response_time_cache is not None:
+        logger.info("Response time cache: %d hits, %d misses, hit rate %.1f%%",
+                    pipeline.response_time_cache.hits, pipeline.response_time_cache.misses,
+                    100.0 * pipeline.response_time_cache.hit_rate)
     logger.info("Time elapsed: %f s", end_time - start_time_filter)
 
 
+def _select_correct_tasksets(batches, pipeline, statistics):
+    """Select the correct task-sets.
+
+    Args:
+        batches -- iterable of task-sets of type TasksetBatch
+        pipeline -- the SchedulabilityPipeline used to check the task-sets
+        statistics -- dictionary where the number of filtered task-sets is counted
+    Return:
+        generator of the correct task-sets as tuples (Set_ID, Successful, TASK1_ID, ...)
+    """
+    for batch in batches:  # iterate over all batches of task-sets
+        statistics['num_tasksets'] += len(batch)
+
+        for row in _get_correct_rows(batch, pipeline).tolist():
+            yield tuple(row)
+
+
+def _get_correct_rows(batch, pipeline):
+    """Get the correct task-sets of a batch.
+
+    A task-set is correct if the result of the response time analysis matches the real result of
+    the task-set:
+        schedulable and real result 1 -- true positive: correct
+        schedulable and real result 0 -- false positive
+        not schedulable and real result 1 -- false negative
+        not schedulable and real result 0 -- true negative: correct
+    Task-sets without tasks are skipped.
+
+    Args:
+        batch -- task-sets of type TasksetBatch
+        pipeline -- the SchedulabilityPipeline used to check the task-sets
+    Return:
+        rows -- array with the correct task-sets, one row (Set_ID, Successful, TASK1_ID, ...) per
+                task-set
+    """
+    # check schedulability of all task-sets in the batch
+    schedulability = pipeline.check_taskset_batch(batch)
+
+    # compare test results with real results
+    correct = ((schedulability & (batch.results == 1))  # true positives
+               | (~schedulability & (batch.results == 0)))  # true negatives
+    correct &= batch.lengths > 0  # skip empty task-sets
+
+    return np.column_stack((batch.taskset_ids[correct], batch.results[correct],
+                            batch.task_ids[correct]))
+
+
+def _create_response_time_cache(cache_size):
+    """Create a response time cache of size cache_size (None if cache_size is None)."""
+    if cache_size is None:
+        return None
+    return rta.ResponseTimeCache(maxsize=cache_size)
+
+
+def _select_correct_tasksets_parallel(database, chunk_size, num_workers, cache_size, pipeline,
+                                      statistics):
+    """Select the correct task-sets with a pool of processes.
+
+    The range of task-set IDs is split into several parts per worker. Each worker reads its parts
+    of the table TaskSet through an own connection and returns the correct task-sets. The
+    correct task-sets of each part are yielded as soon as the part is finished (in order of the
+    task-set IDs), so only the correct task-sets of the parts not yet written are kept in memory.
+
+    Args:
+        database -- a Database-object
+        chunk_size -- number of task-sets that are read and analysed at once
+        num_workers -- number of processes
+        cache_size -- maximum number of cached response times per process
+        pipeline -- the SchedulabilityPipeline where the statistics of the workers are collected
+        statistics -- dictionary where the number of filtered task-sets is counted
+    Return:
+        generator of the correct task-sets as tuples (Set_ID, Successful, TASK1_ID, ...)
+    """
+    logger = logging.getLogger('RNN-SA.database_filter._select_correct_tasksets_parallel')
+
+    # split the task-set IDs into ranges [start_id, end_id)
+    min_id, max_id = database.read_taskset_id_range()
+    if min_id is None:  # table TaskSet is empty
+        return
+    num_parts = num_workers * 4  # several parts per worker to balance the load
+    part_size = max((max_id - min_id + 1) // num_parts + 1, 1)
+    id_ranges = [(start_id, start_id + part_size)
+                 for start_id in range(min_id, max_id + 1, part_size)]
+
+    # the workers get the task catalogue from this process: uncommitted execution times are not
+    # visible to other connections
+    db_path = os.path.join(database.db_dir, database.db_name)
+    task_catalogue = database.get_task_catalogue()
+
+    # analyse the task-sets in parallel
+    worker_statistics = dict()  # key = process ID, value = [number of task-sets, time]
+    with multiprocessing.Pool(num_workers, initializer=_init_worker,
+                              initargs=(db_path, task_catalogue, chunk_size, cache_size)) as pool:
+        for rows, pipeline_statistics, cache_statistics, pid, num_tasksets, elapsed_time in \
+                pool.imap(_filter_id_range, id_ranges):
+            pipeline.merge_statistics(pipeline_statistics)
+            if pipeline.response_time_cache is not None:  # add hits and misses of the worker
+                pipeline.response_time_cache.hits += cache_statistics[0]
+                pipeline.response_time_cache.misses += cache_statistics[1]
+            worker_statistics.setdefault(pid, [0, 0.0])
+            worker_statistics[pid][0] += num_tasksets
+            worker_statistics[pid][1] += elapsed_time
+            statistics['num_tasksets'] += num_tasksets
+
+            for row in rows.tolist():  # correct task-sets of the range
+                yield tuple(row)
+
+    # report throughput of each worker
+    for pid, (num_tasksets, elapsed_time) in sorted(worker_statistics.items()):
+        logger.info("Worker %d: %d task-sets in %f s (%f task-sets/s)", pid, num_tasksets,
+                    elapsed_time, num_tasksets / elapsed_time if elapsed_time > 0 else 0.0)
+
+
+# state of a worker process, set by _init_worker
+_worker_state = dict()
+
+
+def _init_worker(db_path, task_catalogue, chunk_size, cache_size):
+    """Initialize a worker process of the parallel filter.
+
+    Args:
+        db_path -- full path to the database
+        task_catalogue -- dictionary with Task-objects (key = task ID, value = Task-object)
+        chunk_size -- number of task-sets that are read and analysed at once
+        cache_size -- maximum number of cached response times
+    """
+    _worker_state['db_path'] = db_path
+    _worker_state['task_catalogue'] = task_catalogue
+    _worker_state['chunk_size'] = chunk_size
+    # the cache is kept for all ranges analysed by the worker
+    _worker_state['response_time_cache'] = _create_response_time_cache(cache_size)
+
+
+def _filter_id_range(id_range):
+    """Filter the task-sets of a range of task-set IDs (executed by a worker process).
+
+    Args:
+        id_range -- tuple (start_id, end_id), the task-sets with start_id <= Set_ID < end_id are
+                    filtered
+    Return:
+        rows -- array with the correct task-sets
+        pipeline_statistics -- number of task-sets decided by each test of the pipeline
+        cache_statistics -- tuple (hits, misses) of the response time cache for this range
+        pid -- process ID of the worker
+        num_tasksets -- number of filtered task-sets
+        elapsed_time -- time needed for filtering
+    """
+    start_time = time.time()
+
+    results = [np.empty((0, 6), dtype=np.int64)]  # correct task-sets of each chunk
+    num_tasksets = 0  # number of filtered task-sets
+    response_time_cache = _worker_state['response_time_cache']
+    pipeline = rta.SchedulabilityPipeline(response_time_cache)
+    if response_time_cache is not None:  # count hits and misses for this range only
+        response_time_cache.hits = response_time_cache.misses = 0
+
+    connection = sqlite3.connect(_worker_state['db_path'])
+    try:
+        cursor = connection.cursor()
+        cursor.execute("SELECT * FROM TaskSet WHERE Set_ID >= ? AND Set_ID < ?", id_range)
+
+        while True:
+            rows = cursor.fetchmany(_worker_state['chunk_size'])  # fetch next chunk
+            if not rows:  # all task-sets of the range are read
+                break
+
+            batch = database_interface.TasksetBatch.from_rows(rows,
+                                                              _worker_state['task_catalogue'])
+            results.append(_get_correct_rows(batch, pipeline))
+            num_tasksets += len(batch)
+    finally:
+        connection.close()
+
+    cache_statistics = (0, 0) if response_time_cache is None \
+        else (response_time_cache.hits, response_time_cache.misses)
+
+    return np.concatenate(results), pipeline.statistics, cache_statistics, os.getpid(), \
+        num_tasksets, time.time() - start_time
+
+
 if __name__ == "__main__":
     logging_config.init_logging()
     db_dir = "C:\\Users\\Tatjana\\PycharmProjects\\Datenbanken"
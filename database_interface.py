@@ -1,13 +1,31 @@
 """Class and methods for database connectivity."""
 
+import contextlib
 import logging
 import operator
 import os
+import queue
 import sqlite3
+import threading
+
+import numpy as np
 
 import benchmark
 import database_filter
 
+DEFAULT_CHUNK_SIZE = 10000  # default number of rows that are read or written at once
+
+# indexes for the frequent lookups: (name of index, table, indexed columns)
+INDEXES = [
+    # jobs of a task in a task-set, covers the execution time benchmark
+    ('idx_job_set_task', 'Job', ('Set_ID', 'Task_ID', 'Start_Date', 'End_Date')),
+    # task-sets with a given combination of tasks, covers the whole row
+    ('idx_taskset_tasks', 'TaskSet',
+     ('TASK1_ID', 'TASK2_ID', 'TASK3_ID', 'TASK4_ID', 'Set_ID', 'Successful')),
+    # task with a given task ID
+    ('idx_task_id', 'Task', ('Task_ID',)),
+]
+
 
 class Task:
     """Representation of a task.
@@ -23,6 +41,10 @@ class Task:
         execution_time -- time needed to execute the task
     """
 
+    # no per-object dictionary: millions of tasks are created for filtering
+    __slots__ = ('task_id', 'priority', 'pkg', 'arg', 'deadline', 'period', 'number_of_jobs',
+                 'execution_time')
+
     def __init__(self, task_id=-1, priority=-1, pkg=None, arg=None, deadline=-1, period=-1,
                  number_of_jobs=-1, execution_time=-1):
         """Constructor"""
@@ -53,9 +75,12 @@ class Taskset:
         result -- 1 if task-set could be successfully scheduled, otherwise 0, corresponds to column
                   'Sucessful'
         tasks -- list of tasks (of type Task)
+    If the tasks are already sorted according to priorities, presorted=True skips the sorting.
     """
 
-    def __init__(self, taskset_id=-1, result=-1, tasks=None):
+    __slots__ = ('taskset_id', 'result', 'tasks')
+
+    def __init__(self, taskset_id=-1, result=-1, tasks=None, presorted=False):
         """Constructor."""
         self.taskset_id = taskset_id
         self.result = result
@@ -65,7 +90,8 @@ class Taskset:
             self.tasks = tasks
 
         # Sort tasks according to priorities
-        self.tasks.sort(key=operator.attrgetter('priority'))
+        if not presorted:
+            self.tasks.sort(key=operator.attrgetter('priority'))
 
     def __str__(self):
         """Represent Taskset object as String."""
@@ -98,9 +124,206 @@ class Taskset:
         if not isinstance(task, Task):  # wrong input argument
             raise ValueError("task must be of type Task")
 
-        self.tasks.append(task)  # add task to task-set
-        self.tasks.sort(
-            key=operator.attrgetter('priority'))  # sort tasks according to increasing priorities
+        # insert task behind all tasks with higher or same priority: the task-set stays sorted
+        # according to increasing priorities without sorting the whole list
+        index = len(self.tasks)
+        while index > 0 and self.tasks[index - 1].priority > task.priority:
+            index -= 1
+        self.tasks.insert(index, task)  # add task to task-set
+
+
+class TasksetBatch:
+    """Columnar representation of several task-sets.
+
+    The task attributes of N task-sets are stored in NumPy arrays of shape (N, max_tasks). The
+    tasks of each task-set are sorted according to increasing priorities, empty slots are at the
+    end of each row and are marked by the mask.
+
+    The batch is defined by following attributes:
+        taskset_ids -- IDs of the task-sets, shape (N,)
+        results -- results of the task-sets, shape (N,)
+        task_ids -- IDs of the tasks, -1 for empty slots
+        priorities -- priorities of the tasks, 0 for empty slots
+        periods -- periods of the tasks, 0 for empty slots
+        deadlines -- deadlines of the tasks, 0 for empty slots
+        execution_times -- execution times of the tasks, 0 for empty slots
+        mask -- True for a task, False for an empty slot
+    """
+
+    __slots__ = ('taskset_ids', 'results', 'task_ids', 'priorities', 'periods', 'deadlines',
+                 'execution_times', 'mask')
+
+    def __init__(self, taskset_ids, results, task_ids, priorities, periods, deadlines,
+                 execution_times, mask):
+        """Constructor."""
+        self.taskset_ids = taskset_ids
+        self.results = results
+        self.task_ids = task_ids
+        self.priorities = priorities
+        self.periods = periods
+        self.deadlines = deadlines
+        self.execution_times = execution_times
+        self.mask = mask
+
+    def __len__(self):
+        """Get number of task-sets."""
+        return len(self.taskset_ids)
+
+    def __getitem__(self, index):
+        """Get a batch with the task-sets at index (slice, index array or boolean array)."""
+        return TasksetBatch(*[getattr(self, name)[index] for name in self.__slots__])
+
+    @property
+    def lengths(self):
+        """Get the number of tasks of each task-set."""
+        return self.mask.sum(axis=1)
+
+    @classmethod
+    def from_tasksets(cls, tasksets, max_tasks=4):
+        """Create a batch from objects of type Taskset.
+
+        Args:
+            tasksets -- list of Taskset-objects
+            max_tasks -- maximum number of tasks per task-set
+        Return:
+            batch -- the TasksetBatch
+        """
+        num_tasksets = len(tasksets)
+
+        # create arrays for all task-sets
+        taskset_ids = np.empty(num_tasksets, dtype=np.int64)
+        results = np.empty(num_tasksets, dtype=np.int64)
+        columns = np.zeros((5, num_tasksets, max_tasks), dtype=np.int64)
+        columns[0] = -1  # task IDs of empty slots
+        mask = np.zeros((num_tasksets, max_tasks), dtype=bool)
+
+        # fill arrays with the attributes of the tasks
+        for i, taskset in enumerate(tasksets):
+            if len(taskset) > max_tasks:
+                raise ValueError("task-set %d has more than %d tasks" % (taskset.taskset_id,
+                                                                         max_tasks))
+
+            taskset_ids[i] = taskset.taskset_id
+            results[i] = taskset.result
+            for j, task in enumerate(taskset):
+                columns[:, i, j] = (task.task_id, task.priority, task.period, task.deadline,
+                                    task.execution_time)
+                mask[i, j] = True
+
+        return cls(taskset_ids, results, *columns, mask=mask)
+
+    @classmethod
+    def from_rows(cls, rows, task_catalogue):
+        """Create a batch from rows of the table TaskSet or CorrectTaskSet.
+
+        The task attributes are looked up in arrays built from the task catalogue, so that no
+        Task- or Taskset-objects are created.
+
+        Args:
+            rows -- rows (Set_ID, Successful, TASK1_ID, ...) of the table TaskSet
+            task_catalogue -- dictionary with Task-objects (key = task ID, value = Task-object)
+        Return:
+            batch -- the TasksetBatch
+        """
+        rows = np.asarray(rows, dtype=np.int64).reshape(len(rows), -1)
+        task_ids = rows[:, 2:]
+        mask = task_ids != -1
+
+        # lookup table of the task attributes: row = task ID, last row = empty slot
+        lookup = np.zeros((max(task_catalogue, default=-1) + 2, 4), dtype=np.int64)
+        for task_id, task in task_catalogue.items():
+            lookup[task_id] = (task.priority, task.period, task.deadline, task.execution_time)
+
+        # unknown task IDs can't be converted (also IDs outside of the lookup table)
+        known_tasks = np.zeros(len(lookup), dtype=bool)
+        known_tasks[list(task_catalogue)] = True
+        valid_ids = task_ids[mask]
+        in_range = (valid_ids >= 0) & (valid_ids < len(lookup))
+        if not in_range.all() or not known_tasks[valid_ids].all():
+            raise KeyError("task-set contains a task that is not in the task catalogue")
+
+        # get task attributes: shape (N, max_tasks, 4)
+        attributes = lookup[np.where(mask, task_ids, -1)]
+
+        # sort tasks according to increasing priorities, empty slots at the end, stable sorting
+        # keeps the order of tasks with the same priority
+        sort_key = np.where(mask, attributes[:, :, 0], np.iinfo(np.int64).max)
+        order = np.argsort(sort_key, axis=1, kind='mergesort')
+        task_ids = np.take_along_axis(np.where(mask, task_ids, -1), order, axis=1)
+        attributes = np.take_along_axis(attributes, order[:, :, np.newaxis], axis=1)
+        mask = np.take_along_axis(mask, order, axis=1)
+
+        return cls(rows[:, 0], rows[:, 1], task_ids, attributes[:, :, 0], attributes[:, :, 1],
+                   attributes[:, :, 2], attributes[:, :, 3], mask)
+
+
+class ConnectionPool:
+    """Small pool of database connections for threaded readers.
+
+    SQLite connections must not be shared between threads at the same time. The pool hands out
+    each connection to exactly one thread and takes it back afterwards, so that threads can read
+    concurrently without opening a new connection per query. Connections are created lazily up to
+    the size of the pool.
+
+    The pool is defined by following attributes:
+        db_path -- full path to the database file (*.db)
+        size -- maximum number of connections
+    """
+
+    def __init__(self, db_path, size=4):
+        """Constructor of class ConnectionPool."""
+        if size < 1:
+            raise ValueError("size of the connection pool must be at least 1")
+
+        self.db_path = db_path  # full path to the database
+        self.size = size  # maximum number of connections
+        self._idle_connections = queue.Queue(maxsize=size)  # connections not in use
+        self._num_connections = 0  # number of connections created so far
+        self._lock = threading.Lock()  # lock for creating new connections
+
+    @contextlib.contextmanager
+    def connection(self):
+        """Get a connection of the pool.
+
+        The connection is returned to the pool when the with-block is left. If all connections are
+        in use, the calling thread waits until a connection is returned.
+
+        Return:
+            connection -- a sqlite3 connection for exclusive use of the calling thread
+        """
+        connection = self._acquire()
+        try:
+            yield connection
+        finally:
+            connection.commit()  # end read transaction, commit changes if any
+            self._idle_connections.put(connection)  # give connection back to the pool
+
+    def close(self):
+        """Close all idle connections of the pool."""
+        while True:
+            try:
+                connection = self._idle_connections.get_nowait()
+            except queue.Empty:  # all idle connections are closed
+                break
+            connection.close()
+
+            with self._lock:
+                self._num_connections -= 1
+
+    def _acquire(self):
+        """Take an idle connection or create a new one if the pool is not exhausted."""
+        try:
+            return self._idle_connections.get_nowait()
+        except queue.Empty:  # no idle connection available
+            pass
+
+        with self._lock:
+            if self._num_connections < self.size:  # pool not exhausted: create a new connection
+                self._num_connections += 1
+                return sqlite3.connect(self.db_path, check_same_thread=False)
+
+        # pool exhausted: wait for a connection to be returned
+        return self._idle_connections.get()
 
 
 class Database:
@@ -109,24 +332,80 @@ class Database:
     The database is defined by following attributes:
         db_dir -- path to the database file (*.db)
         db_name -- name of the database file (incl. .db)
+        pool_size -- maximum number of connections for threaded readers
+        create_indexes -- whether the indexes for frequent lookups are created if missing
+        analyze -- whether statistics for the query planner are gathered (ANALYZE)
     Additional attributes of a Database object are:
         db_connection -- connection to the database
         db_cursor -- cursor for working with the database
+
+    By default every read and write method opens the database, commits and closes it again. If
+    the Database is used as context manager, the connection is kept open until the with-block is
+    left:
+
+        with Database(db_dir, db_name) as database:
+            ...
+
+    Several writes can be grouped with database.transaction(), they are then committed together
+    when the transaction scope is left.
+
+    The task catalogue (all tasks incl. execution times) needed to convert task-sets to Taskset
+    objects is cached. The cache is invalidated by the own writes to the table ExecutionTime and
+    when another connection has changed the database; catalogue_hits and catalogue_misses count
+    how often it was used.
     """
 
-    def __init__(self, db_dir, db_name):
+    def __init__(self, db_dir, db_name, pool_size=4, create_indexes=True, analyze=False):
         """Constructor of class Database."""
 
         self.db_dir = db_dir  # path to the database
         self.db_name = db_name  # name of the database
+        self.pool_size = pool_size  # maximum number of connections for threaded readers
+        self.create_indexes = create_indexes  # whether missing indexes are created
+        self.analyze = analyze  # whether statistics for the query planner are gathered
         self.db_connection = None  # connection to the database
         self.db_cursor = None  # cursor for working with the database
 
+        self._keep_open = False  # whether the connection is kept open (context manager)
+        self._transaction_depth = 0  # number of nested transaction scopes
+        self._transaction_number = 0  # number of the current (outermost) transaction scope
+        self._connection_number = 0  # number of the current connection
+        self._connection_pool = None  # pool of connections for threaded readers
+
+        # cache for the task catalogue (Task-objects incl. execution times)
+        self._task_catalogue = None  # dictionary with Task-objects (key = task ID)
+        self._task_catalogue_version = None  # version of the database content when cached
+        self._task_catalogue_transaction = None  # transaction scope in which the cache was checked
+        self.catalogue_hits = 0  # number of times the cached catalogue was used
+        self.catalogue_misses = 0  # number of times the catalogue was read from the database
+
         # check that database exists
         self._check_if_database_exists()
 
         # check the database: check if all necessary tables exist
-        self._check_database()
+        # all checks share one connection and are committed together
+        with self.transaction():
+            self._check_database()
+
+    def __enter__(self):
+        """Open the database and keep the connection open until the with-block is left."""
+        self._keep_open = True
+        self._open_db()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        """Commit (or roll back on errors) and close the database."""
+        self._keep_open = False
+
+        if self.db_connection is not None:
+            if exc_type is not None:  # an error occurred: discard uncommitted changes
+                self.db_connection.rollback()
+            self._transaction_depth = 0
+            self._close_db()
+
+        if self._connection_pool is not None:
+            self._connection_pool.close()
+            self._connection_pool = None
 
     #############################
     # check database and tables #
@@ -168,6 +447,10 @@ class Database:
         if not self._check_if_table_exists('TaskSet'):  # table TaskSet does not exist
             raise Exception("no such table: %s" % ('TaskSet',))
 
+        # create indexes for frequent lookups
+        if self.create_indexes:
+            self.ensure_indexes(analyze=self.analyze)
+
         # check table CorrectTaskSet
         if not self._check_if_table_exists('CorrectTaskSet'):  # table CorrectTaskSet does not exist
             # check table ExecutionTime
@@ -184,6 +467,81 @@ class Database:
             if not self._check_if_table_exists('CorrectTaskSet'):  # something went wrong
                 raise Exception("nos such table %s - creation not possible" % ('CorrectTaskSet',))
 
+    def ensure_indexes(self, analyze=False):
+        """Create the indexes for frequent lookups if they are missing.
+
+        This method creates the indexes defined by INDEXES. An index is only created if there is
+        no index with the same name and the columns are not already indexed by another index or the
+        primary key. Optionally the statistics for the query planner are gathered (ANALYZE), which
+        helps to choose the right index on large databases.
+
+        Args:
+            analyze -- whether ANALYZE should be run after creating the indexes
+        Return:
+            created -- list with the names of the created indexes
+        """
+        # create logger
+        logger = logging.getLogger('RNN-SA.database_interface.ensure_indexes')
+
+        created = []  # names of the created indexes
+
+        with self.transaction():
+            for index_name, table_name, columns in INDEXES:  # iterate over all indexes
+                if self._check_if_index_exists(index_name, table_name, columns):
+                    continue
+
+                # create index
+                logger.info("Creating index %s on %s(%s)...", index_name, table_name,
+                            ", ".join(columns))
+                self.db_cursor.execute("CREATE INDEX IF NOT EXISTS {} ON {} ({})".format(
+                    index_name, table_name, ", ".join(columns)))
+                created.append(index_name)
+
+            if analyze:  # gather statistics for the query planner
+                logger.info("Analyzing the database...")
+                self.db_cursor.execute("ANALYZE")
+
+        if created:
+            logger.info("Created indexes: %s", ", ".join(created))
+
+        return created
+
+    def _check_if_index_exists(self, index_name, table_name, columns):
+        """Check if an index exists in the database.
+
+        An index exists if there is an index with the name index_name or if the table has an
+        index (or primary key) with the same leading columns.
+
+        Args:
+            index_name -- name of the index
+            table_name -- name of the indexed table
+            columns -- tuple with the names of the indexed columns
+        Return:
+            True/False -- whether the index exists/doesn't exist in the database
+        """
+        self._open_db()  # open database
+
+        # check the primary key: the rowid is an index of its own
+        self.db_cursor.execute("PRAGMA table_info({})".format(table_name))
+        primary_key = tuple(row[1] for row in sorted(self.db_cursor.fetchall(),
+                                                     key=operator.itemgetter(5)) if row[5] > 0)
+
+        # get the columns of all other indexes of the table
+        indexed_columns = [primary_key]
+        self.db_cursor.execute("PRAGMA index_list({})".format(table_name))
+        for index_row in self.db_cursor.fetchall():
+            if index_row[1] == index_name:  # index with the same name exists
+                self._close_db()  # close database
+                return True
+
+            self.db_cursor.execute("PRAGMA index_info({})".format(index_row[1]))
+            indexed_columns.append(tuple(row[2] for row in self.db_cursor.fetchall()))
+
+        self._close_db()  # close database
+
+        # check if the columns are already indexed
+        return any(index[:len(columns)] == tuple(columns) for index in indexed_columns)
+
     def _check_if_table_exists(self, table_name):
         """Check if a table exists in the database.
 
@@ -216,32 +574,172 @@ class Database:
     # open / close database #
     #########################
 
+    @contextlib.contextmanager
+    def transaction(self):
+        """Transaction scope.
+
+        All reads and writes inside the with-block share one connection. The changes are committed
+        once when the outermost transaction scope is left, or rolled back if an error occurred.
+        Transaction scopes can be nested.
+
+            with database.transaction():
+                database.write_correct_taskset(taskset_1)
+                database.write_correct_taskset(taskset_2)
+        """
+        self._open_db()  # open database (or reuse the open connection)
+        if self._transaction_depth == 0:  # outermost scope
+            self._transaction_number += 1
+        self._transaction_depth += 1
+
+        try:
+            yield self
+        except BaseException:
+            self._transaction_depth -= 1
+            if self._transaction_depth == 0:  # outermost scope: discard changes
+                self.db_connection.rollback()
+                self._close_db()
+            raise
+
+        self._transaction_depth -= 1
+        self._close_db()  # commit and close database if this is the outermost scope
+
+    @contextlib.contextmanager
+    def pooled_connection(self):
+        """Get a connection for a threaded reader.
+
+        The connection is taken from a connection pool of size self.pool_size and given back when
+        the with-block is left. Each thread must use its own pooled connection.
+
+            with database.pooled_connection() as connection:
+                rows = connection.execute("SELECT * FROM Task").fetchall()
+        """
+        if self._connection_pool is None:  # create pool on first use
+            db_path = os.path.join(self.db_dir, self.db_name)  # create full path to the database
+            self._connection_pool = ConnectionPool(db_path, self.pool_size)
+
+        with self._connection_pool.connection() as connection:
+            yield connection
+
     def _open_db(self):
         """Open the database.
 
         This methods opens the database defined by self.db_dir and self.db_name by creating a
-        database connection and a cursor.
+        database connection and a cursor. If the connection is already open, it is reused.
         """
+        if self.db_connection is not None:  # database is already open
+            return
+
         db_path = os.path.join(self.db_dir, self.db_name)  # create full path to the database
 
         # create database connection and a cursor
         self.db_connection = sqlite3.connect(db_path)
         self.db_cursor = self.db_connection.cursor()
+        self._connection_number += 1
 
     def _close_db(self):
         """Close the database.
 
         This method commits the changes to the database and closes it by closing and deleting the
-        database connection and the cursor.
+        database connection and the cursor. Inside a transaction scope nothing is done, the
+        changes are committed when the scope is left. If the database is used as context manager,
+        the changes are committed but the connection is kept open.
         """
-        # commit changes and close connection to the database
+        if self._transaction_depth > 0:  # inside a transaction scope: commit later
+            return
+
+        # commit changes
         self.db_connection.commit()
+
+        if self._keep_open:  # connection is closed when the with-block is left
+            return
+
+        # close connection to the database
         self.db_connection.close()
 
         # delete database connection and cursor
         self.db_connection = None
         self.db_cursor = None
 
+    ##################
+    # task catalogue #
+    ##################
+
+    def get_task_catalogue(self):
+        """Get the task catalogue.
+
+        The task catalogue is a dictionary with all tasks of the table Task incl. their execution
+        times from the table ExecutionTime:
+            key = task ID
+            value = Task-object.
+        The catalogue is cached. The own writes to the table ExecutionTime invalidate the cache
+        (call invalidate_task_catalogue() after other changes of the tables Task or ExecutionTime
+        with this object). Changes by other connections are noticed by the version of the database
+        content: PRAGMA data_version as long as the same connection is open, otherwise the size and
+        modification time of the database file. Inside a transaction scope the version is only
+        checked on the first call.
+
+        Return:
+            task_dict -- dictionary with Task-objects, must not be modified
+        """
+        if self._task_catalogue is not None and self._transaction_depth > 0 and \
+                self._task_catalogue_transaction == self._transaction_number:
+            # already checked in this transaction scope
+            self.catalogue_hits += 1
+            return self._task_catalogue
+
+        version = self._read_database_version()
+        if self._task_catalogue is not None and self._is_task_catalogue_current(version):
+            self.catalogue_hits += 1
+        else:  # catalogue is not cached or outdated: read tables 'Task' and 'ExecutionTime'
+            self.catalogue_misses += 1
+            self._task_catalogue = self.read_table_task()
+
+        self._task_catalogue_version = version
+        if self._transaction_depth > 0:
+            self._task_catalogue_transaction = self._transaction_number
+
+        return self._task_catalogue
+
+    def invalidate_task_catalogue(self):
+        """Invalidate the cached task catalogue."""
+        self._task_catalogue = None
+        self._task_catalogue_version = None
+        self._task_catalogue_transaction = None
+
+    def _read_database_version(self):
+        """Read the version of the database content.
+
+        PRAGMA data_version changes if another connection has committed changes, but it can only be
+        compared for the same connection. It is read if the connection is kept open.
+
+        Return:
+            version -- tuple with the number of the connection, its data_version (None if no
+                       connection is open) and the size and modification time of the database file
+        """
+        connection_number = data_version = None
+        if self.db_connection is not None:  # connection is kept open
+            self.db_cursor.execute("PRAGMA data_version")
+            connection_number, data_version = self._connection_number, self.db_cursor.fetchone()[0]
+
+        db_stat = os.stat(os.path.join(self.db_dir, self.db_name))
+        return connection_number, data_version, db_stat.st_size, db_stat.st_mtime_ns
+
+    def _is_task_catalogue_current(self, version):
+        """Check if the cached task catalogue belongs to the given version of the database.
+
+        Args:
+            version -- version of the database content (see _read_database_version)
+        Return:
+            True if the database was not changed by another connection since caching
+        """
+        cached_version = self._task_catalogue_version
+        if cached_version is None:
+            return False
+
+        if version[0] is not None and version[0] == cached_version[0]:  # same connection
+            return version[1] == cached_version[1]
+        return version[2:] == cached_version[2:]
+
     #######################
     # read / write tables #
     #######################
@@ -273,6 +771,30 @@ class Database:
 
         return rows
 
+    def read_job_execution_times(self):
+        """Read the aggregated execution times of the jobs.
+
+        This method aggregates the execution times (End_Date - Start_Date) of the jobs of all
+        task-sets that consist of only one task. Jobs without a positive execution time are
+        ignored. The aggregation is done in one grouped query over the tables TaskSet and Job.
+
+        Return:
+            rows -- list with tuples (Task_ID, sum of execution times, number of jobs)
+        """
+        self._open_db()  # open database
+
+        self.db_cursor.execute("SELECT Job.Task_ID, SUM(Job.End_Date - Job.Start_Date), COUNT(*) "
+                               "FROM TaskSet JOIN Job ON Job.Set_ID = TaskSet.Set_ID "
+                               "AND Job.Task_ID = TaskSet.TASK1_ID "
+                               "WHERE TaskSet.TASK2_ID = ? AND TaskSet.TASK3_ID = ? "
+                               "AND TaskSet.TASK4_ID = ? AND Job.End_Date - Job.Start_Date > 0 "
+                               "GROUP BY Job.Task_ID", (-1, -1, -1))
+
+        rows = self.db_cursor.fetchall()
+        self._close_db()  # close database
+
+        return rows
+
     def read_table_task(self, task_id=None, convert_to_task_dict=True):
         """Read the table Task.
 
@@ -339,6 +861,21 @@ class Database:
 
         return rows
 
+    def read_taskset_id_range(self):
+        """Read the smallest and the largest task-set ID of the table TaskSet.
+
+        Return:
+            min_id -- smallest task-set ID (None if the table is empty)
+            max_id -- largest task-set ID (None if the table is empty)
+        """
+        self._open_db()  # open database
+
+        self.db_cursor.execute("SELECT MIN(Set_ID), MAX(Set_ID) FROM TaskSet")
+        min_id, max_id = self.db_cursor.fetchone()
+        self._close_db()  # close database
+
+        return min_id, max_id
+
     def read_table_executiontime(self, convert_to_dict=True):
         """Read the table ExecutionTime.
 
@@ -383,6 +920,125 @@ class Database:
 
         return rows
 
+    def read_correcttaskset_fingerprint(self):
+        """Read the fingerprint of the table CorrectTaskSet.
+
+        The fingerprint consists of aggregates over all columns of the table, so that the content
+        of large tables can be compared without reading all rows.
+
+        Return:
+            fingerprint -- tuple with number of rows and sums over the columns
+        """
+        self._open_db()  # open database
+
+        self.db_cursor.execute("SELECT COUNT(*), TOTAL(Set_ID), TOTAL(Successful), "
+                               "TOTAL(Set_ID * Successful), "
+                               "TOTAL(TASK1_ID), TOTAL(TASK2_ID), "
+                               "TOTAL(TASK3_ID), TOTAL(TASK4_ID), "
+                               "TOTAL(Set_ID * TASK1_ID), TOTAL(Set_ID * TASK2_ID), "
+                               "TOTAL(Set_ID * TASK3_ID), TOTAL(Set_ID * TASK4_ID) "
+                               "FROM CorrectTaskSet")
+        fingerprint = self.db_cursor.fetchone()
+        self._close_db()  # close database
+
+        return fingerprint
+
+    def iter_tasksets(self, chunk_size=DEFAULT_CHUNK_SIZE, convert=True):
+        """Iterate over the table TaskSet.
+
+        This method reads the table TaskSet chunk by chunk with at most chunk_size rows in memory
+        at once. The task-sets are yielded one by one, so that also tables larger than the memory
+        can be processed.
+
+        While the iteration is running, the connection is kept open and all changes made through
+        this Database-object are committed when the iteration is finished.
+
+        Args:
+            chunk_size -- number of rows that are fetched at once
+            convert -- whether the task-sets should be converted to objects of type Taskset
+        Return:
+            generator of the task-sets (objects of type Taskset or raw tuples)
+        """
+        return self._iter_table('TaskSet', chunk_size, convert)
+
+    def iter_correcttasksets(self, chunk_size=DEFAULT_CHUNK_SIZE, convert=False):
+        """Iterate over the table CorrectTaskSet.
+
+        This method is the equivalent of iter_tasksets() for the table CorrectTaskSet.
+
+        Args:
+            chunk_size -- number of rows that are fetched at once
+            convert -- whether the task-sets should be converted to objects of type Taskset
+        Return:
+            generator of the task-sets (raw tuples or objects of type Taskset)
+        """
+        return self._iter_table('CorrectTaskSet', chunk_size, convert)
+
+    def iter_taskset_batches(self, chunk_size=DEFAULT_CHUNK_SIZE, table_name='TaskSet'):
+        """Iterate over a table of task-sets in batches.
+
+        This method reads the table TaskSet (or CorrectTaskSet) chunk by chunk and yields each
+        chunk as TasksetBatch with at most chunk_size task-sets.
+
+        Args:
+            chunk_size -- number of task-sets per batch
+            table_name -- name of the table, either TaskSet or CorrectTaskSet
+        Return:
+            generator of TasksetBatch-objects
+        """
+        task_catalogue = self.get_task_catalogue()
+
+        rows = []  # rows of the current batch
+        for row in self._iter_table(table_name, chunk_size, convert=False):
+            rows.append(row)
+            if len(rows) == chunk_size:  # batch is full
+                yield TasksetBatch.from_rows(rows, task_catalogue)
+                rows = []
+
+        if rows:  # remaining task-sets
+            yield TasksetBatch.from_rows(rows, task_catalogue)
+
+    def _iter_table(self, table_name, chunk_size, convert):
+        """Iterate over a table of task-sets with fetchmany.
+
+        Args:
+            table_name -- name of the table, either TaskSet or CorrectTaskSet
+            chunk_size -- number of rows that are fetched at once
+            convert -- whether the task-sets should be converted to objects of type Taskset
+        Return:
+            generator of the task-sets
+        """
+        if chunk_size < 1:
+            raise ValueError("chunk_size must be at least 1")
+
+        # keep the connection open during the iteration, commit when the iteration is finished
+        self._open_db()
+        self._transaction_depth += 1
+
+        try:
+            if convert:  # read table 'Task' only once for all chunks
+                task_attributes = self.get_task_catalogue()
+
+            # use an own cursor, self.db_cursor is used by the other methods
+            cursor = self.db_connection.cursor()
+            cursor.execute("SELECT * FROM {}".format(table_name))
+
+            while True:
+                rows = cursor.fetchmany(chunk_size)  # fetch next chunk
+                if not rows:  # all rows are read
+                    break
+
+                if convert:  # convert task-sets to objects of type Taskset
+                    rows = self._convert_to_taskset(rows, task_attributes)
+
+                for row in rows:
+                    yield row
+
+            cursor.close()
+        finally:
+            self._transaction_depth -= 1
+            self._close_db()  # commit and close database
+
     def write_execution_time(self, c_dict):
         """Write the execution times to the database.
 
@@ -410,13 +1066,14 @@ class Database:
         insert_or_replace_sql = "INSERT OR REPLACE INTO ExecutionTime" \
                                 "(TASK_ID, Average_C) VALUES(?, ?)"
 
-        # iterate over all keys
-        for key in c_dict:
-            # insert or replace task-set
-            self.db_cursor.execute(insert_or_replace_sql, (key, c_dict[key]))
+        # insert or replace the execution times of all tasks
+        self.db_cursor.executemany(insert_or_replace_sql, c_dict.items())
 
         self._close_db()  # close database
 
+        # execution times have changed: cached task catalogue is outdated
+        self.invalidate_task_catalogue()
+
     def write_correct_taskset(self, taskset):
         """Write the correct task-set to to the database.
 
@@ -425,53 +1082,68 @@ class Database:
         Args:
             taskset -- the task-set of type Taskset that should be added to the database
         """
-        # create logger
-        logger = logging.getLogger('RNN-SA.database_interface.write_correct_taskset')
+        self.write_correct_tasksets([taskset])
 
-        self._open_db()  # open database
+    def write_correct_tasksets(self, tasksets, chunk_size=DEFAULT_CHUNK_SIZE):
+        """Write several correct task-sets to the database.
 
-        # create table CorrectTaskSet if it does not exist
-        create_table_sql = "CREATE TABLE IF NOT EXISTS CorrectTaskSet (" \
-                           "Set_ID INTEGER, " \
-                           "Successful INT, " \
-                           "TASK1_ID INTEGER, " \
-                           "TASK2_ID INTEGER, " \
-                           "TASK3_ID INTEGER, " \
-                           "TASK4_ID INTEGER, " \
-                           "PRIMARY KEY(Set_ID)" \
-                           ");"
-        try:
-            self.db_cursor.execute(create_table_sql)
-        except sqlite3.Error as sqle:
-            logger.error(sqle)
+        This method writes correct task-sets to the table 'CorrectTaskSet' of the database. The
+        task-sets are consumed lazily and inserted in chunks of chunk_size rows with executemany.
+        All chunks are written in one transaction, i.e. the changes are committed only once.
+
+        Args:
+            tasksets -- iterable of task-sets, either objects of type Taskset or raw tuples
+                        (Set_ID, Successful, TASK1_ID, ...) with up to four task IDs
+            chunk_size -- number of task-sets that are inserted at once
+        Return:
+            num_written -- number of task-sets written to the database
+        """
+        # create logger
+        logger = logging.getLogger('RNN-SA.database_interface.write_correct_tasksets')
+
+        if chunk_size < 1:
+            raise ValueError("chunk_size must be at least 1")
 
         # sql statement for inserting or replacing a row in the CorrectTaskSet table
         insert_or_replace_sql = "INSERT OR REPLACE INTO CorrectTaskSet" \
                                 "(Set_ID, Successful, TASK1_ID, TASK2_ID, TASK3_ID, TASK4_ID)" \
                                 " VALUES(?, ?, ?, ?, ?, ?)"
 
-        num_tasks = len(taskset)  # get number of tasks in the task-set
-
-        # insert or replace task-set
-        if num_tasks == 1:  # only one task
-            task_id = taskset[0].task_id
-            self.db_cursor.execute(insert_or_replace_sql,
-                                   (taskset.taskset_id, taskset.result, taskset[0].task_id, -1, -1,
-                                    -1))
-        elif num_tasks == 2:  # two tasks
-            self.db_cursor.execute(insert_or_replace_sql,
-                                   (taskset.taskset_id, taskset.result, taskset[0].task_id,
-                                    taskset[1].task_id, -1, -1))
-        elif num_tasks == 3:  # three tasks
-            self.db_cursor.execute(insert_or_replace_sql,
-                                   (taskset.taskset_id, taskset.result, taskset[0].task_id,
-                                    taskset[1].task_id, taskset[2].task_id, -1))
-        elif num_tasks == 4:  # four tasks
-            self.db_cursor.execute(insert_or_replace_sql,
-                                   (taskset.taskset_id, taskset.result, taskset[0].task_id,
-                                    taskset[1].task_id, taskset[2].task_id, taskset[3].task_id))
-
-        self._close_db()  # close database
+        num_written = 0  # number of task-sets written to the database
+
+        with self.transaction():
+            # create table CorrectTaskSet if it does not exist
+            create_table_sql = "CREATE TABLE IF NOT EXISTS CorrectTaskSet (" \
+                               "Set_ID INTEGER, " \
+                               "Successful INT, " \
+                               "TASK1_ID INTEGER, " \
+                               "TASK2_ID INTEGER, " \
+                               "TASK3_ID INTEGER, " \
+                               "TASK4_ID INTEGER, " \
+                               "PRIMARY KEY(Set_ID)" \
+                               ");"
+            try:
+                self.db_cursor.execute(create_table_sql)
+            except sqlite3.Error as sqle:
+                logger.error(sqle)
+
+            chunk = []  # rows of the current chunk
+            for taskset in tasksets:  # iterate over all task-sets
+                row = self._convert_to_correcttaskset_row(taskset)
+                if row is None:  # task-set can't be represented in the table
+                    continue
+
+                chunk.append(row)
+                if len(chunk) == chunk_size:  # chunk is full: insert or replace task-sets
+                    self.db_cursor.executemany(insert_or_replace_sql, chunk)
+                    num_written += len(chunk)
+                    chunk = []
+
+            if chunk:  # insert or replace the remaining task-sets
+                self.db_cursor.executemany(insert_or_replace_sql, chunk)
+                num_written += len(chunk)
+
+        return num_written
 
     ##############
     # conversion #
@@ -509,7 +1181,7 @@ class Database:
 
         return task_dict
 
-    def _convert_to_taskset(self, rows):
+    def _convert_to_taskset(self, rows, task_attributes=None):
         """Convert a list of task-sets to objects of type Taskset.
 
         This function converts a list of task-sets from the table TaskSet to a list of Taskset
@@ -517,12 +1189,14 @@ class Database:
 
         Args:
             rows -- the rows read from the table TaskSet
+            task_attributes -- dictionary with the Task-objects (key = task ID, value =
+                               Task-object), read from the database if not specified
         Return:
             dataset -- list of Taskset objects
         """
-        # read table 'Task': get dictionary with task attributes
-        # (key = task ID, value = Task-object)
-        task_attributes = self.read_table_task()
+        if task_attributes is None:
+            # get dictionary with task attributes (key = task ID, value = Task-object)
+            task_attributes = self.get_task_catalogue()
 
         dataset = []  # create empty list
 
@@ -533,20 +1207,45 @@ class Database:
             label = row[1]
             task_ids = row[2:]
 
-            # create empty task-set
-            new_taskset = Taskset(taskset_id=taskset_id, result=label, tasks=[])
+            # get all tasks of the task-set (skip invalid task-id -1)
+            tasks = [task_attributes[task_id] for task_id in task_ids if task_id != -1]
 
-            # iterate over all tasks and add them to the task-set
-            for task_id in task_ids:
-                if task_id != -1:  # valid task-id
-                    new_task = task_attributes[task_id]  # get task
-                    new_taskset.add_task(new_task)  # add task to task-set
+            # create task-set: tasks are sorted once according to priorities
+            new_taskset = Taskset(taskset_id=taskset_id, result=label, tasks=tasks)
 
             # add task-set to dataset
             dataset.append(new_taskset)
 
         return dataset
 
+    @staticmethod
+    def _convert_to_correcttaskset_row(taskset):
+        """Convert a task-set to a row of the table CorrectTaskSet.
+
+        Task-sets with less than four tasks are filled up with the task ID -1.
+
+        Args:
+            taskset -- an object of type Taskset or a tuple (Set_ID, Successful, TASK1_ID, ...)
+        Return:
+            row -- tuple (Set_ID, Successful, TASK1_ID, TASK2_ID, TASK3_ID, TASK4_ID) or None if
+                   the task-set doesn't consist of one to four tasks
+        """
+        if isinstance(taskset, Taskset):  # get attributes of Taskset-object
+            row = (taskset.taskset_id, taskset.result) + tuple(task.task_id for task in taskset)
+        else:  # raw tuple
+            row = tuple(taskset)
+
+        num_tasks = len(row) - 2  # get number of task IDs
+
+        if isinstance(taskset, Taskset) and not 1 <= num_tasks <= 4:  # no valid task-set
+            return None
+        if not 0 <= num_tasks <= 4:  # invalid raw tuple
+            raise ValueError("a task-set row must consist of Set_ID, Successful and up to four "
+                             "task IDs")
+
+        # fill up the task IDs with -1
+        return row + (-1,) * (4 - num_tasks)
+
     def _convert_to_executiontime_dict(self, execution_times):
         """Convert a list of execution times to a dictionary.
 
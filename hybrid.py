@@ -0,0 +1,204 @@
+"""Module for the hybrid schedulability analysis with the RNN and the exact RTA.
+
+The RNN is fast but not exact, the response time analysis is exact but slow. A HybridAnalyser
+combines both: the trained model classifies a batch of task-sets, a prediction is accepted if the
+sigmoid output is outside the uncertainty band [lower, upper]. Only the borderline task-sets are
+checked with the exact response time analysis according to Buttazzo (rta.rta_buttazzo_batch, which
+gives the same results as rta.rta_buttazzo). This gives nearly the accuracy of the RTA at nearly
+the cost of the RNN.
+"""
+
+import logging
+import os
+import time
+
+import numpy as np
+
+import database_interface
+import rta
+
+
+class HybridAnalyser:
+    """Schedulability analysis with the RNN and a fallback to the exact RTA.
+
+    The analyser is defined by following attributes:
+        predictor -- model with a method predict_proba(x) (e.g. a NumpyLSTMModel or an
+                     inference.SchedulabilityPredictor)
+        lower -- lower limit of the uncertainty band
+        upper -- upper limit of the uncertainty band
+    The number of task-sets decided by the RNN and by the RTA and the time spent in both are
+    counted in the dictionary statistics.
+    """
+
+    def __init__(self, predictor, lower=0.1, upper=0.9):
+        """Constructor of class HybridAnalyser."""
+        if not 0.0 <= lower <= upper <= 1.0:
+            raise ValueError("uncertainty band must fulfil 0 <= lower <= upper <= 1")
+
+        self.predictor = predictor
+        self.lower = lower
+        self.upper = upper
+        self.reset_statistics()
+
+    def __str__(self):
+        """Represent statistics of the analyser as string."""
+        return "rnn=%d, rta=%d (fallback %.1f%%), rnn_time=%f s, rta_time=%f s" % (
+            self.statistics['rnn'], self.statistics['rta'], 100.0 * self.fallback_fraction,
+            self.statistics['rnn_time'], self.statistics['rta_time'])
+
+    @property
+    def fallback_fraction(self):
+        """Fraction of the task-sets checked with the RTA."""
+        total = self.statistics['rnn'] + self.statistics['rta']
+        return self.statistics['rta'] / total if total else 0.0
+
+    def reset_statistics(self):
+        """Reset the number of decided task-sets and the times."""
+        self.statistics = {'rnn': 0, 'rta': 0, 'rnn_time': 0.0, 'rta_time': 0.0}
+
+    def check(self, x, batch):
+        """Check the schedulability of a batch of task-sets.
+
+        Args:
+            x -- numpy array with the pre-processed task-sets for the model [num_tasksets X
+                 time_steps X num_features]
+            batch -- the same task-sets of type TasksetBatch (incl. execution times) for the RTA
+        Return:
+            schedulable -- boolean array, schedulability of each task-set
+            fallback -- boolean array, whether the task-set was checked with the RTA
+            probabilities -- array with the outputs of the RNN
+        """
+        # Check input argument: must be a TasksetBatch
+        if not isinstance(batch, database_interface.TasksetBatch):  # Invalid input argument
+            raise ValueError("batch must be of type TasksetBatch")
+        if len(x) != len(batch):
+            raise ValueError("x and batch must contain the same number of task-sets")
+
+        # classify all task-sets with the RNN
+        start_time = time.time()
+        probabilities = np.asarray(self.predictor.predict_proba(x)).reshape(-1)
+        schedulable = probabilities > 0.5
+        self.statistics['rnn_time'] += time.time() - start_time
+
+        # check the borderline task-sets with the exact RTA
+        start_time = time.time()
+        fallback = (probabilities >= self.lower) & (probabilities <= self.upper)
+        if fallback.any():
+            schedulable[fallback] = rta.rta_buttazzo_taskset_batch(batch[fallback])
+        self.statistics['rta_time'] += time.time() - start_time
+
+        self.statistics['rta'] += int(fallback.sum())
+        self.statistics['rnn'] += int(len(batch) - fallback.sum())
+
+        return schedulable, fallback, probabilities
+
+
+def evaluate_hybrid(analyser, batches):
+    """Evaluate a hybrid analyser on labelled task-sets.
+
+    Args:
+        analyser -- the HybridAnalyser-object
+        batches -- iterable of tuples (x, batch), the labels are the results of the TasksetBatch
+    Return:
+        report -- dictionary with the number of task-sets, the fraction checked with the RTA, the
+                  throughput (task-sets per second) and the accuracy of the hybrid analysis and of
+                  the RNN alone
+    """
+    logger = logging.getLogger('RNN-SA.hybrid.evaluate_hybrid')
+    analyser.reset_statistics()
+
+    num_tasksets = num_correct = num_rnn_correct = 0
+    start_time = time.time()
+    for x, batch in batches:
+        schedulable, fallback, probabilities = analyser.check(x, batch)
+        labels = batch.results.astype(bool)
+
+        num_tasksets += len(batch)
+        num_correct += int((schedulable == labels).sum())
+        num_rnn_correct += int(((probabilities > 0.5) == labels).sum())
+    elapsed = time.time() - start_time
+
+    report = {
+        'num_tasksets': num_tasksets,
+        'fallback_fraction': analyser.fallback_fraction,
+        'throughput': num_tasksets / elapsed if elapsed > 0 else 0.0,
+        'accuracy': num_correct / num_tasksets if num_tasksets else 0.0,
+        'rnn_accuracy': num_rnn_correct / num_tasksets if num_tasksets else 0.0,
+    }
+    logger.info("%d task-sets, %.1f%% checked with the RTA, %f task-sets/s, accuracy = %f "
+                "(RNN alone: %f)", num_tasksets, 100.0 * report['fallback_fraction'],
+                report['throughput'], report['accuracy'], report['rnn_accuracy'])
+    logger.info("%s", analyser)
+
+    return report
+
+
+def iter_labelled_batches(database, pipeline, time_steps, chunk_size=10000):
+    """Iterate over the table CorrectTaskSet as input for evaluate_hybrid().
+
+    Args:
+        database -- a Database-object
+        pipeline -- the fitted FeaturePipeline-object
+        time_steps -- number of time steps of the model input
+        chunk_size -- number of task-sets per batch
+    Return:
+        generator of tuples (x, batch) with the pre-processed task-sets and the TasksetBatch
+    """
+    task_attributes = database.read_table_task(convert_to_task_dict=False)
+    task_catalogue = database.get_task_catalogue()
+
+    rows = []  # rows of the current batch
+    for row in database.iter_correcttasksets(chunk_size=chunk_size):
+        rows.append(row)
+        if len(rows) == chunk_size:  # batch is full
+            yield _to_labelled_batch(rows, pipeline, task_attributes, task_catalogue, time_steps)
+            rows = []
+
+    if rows:  # remaining task-sets
+        yield _to_labelled_batch(rows, pipeline, task_attributes, task_catalogue, time_steps)
+
+
+def _to_labelled_batch(rows, pipeline, task_attributes, task_catalogue, time_steps):
+    """Convert rows of the table CorrectTaskSet to the input of the model and to a TasksetBatch.
+
+    Args:
+        rows -- rows (Set_ID, Successful, TASK1_ID, ...) of the table CorrectTaskSet
+        pipeline -- the fitted FeaturePipeline-object
+        task_attributes -- list with the task attributes (rows of the table Task)
+        task_catalogue -- dictionary with Task-objects (key = task ID, value = Task-object)
+        time_steps -- number of time steps of the model input
+    Return:
+        x -- numpy array with the pre-processed task-sets
+        batch -- the TasksetBatch
+    """
+    rows = np.asarray(rows, dtype=np.int64).reshape(len(rows), -1)
+    x = pipeline.transform_tasksets(rows[:, 2:], task_attributes, time_steps)
+    return x, database_interface.TasksetBatch.from_rows(rows, task_catalogue)
+
+
+if __name__ == "__main__":
+    import logging_config
+    import numpy_lstm
+    import params
+    import preprocessing
+
+    # determine database directory and name
+    db_dir, db_name = os.getcwd(), "panda_v3.db"
+
+    # create and initialize logger
+    logging_config.init_logging(db_dir, db_name)
+
+    # the exported NumPy model is used if available, otherwise the Keras model
+    if os.path.exists(params.config['numpy_model_path']):
+        model = numpy_lstm.NumpyLSTMModel.load(params.config['numpy_model_path'])
+    else:
+        import inference
+        model = inference.SchedulabilityPredictor(params.config['model_path'],
+                                                  params.config['feature_pipeline_path'])
+
+    evaluate_hybrid(
+        HybridAnalyser(model, params.config['hybrid_lower'], params.config['hybrid_upper']),
+        iter_labelled_batches(database_interface.Database(db_dir, db_name),
+                              preprocessing.FeaturePipeline.load(
+                                  params.config['feature_pipeline_path']),
+                              params.config['time_steps']))
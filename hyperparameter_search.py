@@ -0,0 +1,817 @@
+"""Module for the parallel hyperparameter search.
+
+talos.Scan trains one permutation of the hyperparameter grid after the other. A small LSTM uses
+only a few threads, so most cores of a many-core machine are idle. parallel_search() therefore
+trains several trials at once in worker processes. Each worker pins the number of intra-op and
+inter-op threads of TensorFlow, so that the workers don't compete for the same cores.
+
+The results are appended to a CSV file with the same columns as the experiments of talos
+(experiments/LSTM/*.csv): round_epochs, val_loss, val_acc, loss, acc, lr and the hyperparameters.
+Each result is written as soon as its trial is finished. If the search is interrupted, it can be
+resumed: the trials already contained in the CSV file are skipped.
+
+successive_halving() trains all trials only for a few epochs and continues the training only for
+the best trials (by val_acc), so that little time is spent on clearly losing configurations.
+
+If enabled by config['use_trial_cache'], the result of each trial is cached (see trial_cache). A
+trial trained before with the same data, feature configuration and seed is not trained again.
+
+model_based_search() doesn't train a fixed grid: a TPESampler is fitted on the finished trials
+and proposes the next trials where good results are most likely.
+"""
+
+import csv
+import itertools
+import logging
+import math
+import multiprocessing
+import os
+import shutil
+import tempfile
+import time
+
+import numpy as np
+
+import preprocessing
+import trial_cache
+
+# metrics of a trial, written in front of the hyperparameters (same columns as talos)
+METRICS = ['round_epochs', 'val_loss', 'val_acc', 'loss', 'acc', 'lr']
+
+
+def expand_grid(hparams_grid):
+    """Get all permutations of a hyperparameter grid.
+
+    The values of a hyperparameter are given like for talos (see params.hparams_talos):
+        - a list of discrete values
+        - a tuple (min, max, steps) with steps values evenly spaced from min to max (integers if
+          min and max are integers).
+
+    Args:
+        hparams_grid -- dictionary with the values of each hyperparameter
+    Return:
+        permutations -- list with a hyperparameter dictionary per permutation
+    """
+    names = list(hparams_grid)
+    values = [_expand_values(hparams_grid[name]) for name in names]
+    return [dict(zip(names, permutation)) for permutation in itertools.product(*values)]
+
+
+def parallel_search(data, hparams_grid, csv_path, num_workers=None, intra_op_threads=None,
+                    inter_op_threads=None, resume=True):
+    """Hyperparameter search with several worker processes.
+
+    Args:
+        data -- a dictionary with the training and validation data (see main.load_data)
+        hparams_grid -- dictionary with the values of each hyperparameter (see expand_grid)
+        csv_path -- path of the CSV file with the results
+        num_workers -- number of trials trained at once, default: config['search_workers']
+        intra_op_threads -- threads per operation per worker, default:
+                            config['search_intra_op_threads']
+        inter_op_threads -- operations executed in parallel per worker, default:
+                            config['search_inter_op_threads']
+        resume -- whether the trials already contained in the CSV file are skipped
+    Return:
+        results -- list with the results of the trained trials (dictionaries with the metrics and
+                   the hyperparameters)
+    """
+    from params import config  # import configuration parameters
+
+    logger = logging.getLogger('RNN-SA.hyperparameter_search.parallel_search')
+    start_time = time.time()
+
+    hparams_names = list(hparams_grid)
+    trials = expand_grid(hparams_grid)
+
+    # skip the finished trials of an interrupted search
+    if resume:
+        finished = {get_trial_key(result, hparams_names) for result in read_results(csv_path)}
+        trials = [hparams for hparams in trials if get_trial_key(hparams, hparams_names) not in
+                  finished]
+        logger.info("%d trials are already finished", len(finished))
+
+    logger.info("Training %d trials...", len(trials))
+
+    results = []
+    cache = create_trial_cache(data)
+    with TrialPool(data, num_workers or config['search_workers'],
+                   intra_op_threads or config['search_intra_op_threads'],
+                   inter_op_threads or config['search_inter_op_threads'],
+                   config['search_seed']) as pool:
+        for result in _run_trials(pool, trials, hparams_names, cache):
+            append_result(csv_path, result, hparams_names)
+            results.append(result)
+            logger.info("Trial %d/%d: val_acc = %f after %d epochs (%f s)", len(results),
+                        len(trials), result['val_acc'], result['round_epochs'], result['time'])
+
+    end_time = time.time()
+    logger.info("Finished %d trials in %f s", len(results), end_time - start_time)
+    if cache is not None:
+        logger.info("%d trials were taken from the cache", cache.hits)
+
+    return results
+
+
+def successive_halving(data, hparams_grid, csv_path, min_epochs=None, eta=None,
+                       num_workers=None, intra_op_threads=None, inter_op_threads=None):
+    """Hyperparameter search with successive halving.
+
+    All trials are trained for min_epochs epochs. Only the best 1/eta of the trials (by val_acc)
+    are trained further, the epoch budget of the survivors grows by the factor eta in each round
+    until the number of epochs of the trial (hparams['num_epochs']) is reached. The survivors
+    continue the training of their saved models. A trial stopped by EarlyStopping isn't trained
+    further, but it keeps its rank.
+
+    The last result of each trial is appended to the CSV file. The CPU-hours saved compared with
+    training all trials for hparams['num_epochs'] epochs are logged; the time of an epoch of a
+    trial is estimated by its mean time per trained epoch.
+
+    Args:
+        data -- a dictionary with the training and validation data (see main.load_data)
+        hparams_grid -- dictionary with the values of each hyperparameter (see expand_grid)
+        csv_path -- path of the CSV file with the results
+        min_epochs -- epoch budget of the first round, default: config['halving_min_epochs']
+        eta -- factor by which the trials are reduced and the budget is increased per round,
+               default: config['halving_eta']
+        num_workers -- number of trials trained at once, default: config['search_workers']
+        intra_op_threads -- threads per operation per worker, default:
+                            config['search_intra_op_threads']
+        inter_op_threads -- operations executed in parallel per worker, default:
+                            config['search_inter_op_threads']
+    Return:
+        results -- list with the last result of each trial, sorted by val_acc (best first)
+    """
+    from params import config  # import configuration parameters
+
+    logger = logging.getLogger('RNN-SA.hyperparameter_search.successive_halving')
+    start_time = time.time()
+
+    min_epochs = min_epochs or config['halving_min_epochs']
+    eta = eta or config['halving_eta']
+    intra_op_threads = intra_op_threads or config['search_intra_op_threads']
+    if min_epochs < 1 or eta < 2:
+        raise ValueError("min_epochs must be at least 1 and eta at least 2")
+
+    hparams_names = list(hparams_grid)
+    trials = expand_grid(hparams_grid)
+    results = {}  # last result of each trial (key = index of the trial)
+    model_dir = tempfile.mkdtemp(prefix='successive_halving_')  # models of the survivors
+
+    try:
+        with TrialPool(data, num_workers or config['search_workers'], intra_op_threads,
+                       inter_op_threads or config['search_inter_op_threads'],
+                       config['search_seed']) as pool:
+            survivors = list(range(len(trials)))
+            budget = min_epochs
+            while survivors:
+                # train the survivors which aren't stopped and have epochs left
+                jobs = []
+                for idx in survivors:
+                    trained_epochs, stopped = 0, False
+                    if idx in results:
+                        trained_epochs, stopped = results[idx]['round_epochs'], \
+                                                  results[idx]['stopped']
+                    epochs = min(budget, trials[idx]['num_epochs'])
+                    if not stopped and trained_epochs < epochs:
+                        jobs.append((idx, dict(trials[idx], num_epochs=epochs), trained_epochs,
+                                     os.path.join(model_dir, '%d.hdf5' % idx)))
+
+                for idx, result in pool.imap_unordered(jobs, _run_budgeted_trial):
+                    result['num_epochs'] = trials[idx]['num_epochs']  # not the budget
+                    if idx in results:  # add the time of the previous rounds
+                        result['time'] += results[idx]['time']
+                    results[idx] = result
+
+                logger.info("Budget %d epochs: trained %d of %d trials, best val_acc = %f", budget,
+                            len(jobs), len(survivors), max(results[idx]['val_acc'] for idx in
+                                                           survivors))
+
+                # all survivors are fully trained
+                if all(budget >= trials[idx]['num_epochs'] for idx in survivors):
+                    break
+
+                # keep the best trials, the others are finished; the last trial is fully trained
+                survivors.sort(key=lambda idx: results[idx]['val_acc'], reverse=True)
+                survivors = survivors[:max(int(math.ceil(len(survivors) / eta)), 1)]
+                budget = budget * eta if len(survivors) > 1 else trials[survivors[0]]['num_epochs']
+    finally:
+        shutil.rmtree(model_dir, ignore_errors=True)
+
+    # write the last result of each trial
+    ranking = sorted(results.values(), key=lambda result: result['val_acc'], reverse=True)
+    for result in ranking:
+        append_result(csv_path, result, hparams_names)
+
+    # compare with training all trials for their full number of epochs
+    used_time = sum(result['time'] for result in ranking)
+    full_time = sum(result['time'] / max(result['round_epochs'], 1) * result['num_epochs']
+                    for result in ranking)
+    logger.info("Best val_acc = %f, %d of %d epochs trained, CPU-hours: %f used, %f for the full "
+                "grid, %f saved", ranking[0]['val_acc'] if ranking else 0.0,
+                sum(result['round_epochs'] for result in ranking),
+                sum(result['num_epochs'] for result in ranking),
+                used_time * intra_op_threads / 3600, full_time * intra_op_threads / 3600,
+                (full_time - used_time) * intra_op_threads / 3600)
+    logger.info("Finished successive halving in %f s", time.time() - start_time)
+
+    return ranking
+
+
+def model_based_search(data, search_space, csv_path, num_trials=None, target_val_acc=None,
+                       num_workers=None, intra_op_threads=None, inter_op_threads=None, seed=0):
+    """Hyperparameter search with trials proposed by a TPESampler.
+
+    The sampler is fitted on all finished trials and proposes the next num_workers trials, which
+    are trained at once. The results of earlier searches in the CSV file are used as finished
+    trials, so a search can be continued. The search stops after num_trials new trials or as soon
+    as a trial reaches target_val_acc.
+
+    Args:
+        data -- a dictionary with the training and validation data (see main.load_data)
+        search_space -- dictionary with the search space of each hyperparameter (see TPESampler)
+        csv_path -- path of the CSV file with the results
+        num_trials -- maximum number of new trials, default: config['tpe_num_trials']
+        target_val_acc -- val_acc at which the search stops, default:
+                          config['tpe_target_val_acc'] (None = no target)
+        num_workers -- number of trials trained at once, default: config['search_workers']
+        intra_op_threads -- threads per operation per worker, default:
+                            config['search_intra_op_threads']
+        inter_op_threads -- operations executed in parallel per worker, default:
+                            config['search_inter_op_threads']
+        seed -- random seed of the sampler
+    Return:
+        results -- list with the results of the new trials in the order they are finished
+    """
+    from params import config  # import configuration parameters
+
+    logger = logging.getLogger('RNN-SA.hyperparameter_search.model_based_search')
+    start_time = time.time()
+
+    num_trials = num_trials or config['tpe_num_trials']
+    if target_val_acc is None:
+        target_val_acc = config['tpe_target_val_acc']
+    num_workers = num_workers or config['search_workers']
+    hparams_names = list(search_space)
+
+    # finished trials of earlier searches
+    sampler = TPESampler(search_space, seed=seed)
+    for result in read_results(csv_path):
+        sampler.add_result(result, float(result['val_acc']))
+    logger.info("%d trials are already finished", len(sampler.scores))
+
+    results = []
+    cache = create_trial_cache(data)
+    with TrialPool(data, num_workers, intra_op_threads or config['search_intra_op_threads'],
+                   inter_op_threads or config['search_inter_op_threads'],
+                   config['search_seed']) as pool:
+        while len(results) < num_trials:
+            if target_val_acc is not None and sampler.scores and \
+                    max(sampler.scores) >= target_val_acc:
+                break
+
+            proposals = sampler.propose(min(num_workers, num_trials - len(results)))
+            for result in _run_trials(pool, proposals, hparams_names, cache):
+                sampler.add_result(result, result['val_acc'])
+                append_result(csv_path, result, hparams_names)
+                results.append(result)
+                logger.info("Trial %d: val_acc = %f (best %f) with %s", len(results),
+                            result['val_acc'], max(sampler.scores), ", ".join(
+                                "%s=%s" % (name, _format_value(result[name])) for name in
+                                hparams_names))
+
+    logger.info("Finished %d trials in %f s, best val_acc = %f", len(results),
+                time.time() - start_time, max(sampler.scores) if sampler.scores else 0.0)
+    if cache is not None:
+        logger.info("%d trials were taken from the cache", cache.hits)
+
+    return results
+
+
+class TPESampler:
+    """Tree-structured Parzen estimator (TPE) for proposing hyperparameters.
+
+    The finished trials are split into the best fraction gamma (by score) and the rest. For each
+    hyperparameter a density l(x) is fitted on the good trials and a density g(x) on the other
+    trials; numeric hyperparameters get a Gaussian kernel per trial, categorical hyperparameters
+    smoothed counts. The sampler draws candidates from l(x) and proposes the candidate with the
+    largest ratio l(x) / g(x). Until num_initial trials are finished, it proposes random trials.
+
+    The search space of a hyperparameter is given as
+        - a list of discrete values (categorical)
+        - a tuple (min, max) for a range of numbers (integers if min and max are integers)
+        - a tuple (min, max, 'log') for a range sampled on a logarithmic scale.
+    """
+
+    def __init__(self, search_space, gamma=0.25, num_initial=8, num_candidates=32, seed=0):
+        """Constructor of class TPESampler.
+
+        Args:
+            search_space -- dictionary with the search space of each hyperparameter
+            gamma -- fraction of the trials used as good trials
+            num_initial -- number of random trials before the densities are used
+            num_candidates -- number of candidates drawn from l(x) per proposal
+            seed -- random seed
+        """
+        self.search_space = dict(search_space)
+        self.gamma = gamma
+        self.num_initial = num_initial
+        self.num_candidates = num_candidates
+        self.random_state = np.random.RandomState(seed)
+
+        self.observations = []  # hyperparameters of the finished trials (in the unit space)
+        self.scores = []  # scores of the finished trials
+
+        for name, space in self.search_space.items():
+            if isinstance(space, tuple) and (len(space) not in (2, 3) or space[0] >= space[1]):
+                raise ValueError("invalid range %s of %s" % (space, name))
+
+    def add_result(self, hparams, score):
+        """Add a finished trial.
+
+        Args:
+            hparams -- hyperparameter dictionary (values may be formatted as strings, e.g. read
+                       from the CSV file)
+            score -- score of the trial (larger is better), e.g. val_acc
+        """
+        try:
+            observation = {name: self._to_unit(name, hparams[name]) for name in self.search_space}
+        except (KeyError, ValueError):  # trial is outside of the search space
+            return
+
+        self.observations.append(observation)
+        self.scores.append(score)
+
+    def propose(self, num_proposals=1):
+        """Propose new trials.
+
+        Several proposals are made with the 'constant liar' strategy: a proposal counts as bad
+        trial for the following proposals, so that they are different.
+
+        Args:
+            num_proposals -- number of trials
+        Return:
+            proposals -- list with a hyperparameter dictionary per trial
+        """
+        observations, scores = list(self.observations), list(self.scores)
+        lie = min(scores) if scores else 0.0
+
+        proposals = []
+        for _ in range(num_proposals):
+            if len(observations) < self.num_initial:
+                proposal = {name: self._sample_prior(name) for name in self.search_space}
+            else:
+                proposal = self._propose_tpe(observations, scores)
+            observations.append(proposal)
+            scores.append(lie)
+            proposals.append({name: self._from_unit(name, proposal[name]) for name in
+                              self.search_space})
+
+        return proposals
+
+    def _propose_tpe(self, observations, scores):
+        """Propose a trial with the largest ratio l(x) / g(x).
+
+        Args:
+            observations -- hyperparameters of the finished trials (in the unit space)
+            scores -- scores of the finished trials
+        Return:
+            proposal -- hyperparameters of the trial (in the unit space)
+        """
+        order = np.argsort(scores)[::-1]
+        num_good = max(int(math.ceil(self.gamma * len(scores))), 1)
+        good = [observations[idx] for idx in order[:num_good]]
+        bad = [observations[idx] for idx in order[num_good:]]
+
+        log_ratio = np.zeros(self.num_candidates)
+        candidates = {}
+        for name in self.search_space:
+            good_values = np.asarray([observation[name] for observation in good])
+            bad_values = np.asarray([observation[name] for observation in bad])
+            if isinstance(self.search_space[name], tuple):  # numeric
+                candidates[name] = self._sample_parzen(good_values)
+                log_ratio += np.log(_parzen_density(candidates[name], good_values)) - np.log(
+                    _parzen_density(candidates[name], bad_values))
+            else:  # categorical
+                num_choices = len(self.search_space[name])
+                good_probabilities = _category_probabilities(good_values, num_choices)
+                candidates[name] = self.random_state.choice(num_choices, self.num_candidates,
+                                                            p=good_probabilities)
+                log_ratio += np.log(good_probabilities[candidates[name]]) - np.log(
+                    _category_probabilities(bad_values, num_choices)[candidates[name]])
+
+        best = int(np.argmax(log_ratio))
+        return {name: candidates[name][best] for name in self.search_space}
+
+    def _sample_prior(self, name):
+        """Sample a value of a hyperparameter uniformly (in the unit space)."""
+        space = self.search_space[name]
+        if isinstance(space, tuple):
+            return self.random_state.uniform()
+        return self.random_state.randint(len(space))
+
+    def _sample_parzen(self, values):
+        """Sample candidates from the Parzen estimator of numeric values (in the unit space)."""
+        bandwidth = _parzen_bandwidth(len(values))
+        # mixture of a Gaussian per value and the uniform prior
+        components = self.random_state.randint(len(values) + 1, size=self.num_candidates)
+        samples = self.random_state.uniform(size=self.num_candidates)
+        from_kernel = components < len(values)
+        samples[from_kernel] = self.random_state.normal(values[components[from_kernel]],
+                                                        bandwidth)
+        return np.clip(samples, 0.0, 1.0)
+
+    def _to_unit(self, name, value):
+        """Transform a value of a hyperparameter to the unit space.
+
+        Numeric values are mapped to [0, 1], categorical values to the index of the choice.
+        """
+        space = self.search_space[name]
+        if isinstance(space, tuple):
+            value = float(value)
+            if not space[0] <= value <= space[1]:
+                raise ValueError("%s = %s is outside of %s" % (name, value, space))
+            if len(space) == 3:  # logarithmic scale
+                return math.log(value / space[0]) / math.log(space[1] / space[0])
+            return (value - space[0]) / (space[1] - space[0])
+
+        choices = [_format_value(choice) for choice in space]
+        return choices.index(_format_value(value))
+
+    def _from_unit(self, name, unit_value):
+        """Transform a value of a hyperparameter from the unit space."""
+        space = self.search_space[name]
+        if isinstance(space, tuple):
+            if len(space) == 3:  # logarithmic scale
+                value = space[0] * (space[1] / space[0]) ** float(unit_value)
+            else:
+                value = space[0] + float(unit_value) * (space[1] - space[0])
+            if isinstance(space[0], int) and isinstance(space[1], int):
+                return int(min(max(round(value), space[0]), space[1]))
+            return float(value)
+
+        return space[int(unit_value)]
+
+
+class TrialPool:
+    """Pool of worker processes that train trials.
+
+    A trial is a hyperparameter dictionary. It is trained with ml_models.LSTM_model on the data
+    given to the constructor (sent to each worker only once). The workers are started with the
+    'spawn' method, so that they don't inherit the TensorFlow state of this process. They import
+    the default configuration parameters again, so the configuration of this process (e.g. the
+    data shape set by main.load_data) is sent to them as well.
+
+        with TrialPool(data, num_workers=4) as pool:
+            for result in pool.imap_unordered(trials):
+                ...
+    """
+
+    def __init__(self, data, num_workers=1, intra_op_threads=1, inter_op_threads=1, seed=None):
+        """Constructor of class TrialPool.
+
+        Args:
+            data -- a dictionary with the training and validation data
+            num_workers -- number of worker processes
+            intra_op_threads -- threads per operation per worker
+            inter_op_threads -- operations executed in parallel per worker
+            seed -- random seed of the weights of each trial (None = not fixed)
+        """
+        from params import config  # import configuration parameters
+
+        if num_workers < 1:
+            raise ValueError("num_workers must be at least 1")
+
+        # the input shape of the models is given by the data
+        config = dict(config, time_steps=data['train_X'].shape[1],
+                      element_size=data['train_X'].shape[2])
+
+        self.num_workers = num_workers
+        self._pool = multiprocessing.get_context('spawn').Pool(
+            num_workers, initializer=_init_worker,
+            initargs=({key: data[key] for key in ['train_X', 'train_y', 'val_X', 'val_y']},
+                      config, intra_op_threads, inter_op_threads, seed))
+
+    def __enter__(self):
+        """Use the pool in a with-block."""
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        """Stop the worker processes."""
+        self.close()
+
+    def close(self):
+        """Stop the worker processes."""
+        if self._pool is not None:
+            self._pool.terminate()
+            self._pool.join()
+            self._pool = None
+
+    def imap_unordered(self, trials, function=None):
+        """Train trials in the worker processes.
+
+        Args:
+            trials -- iterable of hyperparameter dictionaries (or arguments of function)
+            function -- function that trains a trial in a worker, default: _run_trial
+        Return:
+            generator of the results in the order the trials are finished
+        """
+        return self._pool.imap_unordered(function or _run_trial, trials)
+
+
+def create_trial_cache(data):
+    """Create the trial cache of a search (if enabled by config['use_trial_cache']).
+
+    The feature configuration is taken from the saved feature pipeline (default settings if no
+    pipeline is saved), the training configuration from config.
+
+    Args:
+        data -- a dictionary with the training and validation data
+    Return:
+        cache -- a trial_cache.TrialCache-object or None
+    """
+    from params import config  # import configuration parameters
+
+    if not config['use_trial_cache']:
+        return None
+
+    if os.path.exists(config['feature_pipeline_path']):
+        feature_settings = preprocessing.FeaturePipeline.load(
+            config['feature_pipeline_path']).get_settings()
+    else:
+        feature_settings = preprocessing.FeaturePipeline().get_settings()
+
+    training_config = {name: config[name] for name in trial_cache.TRAINING_CONFIG_KEYS}
+
+    return trial_cache.TrialCache(config['trial_cache_dir'], data, feature_settings,
+                                  training_config, config['search_seed'])
+
+
+def get_trial_key(hparams, hparams_names):
+    """Get the key of a trial to compare trials of different searches.
+
+    Args:
+        hparams -- hyperparameter dictionary (or a result with the hyperparameters)
+        hparams_names -- names of the hyperparameters that define the trial
+    Return:
+        key -- tuple with the formatted values of the hyperparameters
+    """
+    return tuple(_format_value(hparams.get(name)) for name in hparams_names)
+
+
+def read_results(csv_path):
+    """Read the results of a search.
+
+    Args:
+        csv_path -- path of the CSV file with the results
+    Return:
+        results -- list with a dictionary per row (column name -> value as string), empty if the
+                   file doesn't exist
+    """
+    if not os.path.exists(csv_path):
+        return []
+
+    with open(csv_path, 'r', newline='') as csv_file:
+        return [row for row in csv.DictReader(csv_file)]
+
+
+def append_result(csv_path, result, hparams_names):
+    """Append the result of a trial to the CSV file.
+
+    The header is written if the file is new. If the file exists, the row is written in the order
+    of its header (e.g. the order of talos), columns that are not in the header are skipped.
+
+    Args:
+        csv_path -- path of the CSV file with the results
+        result -- dictionary with the metrics and the hyperparameters of the trial
+        hparams_names -- names of the hyperparameter columns
+    """
+    header = None  # header of an existing file
+    if os.path.exists(csv_path):
+        with open(csv_path, 'r', newline='') as csv_file:
+            header = next(csv.reader(csv_file), None)
+
+    row = {name: result[name] for name in METRICS}
+    row.update((name, _format_value(result[name])) for name in hparams_names)
+
+    with open(csv_path, 'a', newline='') as csv_file:
+        if header is None:  # new (or empty) file
+            header = METRICS + list(hparams_names)
+            csv.writer(csv_file).writerow(header)
+        writer = csv.DictWriter(csv_file, fieldnames=header, extrasaction='ignore')
+        writer.writerow(row)
+        csv_file.flush()
+
+
+def _run_trials(pool, trials, hparams_names, cache):
+    """Train trials, trials found in the cache are not trained.
+
+    Args:
+        pool -- the TrialPool-object
+        trials -- list of hyperparameter dictionaries
+        hparams_names -- names of the hyperparameters that define the trials (key of the cache)
+        cache -- a trial_cache.TrialCache-object or None
+    Return:
+        generator of the results, cached results first
+    """
+    pending = []  # trials that must be trained
+    for hparams in trials:
+        result = cache.get({name: hparams[name] for name in hparams_names}) \
+            if cache is not None else None
+        if result is not None:
+            yield result
+        else:
+            pending.append(hparams)
+
+    for result in pool.imap_unordered(pending):
+        if cache is not None:  # the result contains the hyperparameters of the trial
+            cache.put({name: result[name] for name in hparams_names}, result, METRICS + ['time'])
+        yield result
+
+
+def _parzen_bandwidth(num_values):
+    """Bandwidth of the Gaussian kernels of a Parzen estimator with num_values values."""
+    return max(0.5 / math.sqrt(num_values + 1), 0.05)
+
+
+def _parzen_density(samples, values):
+    """Density of a Parzen estimator (Gaussian kernels and uniform prior on [0, 1]).
+
+    Args:
+        samples -- numpy array with the points where the density is evaluated
+        values -- numpy array with the values of the estimator
+    Return:
+        density -- numpy array with the density at each sample
+    """
+    bandwidth = _parzen_bandwidth(len(values))
+    kernels = np.exp(-0.5 * ((samples[:, np.newaxis] - values[np.newaxis, :]) / bandwidth) ** 2) \
+        / (bandwidth * math.sqrt(2 * math.pi))
+    return (kernels.sum(axis=1) + 1.0) / (len(values) + 1)
+
+
+def _category_probabilities(values, num_choices):
+    """Probabilities of the choices of a categorical hyperparameter (counts with prior 1).
+
+    Args:
+        values -- numpy array with the indices of the chosen values
+        num_choices -- number of choices
+    Return:
+        probabilities -- numpy array with the probability of each choice
+    """
+    counts = np.bincount(values.astype(np.int64), minlength=num_choices) + 1.0
+    return counts / counts.sum()
+
+
+def _expand_values(values):
+    """Expand the values of a hyperparameter (see expand_grid).
+
+    Args:
+        values -- list of values or a tuple (min, max, steps)
+    Return:
+        values -- list of values
+    """
+    if isinstance(values, tuple):
+        minimum, maximum, steps = values
+        expanded = np.linspace(minimum, maximum, int(steps))
+        if isinstance(minimum, int) and isinstance(maximum, int):
+            return sorted(set(int(round(value)) for value in expanded))
+        return [float(value) for value in expanded]
+
+    return list(values)
+
+
+def _format_value(value):
+    """Format the value of a hyperparameter for the CSV file.
+
+    Functions (e.g. activation functions) are written by name, because their representation
+    contains the memory address. The representation of talos ('<function tanh at 0x...>') is also
+    formatted as name, so that results of talos can be resumed.
+
+    Args:
+        value -- value of a hyperparameter
+    Return:
+        formatted -- the value as string
+    """
+    if callable(value):
+        return getattr(value, '__name__', str(value))
+
+    formatted = str(value)
+    if formatted.startswith('<function '):
+        return formatted.split()[1]
+    return formatted
+
+
+# state of a worker process, set by _init_worker
+_worker_state = dict()
+
+
+def _init_worker(data, config, intra_op_threads, inter_op_threads, seed):
+    """Initialize a worker process.
+
+    Args:
+        data -- a dictionary with the training and validation data
+        config -- configuration parameters of the parent process (incl. the data shape)
+        intra_op_threads -- threads per operation
+        inter_op_threads -- operations executed in parallel
+        seed -- random seed of the weights of each trial (None = not fixed)
+    """
+    import params
+
+    params.config.update(config)
+
+    # the workers must not write into the same checkpoint and TensorBoard directories
+    params.config['use_checkpoint'] = False
+    params.config['use_tensorboard'] = False
+    params.config['verbose_training'] = 0
+
+    _worker_state['data'] = data
+    _worker_state['intra_op_threads'] = intra_op_threads
+    _worker_state['inter_op_threads'] = inter_op_threads
+    _worker_state['seed'] = seed
+
+
+def _new_session():
+    """Start a new Keras session with the pinned number of threads and the seed of the worker."""
+    import keras
+    import tensorflow as tf
+
+    keras.backend.clear_session()
+    if _worker_state['seed'] is not None:  # same initial weights for each trial
+        np.random.seed(_worker_state['seed'])
+        tf.set_random_seed(_worker_state['seed'])
+    keras.backend.set_session(tf.Session(config=tf.ConfigProto(
+        intra_op_parallelism_threads=_worker_state['intra_op_threads'],
+        inter_op_parallelism_threads=_worker_state['inter_op_threads'])))
+
+
+def _run_trial(hparams):
+    """Train a trial in a worker process.
+
+    Args:
+        hparams -- hyperparameter dictionary
+    Return:
+        result -- dictionary with the metrics of the last epoch, the hyperparameters and the time
+                  of the trial
+    """
+    import ml_models
+
+    start_time = time.time()
+    data = _worker_state['data']
+
+    _new_session()
+    out, _ = ml_models.LSTM_model(data['train_X'], data['train_y'], data['val_X'],
+                                  data['val_y'], hparams)
+
+    return _get_result(out.history, hparams, time.time() - start_time)
+
+
+def _run_budgeted_trial(job):
+    """Train a trial up to its epoch budget in a worker process (see successive_halving).
+
+    The model is saved after the training, so that the training can be continued in the next
+    round by any worker.
+
+    Args:
+        job -- tuple (index of the trial, hyperparameter dictionary with the epoch budget as
+               num_epochs, number of epochs already trained, path of the saved model)
+    Return:
+        idx -- index of the trial
+        result -- dictionary with the metrics of the last epoch, the hyperparameters, the time of
+                  this round and whether the training was stopped early
+    """
+    import keras
+    import ml_models
+
+    idx, hparams, initial_epoch, model_path = job
+    start_time = time.time()
+    data = _worker_state['data']
+
+    _new_session()
+    model = keras.models.load_model(model_path) if initial_epoch > 0 else None
+    out, model = ml_models.LSTM_model(data['train_X'], data['train_y'], data['val_X'],
+                                      data['val_y'], hparams, model=model,
+                                      initial_epoch=initial_epoch)
+    model.save(model_path)
+
+    result = _get_result(out.history, hparams, time.time() - start_time)
+    result['round_epochs'] += initial_epoch
+    result['stopped'] = result['round_epochs'] < hparams['num_epochs']  # EarlyStopping
+    return idx, result
+
+
+def _get_result(history, hparams, elapsed_time):
+    """Get the result of a trial from the training history.
+
+    Args:
+        history -- dictionary with the metrics of each epoch (History.history of Keras)
+        hparams -- hyperparameter dictionary
+        elapsed_time -- time of the trial
+    Return:
+        result -- dictionary with the metrics of the last epoch, the hyperparameters and the time
+    """
+    result = dict(hparams)
+    result['round_epochs'] = len(history['val_acc'])
+    for metric in ['val_loss', 'val_acc', 'loss', 'acc']:
+        result[metric] = float(history[metric][-1])
+    result['lr'] = float(history['lr'][-1]) if 'lr' in history else ''
+    result['time'] = elapsed_time
+    return result
@@ -0,0 +1,558 @@
+"""Module for the online schedulability inference with the trained Keras model.
+
+A SchedulabilityPredictor loads the model and the fitted feature pipeline once and classifies
+task-sets given as task ID lists (looked up in the table Task) or as raw task attributes (rows like
+the ones of the table Task). A MicroBatcher coalesces concurrent requests into one batch for the
+model: a batch is predicted as soon as max_batch_size task-sets are waiting or the oldest request
+has waited max_latency seconds. The latency of the requests (p50, p99) and the throughput are
+recorded by LatencyStats.
+
+The predictor can be served over HTTP (TCP or Unix socket) with serve():
+    POST /predict  {"tasksets": [[task ID, ...], ...]} or
+                   {"task_attributes": [[[Task_ID, Priority, ...], ...], ...]}
+                -> {"probabilities": [...], "schedulable": [...]}
+    GET /stats  -> {"num_requests": ..., "num_tasksets": ..., "p50": ..., "p99": ..., ...}
+This way the RNN can be used as online admission test.
+"""
+
+import collections
+import concurrent.futures
+import http.server
+import json
+import logging
+import os
+import queue
+import socket
+import socketserver
+import threading
+import time
+
+import keras
+import numpy as np
+import tensorflow as tf
+
+import database_interface
+import logging_config
+import ml_models  # registers the custom layers for loading the model
+import params
+import preprocessing
+
+# threshold of the sigmoid output above which a task-set is classified as schedulable
+DECISION_THRESHOLD = 0.5
+
+
+class SchedulabilityPredictor:
+    """Resident predictor of the schedulability of task-sets.
+
+    The Keras model and the fitted FeaturePipeline are loaded only once. If a Database-object is
+    given, the table Task is read once, so that task-sets can be given as lists of task IDs.
+    """
+
+    def __init__(self, model_path, pipeline_path, database=None, time_steps=None):
+        """Constructor of class SchedulabilityPredictor.
+
+        Args:
+            model_path -- path to the saved Keras model (e.g. weights.best.hdf5)
+            pipeline_path -- path to the saved FeaturePipeline (config['feature_pipeline_path'])
+            database -- a Database-object to look up task IDs, default: only raw task attributes
+            time_steps -- number of time steps of the model input, default: input shape of the
+                          model or config['time_steps'] if the model has a variable length
+        """
+        logger = logging.getLogger('RNN-SA.inference.SchedulabilityPredictor')
+
+        self.pipeline = preprocessing.FeaturePipeline.load(pipeline_path)
+
+        # load model, the predict function is created now because it is used on another thread
+        self.model = keras.models.load_model(model_path)
+        self.model._make_predict_function()
+        self._graph = tf.get_default_graph()
+
+        self.time_steps = time_steps or self.model.input_shape[1] or params.config['time_steps']
+
+        # the tasks are sorted according to their priorities like the task-sets of the training data
+        id_idx = self.pipeline.default_features.index('Task_ID')  # column of the task ID
+        self._priority_idx = self.pipeline.default_features.index('Priority')
+
+        # task attributes of the table Task for task-sets given as task IDs
+        self.task_attributes = None
+        self._task_priorities = None  # dictionary: task ID -> priority
+        if database is not None:
+            self.task_attributes = database.read_table_task(convert_to_task_dict=False)
+            self._task_priorities = {row[id_idx]: row[self._priority_idx]
+                                     for row in self.task_attributes}
+
+        logger.info("Loaded model %s and %s", model_path, self.pipeline)
+
+    def transform_task_ids(self, task_ids):
+        """Transform task-sets given as task IDs to the input tensor of the model.
+
+        The tasks of each task-set are sorted according to increasing priorities (column Priority
+        of the table Task), so the order of the task IDs doesn't matter.
+
+        Args:
+            task_ids -- list with the task IDs of each task-set (at most time_steps tasks per
+                        task-set, Task_ID = -1 marks an empty slot)
+        Return:
+            x -- float32 numpy array with the task-sets [num_tasksets X time_steps X
+                 num_features]
+        """
+        if self.task_attributes is None:
+            raise ValueError("task IDs can't be looked up without a database")
+
+        task_ids = _pad_rows(task_ids, self.time_steps, -1)
+        try:
+            priorities = np.array([[self._task_priorities[task_id] if task_id != -1 else 0
+                                    for task_id in row] for row in task_ids.tolist()],
+                                  dtype=np.float64).reshape(task_ids.shape)
+        except KeyError:
+            raise ValueError("task-set contains a task that is not in the table Task")
+
+        return self.pipeline.transform_tasksets(_sort_by_priority(task_ids, priorities),
+                                                self.task_attributes, self.time_steps)
+
+    def transform_task_attributes(self, tasksets):
+        """Transform task-sets given as raw task attributes to the input tensor of the model.
+
+        The tasks of each task-set are sorted according to increasing priorities (column Priority),
+        so the order of the tasks doesn't matter.
+
+        Args:
+            tasksets -- list with the task attributes of each task-set, a task is a row like the
+                        rows of the table Task (columns preprocessing.DEFAULT_FEATURES)
+        Return:
+            x -- float32 numpy array with the task-sets [num_tasksets X time_steps X
+                 num_features]
+        """
+        # stable sorting keeps the order of tasks with the same priority (like Taskset)
+        tasksets = [sorted(taskset, key=lambda task: task[self._priority_idx])
+                    for taskset in tasksets]
+        rows = [task for taskset in tasksets for task in taskset]
+        lengths = [len(taskset) for taskset in tasksets]
+        if max(lengths, default=0) > self.time_steps:
+            raise ValueError("task-set has more than %d tasks" % (self.time_steps,))
+
+        # the tasks are numbered consecutively, so that equal task IDs of different requests
+        # can't be mixed up
+        task_ids = np.full((len(tasksets), self.time_steps), -1, dtype=np.int64)
+        row = 0
+        for i, length in enumerate(lengths):
+            task_ids[i, :length] = np.arange(row, row + length)
+            row += length
+
+        features = self.pipeline.transform(rows) if rows else np.zeros(
+            (0, len(self.pipeline.feature_names)), dtype=np.float32)
+        return preprocessing.build_taskset_tensor(task_ids, np.arange(len(rows)), features,
+                                                  self.time_steps)
+
+    def predict_proba(self, x, batch_size=None):
+        """Predict the probability that task-sets are schedulable.
+
+        Args:
+            x -- numpy array with the task-sets [num_tasksets X time_steps X num_features]
+            batch_size -- number of task-sets per forward pass, default: all task-sets at once
+        Return:
+            probabilities -- numpy array with the sigmoid outputs [num_tasksets]
+        """
+        if len(x) == 0:
+            return np.zeros(0, dtype=np.float32)
+
+        with self._graph.as_default():
+            return self.model.predict(x, batch_size=batch_size or len(x)).reshape(-1)
+
+    def predict(self, x, batch_size=None):
+        """Predict whether task-sets are schedulable.
+
+        Args:
+            x -- numpy array with the task-sets [num_tasksets X time_steps X num_features]
+            batch_size -- number of task-sets per forward pass, default: all task-sets at once
+        Return:
+            labels -- numpy array with 1 (schedulable) or 0 (not schedulable) [num_tasksets]
+        """
+        return (self.predict_proba(x, batch_size) > DECISION_THRESHOLD).astype(np.int32)
+
+
+class LatencyStats:
+    """Statistics of the latency and throughput of the requests.
+
+    The latencies of the last window requests are kept for the percentiles. The throughput is the
+    number of task-sets per second since the statistics were reset.
+    """
+
+    def __init__(self, window=10000):
+        """Constructor of class LatencyStats.
+
+        Args:
+            window -- number of latest requests used for the percentiles
+        """
+        self._latencies = collections.deque(maxlen=window)
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        """Reset the statistics."""
+        with self._lock:
+            self._latencies.clear()
+            self._start_time = time.time()
+            self.num_requests = 0  # number of answered requests
+            self.num_tasksets = 0  # number of classified task-sets
+            self.num_batches = 0  # number of batches predicted by the model
+
+    def add_batch(self, latencies, num_tasksets):
+        """Add the requests of a predicted batch.
+
+        Args:
+            latencies -- list with the latency of each request of the batch (in seconds)
+            num_tasksets -- number of task-sets of the batch
+        """
+        with self._lock:
+            self._latencies.extend(latencies)
+            self.num_requests += len(latencies)
+            self.num_tasksets += num_tasksets
+            self.num_batches += 1
+
+    def summary(self):
+        """Get a summary of the statistics.
+
+        Return:
+            summary -- dictionary with the number of requests, task-sets and batches, the mean
+                       batch size, the latency percentiles p50 and p99 (in seconds) and the
+                       throughput (task-sets per second)
+        """
+        with self._lock:
+            latencies = np.asarray(self._latencies, dtype=np.float64)
+            elapsed = time.time() - self._start_time
+            p50, p99 = np.percentile(latencies, [50, 99]) if len(latencies) else (0.0, 0.0)
+
+            return {
+                'num_requests': self.num_requests,
+                'num_tasksets': self.num_tasksets,
+                'num_batches': self.num_batches,
+                'mean_batch_size': self.num_tasksets / self.num_batches if self.num_batches else
+                0.0,
+                'p50': float(p50),
+                'p99': float(p99),
+                'throughput': self.num_tasksets / elapsed if elapsed > 0 else 0.0,
+            }
+
+
+class MicroBatcher:
+    """Coalescing of concurrent requests into micro-batches.
+
+    Requests are put into a queue and predicted on one worker thread. The worker takes the oldest
+    request and adds further requests until max_batch_size task-sets are collected or the oldest
+    request has waited max_latency seconds. The result of each request is returned by a Future.
+
+        with MicroBatcher(predictor) as batcher:
+            probabilities = batcher.submit(x).result()
+    """
+
+    def __init__(self, predictor, max_batch_size=1024, max_latency=0.005, stats=None):
+        """Constructor of class MicroBatcher.
+
+        Args:
+            predictor -- the SchedulabilityPredictor-object
+            max_batch_size -- maximum number of task-sets per batch (a bigger request is predicted
+                              as one batch)
+            max_latency -- maximum time (in seconds) a request waits for further requests
+            stats -- a LatencyStats-object, default: new LatencyStats-object
+        """
+        if max_batch_size < 1:
+            raise ValueError("max_batch_size must be at least 1")
+        if max_latency < 0:
+            raise ValueError("max_latency must not be negative")
+
+        self.predictor = predictor
+        self.max_batch_size = max_batch_size
+        self.max_latency = max_latency
+        self.stats = stats or LatencyStats()
+
+        self._queue = queue.Queue()
+        self._worker = None  # worker thread
+        self._accepting = False  # whether requests are accepted (False after stop())
+        self._state_lock = threading.Lock()  # lock for starting, stopping and submitting
+
+    def __enter__(self):
+        """Start the worker thread."""
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        """Stop the worker thread."""
+        self.stop()
+
+    def start(self):
+        """Start the worker thread."""
+        with self._state_lock:
+            if self._worker is None:
+                self._worker = threading.Thread(target=self._run, name='MicroBatcher',
+                                                daemon=True)
+                self._worker.start()
+                self._accepting = True
+
+    def stop(self):
+        """Stop the worker thread after all waiting requests are predicted.
+
+        Requests submitted after stop() was called are rejected, so every accepted request is in
+        the queue before the stop signal.
+        """
+        with self._state_lock:
+            worker = self._worker
+            if worker is None or not self._accepting:  # not started or already stopping
+                return
+            self._accepting = False
+            self._queue.put(None)
+
+        worker.join()
+        with self._state_lock:
+            self._worker = None
+
+    def submit(self, x):
+        """Submit a request.
+
+        Args:
+            x -- numpy array with the task-sets [num_tasksets X time_steps X num_features]
+        Return:
+            future -- a concurrent.futures.Future with the sigmoid outputs [num_tasksets]
+        """
+        x = np.asarray(x, dtype=np.float32)
+        future = concurrent.futures.Future()
+        with self._state_lock:
+            if not self._accepting:
+                raise RuntimeError("MicroBatcher is not started or stopped")
+            self._queue.put((time.time(), x, future))
+        return future
+
+    def _run(self):
+        """Collect and predict batches until stop() is called."""
+        logger = logging.getLogger('RNN-SA.inference.MicroBatcher._run')
+        pending = None  # request that didn't fit into the last batch
+        stopped = False
+
+        while not stopped:
+            request = pending if pending is not None else self._queue.get()
+            pending = None
+            if request is None:  # stop
+                break
+
+            # collect requests until the batch is full or the latency budget is used up
+            batch = [request]
+            num_tasksets = len(request[1])
+            deadline = request[0] + self.max_latency
+            while num_tasksets < self.max_batch_size:
+                timeout = deadline - time.time()
+                try:
+                    request = self._queue.get(timeout=timeout) if timeout > 0 else \
+                        self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                if request is None:  # stop after this batch
+                    stopped = True
+                    break
+                if num_tasksets + len(request[1]) > self.max_batch_size:
+                    pending = request  # first request of the next batch
+                    break
+                batch.append(request)
+                num_tasksets += len(request[1])
+
+            self._predict_batch(batch, num_tasksets, logger)
+
+    def _predict_batch(self, batch, num_tasksets, logger):
+        """Predict a batch and set the results of its requests.
+
+        Args:
+            batch -- list with the requests (submit time, task-sets, future)
+            num_tasksets -- number of task-sets of the batch
+            logger -- logger for errors
+        """
+        try:
+            probabilities = self.predictor.predict_proba(
+                np.concatenate([x for _, x, _ in batch]))
+        except Exception as exc:
+            logger.error("Prediction error: %s", exc)
+            for _, _, future in batch:
+                future.set_exception(exc)
+            return
+
+        end_time = time.time()
+        start = 0
+        for _, x, future in batch:
+            future.set_result(probabilities[start:start + len(x)])
+            start += len(x)
+
+        self.stats.add_batch([end_time - submit_time for submit_time, _, _ in batch],
+                             num_tasksets)
+
+
+class _RequestHandler(http.server.BaseHTTPRequestHandler):
+    """Handler of the HTTP requests of the inference server."""
+
+    def do_GET(self):
+        """Answer GET /stats with the latency statistics."""
+        if self.path != '/stats':
+            self._send_json(404, {'error': 'unknown path %s' % (self.path,)})
+            return
+
+        self._send_json(200, self.server.batcher.stats.summary())
+
+    def do_POST(self):
+        """Answer POST /predict with the predictions of the task-sets."""
+        if self.path != '/predict':
+            self._send_json(404, {'error': 'unknown path %s' % (self.path,)})
+            return
+
+        try:
+            body = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))))
+            predictor = self.server.batcher.predictor
+            if 'tasksets' in body:
+                x = predictor.transform_task_ids(body['tasksets'])
+            elif 'task_attributes' in body:
+                x = predictor.transform_task_attributes(body['task_attributes'])
+            else:
+                raise ValueError("request must contain 'tasksets' or 'task_attributes'")
+        except (ValueError, TypeError) as err:
+            self._send_json(400, {'error': str(err)})
+            return
+
+        try:
+            probabilities = self.server.batcher.submit(x).result()
+        except Exception as exc:
+            self._send_json(500, {'error': str(exc)})
+            return
+
+        self._send_json(200, {
+            'probabilities': probabilities.tolist(),
+            'schedulable': (probabilities > DECISION_THRESHOLD).astype(int).tolist(),
+        })
+
+    def log_message(self, format, *args):
+        """Log the requests with the logger of the project instead of stderr."""
+        logging.getLogger('RNN-SA.inference.server').debug(format, *args)
+
+    def _send_json(self, status, content):
+        """Send a JSON response.
+
+        Args:
+            status -- HTTP status code
+            content -- content of the response (serializable to JSON)
+        """
+        response = json.dumps(content).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(response)))
+        self.end_headers()
+        self.wfile.write(response)
+
+
+class _ThreadingHTTPServer(socketserver.ThreadingMixIn, http.server.HTTPServer):
+    """HTTP server with one thread per connection."""
+
+    daemon_threads = True
+
+
+class _ThreadingUnixHTTPServer(_ThreadingHTTPServer):
+    """HTTP server on a Unix socket with one thread per connection."""
+
+    address_family = socket.AF_UNIX
+
+    def server_bind(self):
+        """Bind the Unix socket (HTTPServer.server_bind expects a host and port)."""
+        socketserver.TCPServer.server_bind(self)
+        self.server_name, self.server_port = 'localhost', 0
+
+    def get_request(self):
+        """Accept a request, Unix sockets have no client address."""
+        request, _ = self.socket.accept()
+        return request, ('localhost', 0)
+
+
+def create_server(batcher, host='127.0.0.1', port=8000, unix_socket=None):
+    """Create the HTTP server of the inference.
+
+    Args:
+        batcher -- the started MicroBatcher-object
+        host -- host of the TCP socket
+        port -- port of the TCP socket
+        unix_socket -- path of a Unix socket, if given it is used instead of the TCP socket
+    Return:
+        server -- the HTTP server, serve_forever() answers the requests
+    """
+    if unix_socket is not None:
+        if os.path.exists(unix_socket):
+            os.remove(unix_socket)
+        server = _ThreadingUnixHTTPServer(unix_socket, _RequestHandler)
+    else:
+        server = _ThreadingHTTPServer((host, port), _RequestHandler)
+
+    server.batcher = batcher
+    return server
+
+
+def serve(predictor, config):
+    """Serve the predictor over HTTP until the server is interrupted.
+
+    Args:
+        predictor -- the SchedulabilityPredictor-object
+        config -- configuration dictionary
+    """
+    logger = logging.getLogger('RNN-SA.inference.serve')
+
+    with MicroBatcher(predictor, config['inference_max_batch_size'],
+                      config['inference_max_latency']) as batcher:
+        server = create_server(batcher, config['inference_host'], config['inference_port'],
+                               config['inference_socket'])
+        logger.info("Serving predictions on %s", config['inference_socket'] or "%s:%d" % (
+            config['inference_host'], config['inference_port']))
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server_close()
+            logger.info("Statistics: %s", batcher.stats.summary())
+
+
+def _sort_by_priority(task_ids, priorities):
+    """Sort the tasks of each task-set according to increasing priorities.
+
+    Tasks with the same priority keep their order, empty slots (Task_ID = -1) are moved to the end.
+
+    Args:
+        task_ids -- int64 numpy array with the task IDs [num_tasksets X time_steps]
+        priorities -- numpy array with the priorities of the tasks [num_tasksets X time_steps]
+    Return:
+        task_ids -- numpy array with the sorted task IDs
+    """
+    sort_key = np.where(task_ids != -1, priorities, np.inf)
+    order = np.argsort(sort_key, axis=1, kind='mergesort')
+    return np.take_along_axis(task_ids, order, axis=1)
+
+
+def _pad_rows(rows, length, value):
+    """Pad the rows of a ragged list to the same length.
+
+    Args:
+        rows -- list of lists with at most length values
+        length -- length of the padded rows
+        value -- padding value
+    Return:
+        padded -- int64 numpy array [num_rows X length]
+    """
+    padded = np.full((len(rows), length), value, dtype=np.int64)
+    for i, row in enumerate(rows):
+        if len(row) > length:
+            raise ValueError("task-set has more than %d tasks" % (length,))
+        padded[i, :len(row)] = row
+    return padded
+
+
+if __name__ == "__main__":
+    # determine database directory and name
+    db_dir, db_name = os.getcwd(), "panda_v3.db"
+
+    # create and initialize logger
+    logging_config.init_logging(db_dir, db_name)
+
+    # load the model once and serve it
+    serve(SchedulabilityPredictor(params.config['model_path'],
+                                  params.config['feature_pipeline_path'],
+                                  database_interface.Database(db_dir, db_name)), params.config)
@@ -9,7 +9,6 @@ import time
 
 random.seed(4)  # fix random seed for reproducibility
 
-import keras
 import os
 # this lines are needed for systems without the python3-tk package to avoid the following errors:
 # ModuleNotFoundError: No module named '_tkinter'
@@ -25,27 +24,18 @@ import numpy as np
 import sklearn
 import talos
 
+import data_cache
+import data_stream
 import database_interface
+import hyperparameter_search
 import logging_config
 import ml_models
 import params
-import os
-
-# default indices of all task attributes (column indices of 'Task')
-DEFAULT_FEATURES = ['Task_ID', 'Priority', 'Deadline', 'Quota', 'CAPS', 'PKG', 'Arg', 'CORES',
-                    'COREOFFSET',
-                    'CRITICALTIME', 'Period', 'Number_of_Jobs', 'OFFSET']
+import preprocessing
 
-# task attributes that should be used for classifying task-sets
-USE_FEATURES = ['Priority', 'PKG', 'Arg', 'CRITICALTIME', 'Period', 'Number_of_Jobs']
-
-# one hot encoding of task attribute PKG
-PKG_ENCODING = {
-    'cond_mod': [1, 0, 0, 0],
-    'hey': [0, 1, 0, 0],
-    'pi': [0, 0, 1, 0],
-    'tumatmul': [0, 0, 0, 1]
-}
+# random seeds for shuffling the task-sets and splitting them into train, validation and test data
+SHUFFLE_SEED = 4
+SPLIT_SEED = 42
 
 
 def main():
@@ -56,8 +46,11 @@ def main():
     # create and initialize logger
     logger = logging_config.init_logging(db_dir, db_name)
 
-    # load the data
-    data = load_data(db_dir, db_name)
+    # load the data (or prepare streaming it from the database)
+    if params.config['data_feeding'] == 'stream':
+        data = load_data_stream(db_dir, db_name, params.hparams['batch_size'])
+    else:
+        data = load_data(db_dir, db_name)
 
     ##############################################
     ### HYPERPARAMETER OPTIMIZATION WITH TALOS ###
@@ -65,6 +58,15 @@ def main():
     # hyperparameter exploration
     #hyperparameter_exploration(data=data, name='test', num='1')
 
+    # hyperparameter exploration with several worker processes
+    #parallel_hyperparameter_exploration(data=data, name='test', num='1')
+
+    # hyperparameter exploration with successive halving (only the best trials are fully trained)
+    #budgeted_hyperparameter_exploration(data=data, name='test', num='1')
+
+    # model-based hyperparameter exploration (trials proposed by a TPE)
+    #model_based_hyperparameter_exploration(data=data, name='test', num='1')
+
     ##########################
     ### SINGLE KERAS MODEL ###
     ##########################
@@ -82,6 +84,8 @@ def hyperparameter_exploration(data, name, num):
         name -- name of the experiment
         num -- number of the experiment
     """
+    _check_data_in_memory(data)
+
     logger = logging.getLogger('RNN-SA.main.hyperparameter_exploration')
     logger.info("Doing hyperparameter exploration...")
     start_time = time.time()
@@ -104,6 +108,83 @@ def hyperparameter_exploration(data, name, num):
     logger.info("Time elapsed: %f s \n", end_time - start_time)
 
 
+def parallel_hyperparameter_exploration(data, name, num):
+    """Hyperparameter exploration with several worker processes.
+
+    This function explores the same hyperparameter combinations as hyperparameter_exploration(),
+    but params.config['search_workers'] combinations are trained at once. The results are written
+    to the same csv-file as by TALOS. An interrupted exploration is resumed.
+
+    Args:
+        data -- a dictionary with the training, testing and validation data
+        name -- name of the experiment
+        num -- number of the experiment
+    """
+    _check_data_in_memory(data)
+
+    logger = logging.getLogger('RNN-SA.main.parallel_hyperparameter_exploration')
+    logger.info("Doing parallel hyperparameter exploration...")
+    start_time = time.time()
+
+    hyperparameter_search.parallel_search(data, params.hparams_talos, name + '_' + num + '.csv')
+
+    end_time = time.time()
+    logger.info("Finished hyperparameter exploration!")
+    logger.info("Time elapsed: %f s \n", end_time - start_time)
+
+
+def budgeted_hyperparameter_exploration(data, name, num):
+    """Hyperparameter exploration with successive halving.
+
+    This function explores the same hyperparameter combinations as hyperparameter_exploration(),
+    but all combinations are trained only for params.config['halving_min_epochs'] epochs at first.
+    Only the best combinations are trained further (see hyperparameter_search.successive_halving).
+
+    Args:
+        data -- a dictionary with the training, testing and validation data
+        name -- name of the experiment
+        num -- number of the experiment
+    """
+    _check_data_in_memory(data)
+
+    logger = logging.getLogger('RNN-SA.main.budgeted_hyperparameter_exploration')
+    logger.info("Doing hyperparameter exploration with successive halving...")
+    start_time = time.time()
+
+    hyperparameter_search.successive_halving(data, params.hparams_talos,
+                                             name + '_' + num + '.csv')
+
+    end_time = time.time()
+    logger.info("Finished hyperparameter exploration!")
+    logger.info("Time elapsed: %f s \n", end_time - start_time)
+
+
+def model_based_hyperparameter_exploration(data, name, num):
+    """Model-based hyperparameter exploration.
+
+    This function explores the search space params.hparams_tpe. The next hyperparameter
+    combinations are proposed by a TPE fitted on the finished combinations (see
+    hyperparameter_search.model_based_search). The results are written to the same csv-file as by
+    TALOS, an existing csv-file is used to continue the exploration.
+
+    Args:
+        data -- a dictionary with the training, testing and validation data
+        name -- name of the experiment
+        num -- number of the experiment
+    """
+    _check_data_in_memory(data)
+
+    logger = logging.getLogger('RNN-SA.main.model_based_hyperparameter_exploration')
+    logger.info("Doing model-based hyperparameter exploration...")
+    start_time = time.time()
+
+    hyperparameter_search.model_based_search(data, params.hparams_tpe, name + '_' + num + '.csv')
+
+    end_time = time.time()
+    logger.info("Finished hyperparameter exploration!")
+    logger.info("Time elapsed: %f s \n", end_time - start_time)
+
+
 def train_and_evaluate(data):
     """Build, train and evaluate a Keras model.
 
@@ -111,15 +192,21 @@ def train_and_evaluate(data):
     defined by the params.hparams dictionary.
 
     Args:
-        data -- a dictionary with the training, testing and validation data
+        data -- a dictionary with the training, testing and validation data (arrays of
+                load_data() or sequences of load_data_stream())
     """
     logger = logging.getLogger('RNN-SA.main.train_and_evaluate')
     logger.info("Training the Keras model...")
     start_time = time.time()
 
+    streaming = 'train_X' not in data  # data is streamed from the database
+
     # build, compile and train the Keras LSTM model
-    out, model = ml_models.LSTM_model(data['train_X'], data['train_y'], data['val_X'],
-                                      data['val_y'], params.hparams)
+    if streaming:
+        out, model = ml_models.LSTM_model_generator(data['train'], data['val'], params.hparams)
+    else:
+        out, model = ml_models.LSTM_model(data['train_X'], data['train_y'], data['val_X'],
+                                          data['val_y'], params.hparams)
 
     end_time = time.time()
     logger.info("Finished training!")
@@ -128,9 +215,24 @@ def train_and_evaluate(data):
     logger.info("Evaluating performance of the Keras model...")
     start_time = time.time()
 
+    # test data as sequence: streamed or bucketed by the number of tasks
+    if streaming:
+        test_sequence = data['test']
+    elif ml_models.get_input_mode(params.hparams) == 'bucketing':
+        test_sequence = data_stream.BucketSequence(data['test_X'], data['test_y'],
+                                                   params.hparams['batch_size'], shuffle=False)
+    else:
+        test_sequence = None
+
     # evaluate performance of Keras model
-    loss, accuracy = model.evaluate(data['test_X'], data['test_y'], batch_size=params.hparams[
-        'batch_size'], verbose=params.config['verbose_eval'])
+    if test_sequence is not None:
+        loss, accuracy = model.evaluate_generator(
+            test_sequence, steps=len(test_sequence),
+            max_queue_size=params.config['max_queue_size'], workers=params.config['workers'],
+            use_multiprocessing=False, verbose=params.config['verbose_eval'])
+    else:
+        loss, accuracy = model.evaluate(data['test_X'], data['test_y'], batch_size=params.hparams[
+            'batch_size'], verbose=params.config['verbose_eval'])
     end_time = time.time()
     logger.info("Finished evaluation!")
     logger.info("Time elapsed: %f s", end_time - start_time)
@@ -140,6 +242,10 @@ def train_and_evaluate(data):
 def load_data(db_dir, db_name):
     """Load the data from the database.
 
+    If enabled by params.config['use_data_cache'], the pre-processed data is cached on disk. As
+    long as the database and the pre-processing settings don't change, the data is loaded
+    (memory-mapped) from the cache instead of the database.
+
     Args:
         db_dir -- directory of the database
         db_name -- name of the database
@@ -157,39 +263,47 @@ def load_data(db_dir, db_name):
         logger.error('Could not create Database-object: %s', val_err)
         return None
 
+    # try to load the data from the cache
+    use_cache = params.config['use_data_cache']
+    if use_cache:
+        cache_key = data_cache.get_cache_key(my_database, _get_preprocessing_settings())
+        data = data_cache.load(params.config['data_cache_dir'], db_name, cache_key)
+        pipeline = None if data is None else data_cache.load_pipeline(
+            params.config['data_cache_dir'], db_name, cache_key)
+        if pipeline is not None:  # data is cached
+            # the feature pipeline of the cached data is needed for inference
+            _save_feature_pipeline(pipeline)
+
+            # save data shape to configuration parameters
+            params.config['time_steps'] = data['train_X'].shape[1]
+            params.config['element_size'] = data['train_X'].shape[2]
+
+            end_time = time.time()
+            logger.info("Successfully loaded %d samples for training, %d samples for evaluation "
+                        "and %d samples for testing from the cache!", len(data['train_y']),
+                        len(data['val_y']), len(data['test_y']))
+            logger.info("Time elapsed: %f s \n", end_time - start_time)
+            return data
+
     # read table 'CorrectTaskSet'
     rows = my_database.read_table_correcttaskset()
-    random.shuffle(rows)  # shuffle rows
+    random.Random(SHUFFLE_SEED).shuffle(rows)  # shuffle rows
+    rows = np.asarray(rows, dtype=np.int64).reshape(len(rows), -1)
 
-    # split task-sets into task-set IDs, the task-sets (tuples of task IDs) and labels
-    tasksets, labels = _split_tasksets(rows)
+    # split task-sets into the task IDs [num_tasksets X 4] and the labels
+    task_ids = rows[:, 2:]
+    labels_np = rows[:, 1].astype(np.int32)
 
     # read table 'Task'
     task_attributes = my_database.read_table_task(convert_to_task_dict=False)
 
-    # preprocess task attributes: delete unuseful parameters, scale data to 0 mean, unit variance
-    task_attributes = _preprocess_tasks_attributes(task_attributes)
-
-    # replace task IDs with the corresponding task attributes
-    for i, taskset in enumerate(tasksets):  # iterate over all task-sets
-        taskset = list(taskset)  # convert tuple to list
+    # preprocess task attributes: select used features, one hot encoding, scaling; the fitted
+    # pipeline is saved next to the model to transform new task-sets for inference
+    pipeline = preprocessing.FeaturePipeline().fit(task_attributes)
+    _save_feature_pipeline(pipeline)
 
-        # delete all tasks with Task_ID = -1
-        while taskset.count(-1) > 0:
-            taskset.remove(-1)
-
-        # replace Task_ID with the corresponding task attributes
-        for j, task_id in enumerate(taskset):  # iterate over all task IDs
-            taskset[j] = task_attributes[task_id]
-
-        # replace taskset in tasksets
-        tasksets[i] = taskset
-
-    # pad task-sets to uniform length
-    tasksets_np = _pad_sequences(tasksets)
-
-    # convert list of labels to numpy array
-    labels_np = np.asarray(labels, np.int32)
+    # replace task IDs with the corresponding task attributes, pad task-sets to uniform length
+    tasksets_np = pipeline.transform_tasksets(task_ids, task_attributes)
 
     # save data shape to configuration parameters
     params.config['time_steps'] = tasksets_np.shape[1]
@@ -200,12 +314,16 @@ def load_data(db_dir, db_name):
     # split data into training and test/validation: 80% training data, 20% test/validation data
     data['train_X'], test_val_x, data['train_y'], test_val_y = \
         sklearn.model_selection.train_test_split(tasksets_np, labels_np, test_size=0.2,
-                                                 random_state=42)
+                                                 random_state=SPLIT_SEED)
 
     # split test/validation in test and validation data: 50% data each, i.e. 10% of hole dataset
     data['test_X'], data['val_X'], data['test_y'], data['val_y'] = \
         sklearn.model_selection.train_test_split(test_val_x, test_val_y, test_size=0.5,
-                                                 random_state=42)
+                                                 random_state=SPLIT_SEED)
+
+    # save data to the cache
+    if use_cache:
+        data_cache.save(params.config['data_cache_dir'], db_name, cache_key, data, pipeline)
 
     end_time = time.time()
     logger.info("Successfully loaded %d samples for training, %d samples for evaluation and %d "
@@ -216,150 +334,95 @@ def load_data(db_dir, db_name):
     return data
 
 
-def _split_tasksets(rows):
-    """Split task-sets.
+def load_data_stream(db_dir, db_name, batch_size):
+    """Prepare streaming the data from the database.
 
-    This function splits a task-set consisting of [Set_ID, Successful, TASK1_ID, TASK2_ID, ...] into
-    two lists: a list with the tuples of task IDs and a list with the labels.
+    Only the table Task is read and pre-processed. The task-sets are read page by page from the
+    table CorrectTaskSet during training, so that the training can start without loading the hole
+    table. The task-sets are split by Set_ID into training, validation and test data (see
+    data_stream.SPLIT_BUCKETS).
 
     Args:
-        rows -- an array with the rows representing each a task-set
-    Return:
-        task_ids -- list with tuples of the task IDs
-        labels -- list with the labels
-    """
-    task_ids = [x[2:] for x in rows]
-    labels = [x[1] for x in rows]
-    return task_ids, labels
-
-
-def _preprocess_tasks_attributes(task_attributes):
-    """Preprocess the task attributes.
-
-    This function pre-processes the task attributes for machine learning:
-        - unused features are deleted
-        - non-numeric values are one hot encoded
-        - features are normalized.
-
-    Args:
-        task_attributes -- list with the task attributes
+        db_dir -- directory of the database
+        db_name -- name of the database
+        batch_size -- number of task-sets per batch
     Return:
-        task_attributes -- list with the pre-processed task attributes
+        data -- dictionary with the sequences of the train, test and validation data
     """
-    features = DEFAULT_FEATURES  # get default features
-
-    # delete unused features
-    task_attributes, features = _delete_unused_features(task_attributes, features)
-
-    # do one hot encoding for non-numeric values
-    task_attributes, features = _one_hot_encoding(task_attributes, features)
-
-    # normalize values
-    task_attributes = _standardize(task_attributes)
-
-    return task_attributes
-
+    logger = logging.getLogger('RNN-SA.main.load_data_stream')
+    logger.info("Preparing to stream the data from the database...")
+    start_time = time.time()
 
-def _delete_unused_features(task_attributes, features):
-    """Delete unused features.
+    # try to create Database-object
+    try:
+        my_database = database_interface.Database(db_dir=db_dir, db_name=db_name,
+                                                  pool_size=params.config['workers'] + 1)
+    except ValueError as val_err:
+        logger.error('Could not create Database-object: %s', val_err)
+        return None
 
-    This function deletes unused features. The features available are defined by features,
-    the features that should be used are defined through USE_FEATURES.
+    # read and pre-process table 'Task', the fitted pipeline is saved next to the model
+    task_attributes = my_database.read_table_task(convert_to_task_dict=False)
+    pipeline = preprocessing.FeaturePipeline().fit(task_attributes)
+    _save_feature_pipeline(pipeline)
 
-    Args:
-        task_attributes -- list with the task attributes
-        features -- list of the available features
-    Return:
-        task_attributes -- list with the processed task attributes
-        features -- updated list with the available features
-    """
-    # iterate over all default features beginning at the end of the list
-    for idx, name in reversed(list(enumerate(features))):
-        if name not in USE_FEATURES:  # check if feature should be deleted
-            # delete feature
-            task_attributes = [x[:idx] + x[idx + 1:] for x in task_attributes]
+    # create sequences, only the training data is shuffled
+    data = dict()
+    for split in ['train', 'val', 'test']:
+        data[split] = data_stream.TasksetSequence(
+            my_database, pipeline, task_attributes, split, batch_size, shuffle=split == 'train',
+            seed=SHUFFLE_SEED, batches_per_page=params.config['batches_per_page'],
+            cached_pages=params.config['workers'] + 1)
 
-    # update features
-    features = [x for x in features if x in USE_FEATURES]
+    # save data shape to configuration parameters
+    params.config['time_steps'] = data['train'].time_steps
+    params.config['element_size'] = data['train'].element_size
 
-    return task_attributes, features
+    end_time = time.time()
+    logger.info("Streaming %d samples for training, %d samples for evaluation and %d samples for "
+                "testing from the database!", data['train'].num_tasksets,
+                data['val'].num_tasksets, data['test'].num_tasksets)
+    logger.info("Time elapsed: %f s \n", end_time - start_time)
 
+    return data
 
-def _one_hot_encoding(task_attributes, features):
-    """Do one hot encoding.
 
-    This function does one hot encoding for non-numeric features. Currently only the PKG feature
-    is encoded. How this features should be encoded is defined through the dictionary PKG_ENCODING.
+def _get_preprocessing_settings():
+    """Get the settings of the pre-processing (part of the cache key of the data).
 
-    Args:
-        task_attributes -- list with the task attributes
-        features -- list with the available features
     Return:
-        task_attributes -- list with the processed task attributes
-        features -- list with the available features
+        settings -- dictionary with the pre-processing settings
     """
-    idx = features.index('PKG')  # get index of 'PKG'
-
-    # replace PKG with one hot encoded value
-    task_attributes = [x[:idx] + tuple(PKG_ENCODING[x[idx]]) + x[idx + 1:] for x in
-                       task_attributes]
-
-    # update features
-    features = features[:idx] + ['PKG_cond_mod', 'PKG_hey', 'PKG_pi',
-                                 'PKG_tumatmul'] + features[idx + 1:]
-
-    return task_attributes, features
+    settings = preprocessing.FeaturePipeline().get_settings()
+    settings.update({'shuffle_seed': SHUFFLE_SEED, 'split_seed': SPLIT_SEED})
+    return settings
 
 
-def _standardize(task_attributes):
-    """Standardize the task attributes.
-
-    This function standardizes the task attributes,. There are the following possibilities:
-        - standardization: zero-mean and unit-variance
-        - min-max normalization: rescaling to the range [0, 1]
+def _save_feature_pipeline(pipeline):
+    """Save the fitted feature pipeline to params.config['feature_pipeline_path'].
 
     Args:
-        task_attributes -- list with the task attributes
-    Return:
-        task_attributes -- list with the standardized/normalized task attributes
+        pipeline -- the fitted FeaturePipeline-object
     """
-    # min-max normalization
-    normalized = sklearn.preprocessing.MinMaxScaler(feature_range=(0, 1)).fit_transform(
-        task_attributes)
-    task_attributes = [tuple(x) for x in normalized]  # convert numpy array back to list of tuples
-
-    # standardization
-    # standardized = sklearn.preprocessing.StandardScaler().fit_transform(task_attributes)
-    # task_attributes = [tuple(x) for x in standardized]  # convert numpy array back to list of tuples
-
-    return task_attributes
+    try:
+        pipeline.save(params.config['feature_pipeline_path'])
+    except OSError as os_err:
+        logging.getLogger('RNN-SA.main._save_feature_pipeline').error(
+            "Could not save the feature pipeline: %s", os_err)
 
 
-def _pad_sequences(tasksets):
-    """Pad sequences.
+def _check_data_in_memory(data):
+    """Check that the data is loaded into the memory.
 
-    This function pads sequences, i.e. all task-sets have the equal length of tasks.
+    The hyperparameter explorations need the arrays of load_data(), the sequences of
+    load_data_stream() can't be used.
 
     Args:
-        tasksets -- numpy array of the task-sets [num_tasksets X num_tasks]
-    Return:
-        tasksets -- numpy array with the uniform task-sets [num_tasksets X max_num_tasks]
-
+        data -- a dictionary with the training, testing and validation data
     """
-    tasksets = keras.preprocessing.sequence.pad_sequences(
-        sequences=tasksets,  # list of lists, where each element is a sequence
-        maxlen=None,  # Int, maximum length of all sequences (default: None)
-        # Type of the output sequences, to pad sequences with variable length string you can use
-        # object (default: 'int32')
-        dtype=list,
-        # String, 'pre' or 'post': pad either before or after each sequence (default: 'pre')
-        padding='post',
-        # String, 'pre' or 'post': remove values from sequences larger than  maxlen, either at
-        # the beginning or at the end of the sequences (default: 'pre')
-        truncating='pre',
-        value=0.0  # Float or String, padding value (default: 0.0)
-    )
-    return tasksets
+    if params.config['data_feeding'] == 'stream' or 'train_X' not in data:
+        raise ValueError("hyperparameter exploration needs the data in memory, set "
+                         "config['data_feeding'] to 'memory'")
 
 
 if __name__ == "__main__":
@@ -6,13 +6,98 @@ import os
 import keras
 import tensorflow as tf
 
+import data_stream
+
+# input modes of the task-sets
+#   - 'padded': all task-sets are padded to config['time_steps'] tasks
+#   - 'masking': padded task-sets, a Masking layer skips the padded time steps
+#   - 'bucketing': the task-sets are grouped by their number of tasks, each batch contains only
+#                  task-sets with the same number of tasks (no padded time steps)
+INPUT_MODES = ['padded', 'masking', 'bucketing']
+
+# types of the recurrent layers
+#   - 'lstm': generic LSTM layers (implementation=1, one small matrix product per gate)
+#   - 'lstm_fused': LSTM layers with the matrix products of all gates fused into one
+#                   (implementation=2, fewer and larger operations)
+#   - 'lstm_unrolled': fused LSTM layers unrolled over the fixed number of time steps (no
+#                      symbolic loop, needs a fixed number of time steps)
+#   - 'gru': GRU layers (three instead of four gates)
+#   - 'simple_rnn': fully-connected recurrent layers without gates
+CELL_TYPES = ['lstm', 'lstm_fused', 'lstm_unrolled', 'gru', 'simple_rnn']
+
+# types of the model
+#   - 'lstm': stacked recurrent layers over the tasks of a task-set (see CELL_TYPES)
+#   - 'deepsets': permutation-invariant set encoder, a shared MLP per task, pooling over the tasks
+#                 and a small classifier
+MODEL_TYPES = ['lstm', 'deepsets']
+
+# pooling of the task encodings of the set encoder: 'sum', 'max' or 'sum_max' (both concatenated)
+POOLINGS = ['sum', 'max', 'sum_max']
+
+
+class MaskedSetPooling(keras.layers.Layer):
+    """Pooling of the task encodings of a task-set, padded tasks are ignored.
+
+    The layer gets the task encodings [batch_size X time_steps X units] and the input task-sets
+    [batch_size X time_steps X num_features]. A task is padded if all its attributes are 0.
+    """
+
+    def __init__(self, pooling='sum_max', **kwargs):
+        """Constructor of class MaskedSetPooling.
+
+        Args:
+            pooling -- 'sum', 'max' or 'sum_max'
+        """
+        if pooling not in POOLINGS:
+            raise ValueError("unknown pooling %s" % (pooling,))
+        super(MaskedSetPooling, self).__init__(**kwargs)
+        self.pooling = pooling
+
+    def call(self, inputs):
+        """Pool the encodings of the tasks."""
+        encodings, tasksets = inputs
+        backend = keras.backend
+
+        # 1 for a task, 0 for a padded task: [batch_size X time_steps X 1]
+        mask = backend.cast(backend.any(backend.not_equal(tasksets, 0), axis=-1, keepdims=True),
+                            backend.floatx())
+
+        pooled = []
+        if self.pooling in ('sum', 'sum_max'):
+            pooled.append(backend.sum(encodings * mask, axis=1))
+        if self.pooling in ('max', 'sum_max'):
+            # padded tasks get a large negative value, empty task-sets are pooled to 0
+            maximum = backend.max(encodings - (1 - mask) * 1e9, axis=1)
+            pooled.append(maximum * backend.cast(backend.greater(backend.max(mask, axis=1), 0),
+                                                 backend.floatx()))
+
+        return pooled[0] if len(pooled) == 1 else backend.concatenate(pooled, axis=-1)
 
-def LSTM_model(x_train, y_train, x_val, y_val, hparams):
+    def compute_output_shape(self, input_shape):
+        """Get the output shape: [batch_size X units] (2 * units for 'sum_max')."""
+        encoding_shape = input_shape[0]
+        units = encoding_shape[-1] * (2 if self.pooling == 'sum_max' else 1)
+        return encoding_shape[0], units
+
+    def get_config(self):
+        """Get the configuration of the layer (for saving the model)."""
+        config = super(MaskedSetPooling, self).get_config()
+        config['pooling'] = self.pooling
+        return config
+
+
+# the pooling layer is known to keras.models.load_model() as soon as this module is imported
+keras.utils.get_custom_objects()['MaskedSetPooling'] = MaskedSetPooling
+
+
+def LSTM_model(x_train, y_train, x_val, y_val, hparams, model=None, initial_epoch=0):
     """Keras LSTM model.
 
     This method builds, compiles and trains a neural network based on LSTM cells with Keras.
     The structure of this function (arguments and return parameters) must not be changed until Talos
-    is used.
+    is used. If hparams['input_mode'] is 'bucketing', the arrays are fed as BucketSequence. If a
+    model is given, its training is continued from initial_epoch up to hparams['num_epochs'].
+    With hparams['model_type'] = 'deepsets' a set encoder is trained instead of the LSTM layers.
 
     Args:
         x_train -- array with features for training
@@ -20,25 +105,24 @@ def LSTM_model(x_train, y_train, x_val, y_val, hparams):
         x_val -- array with features for validation
         y_val -- list with labels for validation
         hparam -- hyperparameter dictionary
+        model -- compiled Keras model whose training is continued, default: build a new model
+        initial_epoch -- number of epochs the given model is already trained
     Return:
         out -- result of the training
         model -- the Keras model
     """
     from params import config  # import configuration parameters
 
-    # build the Keras model
-    model = _build_LSTM_model(hparams, config)
+    # bucketing: train with batches of task-sets with the same number of tasks
+    if get_input_mode(hparams) == 'bucketing':
+        return LSTM_model_generator(
+            data_stream.BucketSequence(x_train, y_train, hparams['batch_size'], shuffle=True),
+            data_stream.BucketSequence(x_val, y_val, hparams['batch_size'], shuffle=False),
+            hparams, model=model, initial_epoch=initial_epoch)
 
-    # Configure the model for training (create optimizer and loss function)
-    # for binary classification the loss function should be 'binary_crossentropy'
-    model.compile(
-        # String (name of optimizer) or optimizer instance
-        optimizer=hparams['optimizer'],
-        # String (name of objective function) or objective function (default: None)
-        loss='binary_crossentropy',
-        # List of metrics to be evaluated by the model during training and testing; typically
-        # you will use metrics=['accuracy'] (default: None)
-        metrics=['accuracy'])
+    # build and compile the Keras model
+    if model is None:
+        model = build_model(hparams, config)
 
     # train model
     out = model.fit(
@@ -51,6 +135,9 @@ def LSTM_model(x_train, y_train, x_val, y_val, hparams):
         # Integer, number of epochs to train the model; an epoch is an iteration over the entire
         # x and y data provided (default: 1)
         epochs=hparams['num_epochs'],
+        # Integer, epoch at which to start training, useful for resuming a previous training run
+        # (default: 0)
+        initial_epoch=initial_epoch,
         # Integer, 0, 1, or 2; verbosity mode, 0 = silent, 1 = progress bar, 2 = one line per
         # epoch (default: 1)
         verbose=config['verbose_training'],
@@ -71,10 +158,157 @@ def LSTM_model(x_train, y_train, x_val, y_val, hparams):
     return out, model
 
 
+def LSTM_model_generator(train_sequence, val_sequence, hparams, model=None, initial_epoch=0):
+    """Keras LSTM model trained with streamed data.
+
+    This method builds, compiles and trains the same neural network as LSTM_model(), but the
+    training and validation data are given as keras.utils.Sequence (e.g. a
+    data_stream.TasksetSequence or data_stream.BucketSequence) instead of arrays. The batches are
+    prefetched by config['workers'] background threads.
+
+    Args:
+        train_sequence -- sequence with the batches for training
+        val_sequence -- sequence with the batches for validation
+        hparams -- hyperparameter dictionary
+        model -- compiled Keras model whose training is continued, default: build a new model
+        initial_epoch -- number of epochs the given model is already trained
+    Return:
+        out -- result of the training
+        model -- the Keras model
+    """
+    from params import config  # import configuration parameters
+
+    # build and compile the Keras model
+    if model is None:
+        model = build_model(hparams, config)
+
+    # train model
+    out = model.fit_generator(
+        # Sequence with the batches of training data
+        generator=train_sequence,
+        # Integer, number of batches per epoch (default: len(generator))
+        steps_per_epoch=len(train_sequence),
+        # Integer, number of epochs to train the model
+        epochs=hparams['num_epochs'],
+        # Integer, epoch at which to start training
+        initial_epoch=initial_epoch,
+        verbose=config['verbose_training'],
+        # histograms can't be computed for validation data given as sequence
+        callbacks=_init_callbacks(hparams, config, histograms=False),
+        # Sequence with the batches of validation data
+        validation_data=val_sequence,
+        validation_steps=len(val_sequence),
+        # Integer, maximum size of the queue of prefetched batches (default: 10)
+        max_queue_size=config['max_queue_size'],
+        # Integer, number of threads that prefetch the batches (default: 1)
+        workers=config['workers'],
+        # threads instead of processes: the sequence keeps the page of task-sets in memory
+        use_multiprocessing=False,
+        # the sequence shuffles the task-sets itself page by page (reading the batches in random
+        # order would read each page once per batch)
+        shuffle=False,
+    )
+
+    return out, model
+
+
+def build_model(hparams, config):
+    """Build and compile the Keras model.
+
+    Args:
+        hparams -- hyperparameter dictionary
+        config -- configuration dictionary
+    Return:
+        model -- the compiled Keras model
+    """
+    if get_model_type(hparams) == 'deepsets':
+        model = _build_deepsets_model(hparams, config)
+    else:
+        model = _build_LSTM_model(hparams, config)
+    _compile_model(model, hparams)
+
+    return model
+
+
+def get_input_mode(hparams):
+    """Get the input mode of the task-sets.
+
+    Args:
+        hparams -- hyperparameter dictionary
+    Return:
+        input_mode -- one of INPUT_MODES, default: 'padded'
+    """
+    input_mode = hparams.get('input_mode', 'padded')
+    if input_mode not in INPUT_MODES:
+        raise ValueError("unknown input mode %s" % (input_mode,))
+    return input_mode
+
+
+def get_model_type(hparams):
+    """Get the type of the model.
+
+    Args:
+        hparams -- hyperparameter dictionary
+    Return:
+        model_type -- one of MODEL_TYPES, default: 'lstm'
+    """
+    model_type = hparams.get('model_type', 'lstm')
+    if model_type not in MODEL_TYPES:
+        raise ValueError("unknown model type %s" % (model_type,))
+    return model_type
+
+
+def get_cell_type(hparams):
+    """Get the type of the recurrent layers.
+
+    Args:
+        hparams -- hyperparameter dictionary
+    Return:
+        cell_type -- one of CELL_TYPES, default: 'lstm'
+    """
+    cell_type = hparams.get('cell_type', 'lstm')
+    if cell_type not in CELL_TYPES:
+        raise ValueError("unknown cell type %s" % (cell_type,))
+    if cell_type == 'lstm_unrolled' and get_input_mode(hparams) == 'bucketing':
+        raise ValueError("unrolled layers need a fixed number of time steps (no bucketing)")
+    return cell_type
+
+
+def _compile_model(model, hparams):
+    """Configure the model for training (create optimizer and loss function).
+
+    Args:
+        model -- the Keras model
+        hparams -- hyperparameter dictionary
+    """
+    # for binary classification the loss function should be 'binary_crossentropy'
+    model.compile(
+        # String (name of optimizer) or optimizer instance
+        optimizer=hparams['optimizer'],
+        # String (name of objective function) or objective function (default: None)
+        loss='binary_crossentropy',
+        # List of metrics to be evaluated by the model during training and testing; typically
+        # you will use metrics=['accuracy'] (default: None)
+        metrics=['accuracy'])
+
+
 def _build_LSTM_model(hparams, config):
+    input_mode = get_input_mode(hparams)
+    cell_type = get_cell_type(hparams)
+
     # create a Sequential model
     model = keras.models.Sequential()
 
+    # input layer: expected input shape, with bucketing the number of time steps varies from batch
+    # to batch
+    model.add(keras.layers.InputLayer(
+        input_shape=(None if input_mode == 'bucketing' else config['time_steps'],
+                     config['element_size'])))
+
+    # masking: padded time steps (all attributes are 0) are skipped by the LSTM layers
+    if input_mode == 'masking':
+        model.add(keras.layers.Masking(mask_value=0.0))
+
     # create dropout layer: applies Dropout to the input
     # Dropout consists in randomly setting a fraction rate of input units to 0 at each update
     # during training time, which helps prevent overfitting
@@ -84,9 +318,10 @@ def _build_LSTM_model(hparams, config):
             rate=1-hparams['keep_prob'],
         )
 
-    # only one LSTM layer: layer should specify input_shape and return only the last output
+    # only one LSTM layer: layer should return only the last output
     if hparams['num_cells'] == 1:
-        model.add(keras.layers.LSTM(
+        model.add(_create_recurrent_layer(
+            cell_type,
             # positive integer, dimensionality of the output space
             units=hparams['hidden_layer_size'],
             # activation function to use; if you pass None, no activation is applied (ie. "linear"
@@ -95,9 +330,6 @@ def _build_LSTM_model(hparams, config):
             # Boolean, whether to return the last output in the output sequence, or the full
             # sequence
             return_sequences=False,
-            # expected input shape, only the first layer in a Sequential model needs to receive
-            # information about its input shape
-            input_shape=(config['time_steps'], config['element_size'])
         ))
 
         # add dropout layer if necessary
@@ -105,12 +337,12 @@ def _build_LSTM_model(hparams, config):
 
     # more than one LSTM layer
     else:
-        # input LSTM layer: should specify input_shape and return a sequence of outputs
-        model.add(keras.layers.LSTM(
+        # input LSTM layer: should return a sequence of outputs
+        model.add(_create_recurrent_layer(
+            cell_type,
             units=hparams['hidden_layer_size'],
             activation='tanh',
-            return_sequences=True,
-            input_shape=(config['time_steps'], config['element_size'])))
+            return_sequences=True))
 
         # add dropout layer if necessary
         if hparams['keep_prob'] < 1.0: model.add(dropout_layer)
@@ -118,7 +350,8 @@ def _build_LSTM_model(hparams, config):
         # more than two LSTM layers: hidden layers should return a sequence of outputs
         if hparams['num_cells'] > 2:
             for i in range(hparams['num_cells'] - 2):
-                model.add(keras.layers.LSTM(
+                model.add(_create_recurrent_layer(
+                    cell_type,
                     units=hparams['hidden_layer_size'],
                     activation='tanh',
                     return_sequences=True))
@@ -127,7 +360,8 @@ def _build_LSTM_model(hparams, config):
                 if hparams['keep_prob'] < 1.0: model.add(dropout_layer)
 
         # output LSTM layer: should return only the last output
-        model.add(keras.layers.LSTM(
+        model.add(_create_recurrent_layer(
+            cell_type,
             units=hparams['hidden_layer_size'],
             activation='tanh',
             return_sequences=False))
@@ -148,8 +382,74 @@ def _build_LSTM_model(hparams, config):
     return model
 
 
+def _build_deepsets_model(hparams, config):
+    """Build a permutation-invariant set encoder (DeepSets).
+
+    Each task is encoded by the same MLP with hparams['num_cells'] layers of
+    hparams['hidden_layer_size'] neurons (ReLU). The encodings of the tasks of a task-set are pooled
+    (hparams['pooling'], padded tasks are ignored) and classified by a hidden layer and the sigmoid
+    output layer. The order of the tasks doesn't matter, the priority is one of the features.
+
+    Args:
+        hparams -- hyperparameter dictionary
+        config -- configuration dictionary
+    Return:
+        model -- the Keras model (not compiled)
+    """
+    # input layer: with bucketing the number of tasks varies from batch to batch
+    tasksets = keras.layers.Input(
+        shape=(None if get_input_mode(hparams) == 'bucketing' else config['time_steps'],
+               config['element_size']))
+
+    # shared MLP: the same dense layers are applied to each task
+    encodings = tasksets
+    for i in range(hparams['num_cells']):
+        encodings = keras.layers.TimeDistributed(keras.layers.Dense(
+            units=hparams['hidden_layer_size'], activation='relu'))(encodings)
+
+    # pooling over the tasks of each task-set
+    pooled = MaskedSetPooling(pooling=hparams.get('pooling', 'sum_max'))([encodings, tasksets])
+
+    # classifier
+    hidden = keras.layers.Dense(units=hparams['hidden_layer_size'], activation='relu')(pooled)
+    if hparams['keep_prob'] < 1.0:
+        hidden = keras.layers.Dropout(rate=1-hparams['keep_prob'])(hidden)
+    output = keras.layers.Dense(units=config['num_classes'], activation='sigmoid')(hidden)
+
+    return keras.models.Model(inputs=tasksets, outputs=output)
+
 
-def _init_callbacks(params, config):
+def _create_recurrent_layer(cell_type, units, activation, return_sequences):
+    """Create a recurrent layer.
+
+    Args:
+        cell_type -- type of the layer, one of CELL_TYPES
+        units -- dimensionality of the output space
+        activation -- activation function to use
+        return_sequences -- whether to return the full sequence or only the last output
+    Return:
+        layer -- the Keras layer
+    """
+    if cell_type == 'gru':
+        return keras.layers.GRU(units=units, activation=activation,
+                                return_sequences=return_sequences)
+    if cell_type == 'simple_rnn':
+        return keras.layers.SimpleRNN(units=units, activation=activation,
+                                      return_sequences=return_sequences)
+
+    return keras.layers.LSTM(
+        units=units,
+        activation=activation,
+        return_sequences=return_sequences,
+        # implementation mode, 1 = many small matrix products, 2 = batched into fewer, larger
+        # operations (default: 1)
+        implementation=1 if cell_type == 'lstm' else 2,
+        # Boolean, if True the network is unrolled, else a symbolic loop is used; unrolling can
+        # speed-up a RNN for short sequences (default: False)
+        unroll=cell_type == 'lstm_unrolled')
+
+
+def _init_callbacks(params, config, histograms=True):
     """Initialize callbacks.
 
     A callback is a set of functions to be applied at given stages of the training procedure.
@@ -157,6 +457,11 @@ def _init_callbacks(params, config):
     training. A list of callbacks can be passed to the fit() method of the Sequential or Model
     classes. The relevant methods of the callbacks will then be called at each stage of the
     training.
+
+    Args:
+        params -- hyperparameter dictionary
+        config -- configuration dictionary
+        histograms -- whether TensorBoard computes histograms (needs validation data as arrays)
     """
     callbacks = []
 
@@ -217,7 +522,7 @@ def _init_callbacks(params, config):
                 # frequency (in epochs) at which to compute activation and weight histograms for the
                 # layers of the model, if set to 0 histograms won't be computed, validation data
                 # (or split) must be specified for histogram visualizations (default: 0)
-                histogram_freq=1,
+                histogram_freq=1 if histograms else 0,
                 # size of batch of inputs to feed to the network for histograms computation
                 # (default: 32)
                 batch_size=params['batch_size'],
@@ -226,7 +531,7 @@ def _init_callbacks(params, config):
                 write_graph=True,
                 # whether to visualize gradient histograms in TensorBoard, histogram_freq must be
                 # greater than 0 (default: False)
-                write_grads=True,
+                write_grads=histograms,
                 # whether to write model weights to visualize as image in TensorBoard
                 # (default: False)
                 write_images=True,
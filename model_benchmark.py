@@ -0,0 +1,374 @@
+"""Module to benchmark the training of the Keras model.
+
+The model is trained with the same data and hyperparameters for each input mode (see
+ml_models.INPUT_MODES). The mean time per epoch and the accuracy on the validation and test data
+are compared, so that the speed-up of masking and bucketing can be checked at equal accuracy.
+
+In the same way the types of the recurrent layers (see ml_models.CELL_TYPES) are compared by the
+training samples per second, the inference latency and the accuracy, so that the fastest type
+which reaches the required accuracy can be chosen.
+
+The types of the model (see ml_models.MODEL_TYPES) are trained until they reach a target validation
+accuracy. The floating point operations of a prediction, the number of epochs and the training time
+until the target is reached are compared, so that the cost of the permutation-invariant set encoder
+can be weighed against the stacked LSTM layers at equal accuracy.
+"""
+
+import logging
+import os
+import time
+
+import keras
+import numpy as np
+import tensorflow as tf
+
+import data_stream
+import logging_config
+import main
+import ml_models
+import params
+
+# random seed of the weights, equal for all trained models
+WEIGHTS_SEED = 4
+
+# number of repetitions of the latency measurements (the median is reported)
+LATENCY_REPEATS = 20
+
+
+class EpochTimer(keras.callbacks.Callback):
+    """Callback that measures the time of each epoch."""
+
+    def __init__(self):
+        """Constructor of class EpochTimer."""
+        super(EpochTimer, self).__init__()
+        self.epoch_times = []  # time of each epoch
+        self._epoch_start = None  # start time of the current epoch
+
+    def on_epoch_begin(self, epoch, logs=None):
+        """Start measuring the epoch."""
+        self._epoch_start = time.time()
+
+    def on_epoch_end(self, epoch, logs=None):
+        """Stop measuring the epoch."""
+        self.epoch_times.append(time.time() - self._epoch_start)
+
+
+class TargetAccuracy(keras.callbacks.Callback):
+    """Callback that stops the training as soon as a target validation accuracy is reached."""
+
+    def __init__(self, target_val_acc):
+        """Constructor of class TargetAccuracy.
+
+        Args:
+            target_val_acc -- the target validation accuracy
+        """
+        super(TargetAccuracy, self).__init__()
+        self.target_val_acc = target_val_acc
+        self.epochs_to_target = None  # number of epochs until the target was reached
+        self.time_to_target = None  # training time until the target was reached (in seconds)
+        self.best_val_acc = 0.0  # best validation accuracy of all epochs
+        self._train_start = None  # start time of the training
+
+    def on_train_begin(self, logs=None):
+        """Start measuring the training."""
+        self._train_start = time.time()
+
+    def on_epoch_end(self, epoch, logs=None):
+        """Stop the training if the target is reached."""
+        val_acc = (logs or {}).get('val_acc', 0.0)
+        self.best_val_acc = max(self.best_val_acc, val_acc)
+
+        if val_acc >= self.target_val_acc:
+            self.epochs_to_target = epoch + 1
+            self.time_to_target = time.time() - self._train_start
+            self.model.stop_training = True
+
+
+def benchmark_input_modes(data, hparams, input_modes=None, num_epochs=5):
+    """Benchmark the input modes of the model.
+
+    For each input mode a new model is trained for num_epochs epochs (without callbacks like early
+    stopping, so that all models are trained equally long) and evaluated on the test data.
+
+    Args:
+        data -- a dictionary with the training, testing and validation data (see main.load_data)
+        hparams -- hyperparameter dictionary
+        input_modes -- list with the input modes, default: ml_models.INPUT_MODES
+        num_epochs -- number of epochs per model
+    Return:
+        results -- list with a dictionary per input mode (input_mode, epoch_time, first_epoch_time,
+                   val_acc, test_acc)
+    """
+    logger = logging.getLogger('RNN-SA.model_benchmark.benchmark_input_modes')
+    logger.info("Starting to benchmark the input modes...")
+    start_time = time.time()
+
+    # distribution of the number of tasks per task-set
+    lengths, counts = np.unique(data_stream.get_taskset_lengths(data['train_X']),
+                                return_counts=True)
+    logger.info("Task-sets per number of tasks: %s", ", ".join(
+        "%d: %d" % (length, count) for length, count in zip(lengths, counts)))
+
+    results = []
+    for input_mode in input_modes or ml_models.INPUT_MODES:
+        mode_hparams = dict(hparams, input_mode=input_mode, num_epochs=num_epochs)
+        results.append(_benchmark_model(data, mode_hparams))
+
+    # compare with the padded input
+    reference = results[0]
+    for result in results:
+        logger.info("%-9s: %.3f s per epoch (speed-up %.2f), first epoch %.3f s, val_acc = %f "
+                    "(%+f), test_acc = %f (%+f)", result['input_mode'], result['epoch_time'],
+                    reference['epoch_time'] / result['epoch_time'], result['first_epoch_time'],
+                    result['val_acc'], result['val_acc'] - reference['val_acc'],
+                    result['test_acc'], result['test_acc'] - reference['test_acc'])
+
+    end_time = time.time()
+    logger.info("Benchmark of the input modes finished!")
+    logger.info("Time elapsed: %f s", end_time - start_time)
+
+    return results
+
+
+def benchmark_cell_types(data, hparams, cell_types=None, num_epochs=5):
+    """Benchmark the types of the recurrent layers on the CPU.
+
+    For each type a new model is trained for num_epochs epochs (like in benchmark_input_modes) and
+    evaluated on the test data. The inference latency is measured for a single task-set (online
+    admission) and for a batch of hparams['batch_size'] task-sets.
+
+    Args:
+        data -- a dictionary with the training, testing and validation data (see main.load_data)
+        hparams -- hyperparameter dictionary
+        cell_types -- list with the types of the recurrent layers, default: ml_models.CELL_TYPES
+                      ('lstm' is always benchmarked as reference)
+        num_epochs -- number of epochs per model
+    Return:
+        results -- list with a dictionary per type (cell_type, samples_per_sec, latency,
+                   batch_latency, val_acc, test_acc, ...)
+    """
+    logger = logging.getLogger('RNN-SA.model_benchmark.benchmark_cell_types')
+    logger.info("Starting to benchmark the types of the recurrent layers...")
+    start_time = time.time()
+
+    # the generic LSTM layers are the reference
+    cell_types = ['lstm'] + [cell_type for cell_type in cell_types or ml_models.CELL_TYPES
+                             if cell_type != 'lstm']
+
+    results = []
+    for cell_type in cell_types:
+        type_hparams = dict(hparams, cell_type=cell_type, num_epochs=num_epochs)
+        results.append(_benchmark_model(data, type_hparams))
+
+    # compare with the generic LSTM layers
+    reference = results[0]
+    for result in results:
+        logger.info("%-13s: %.0f samples/s (speed-up %.2f), latency %.3f ms (batch of %d: %.3f "
+                    "ms), val_acc = %f (%+f), test_acc = %f (%+f)", result['cell_type'],
+                    result['samples_per_sec'],
+                    result['samples_per_sec'] / reference['samples_per_sec'],
+                    1000 * result['latency'], hparams['batch_size'], 1000 * result['batch_latency'],
+                    result['val_acc'], result['val_acc'] - reference['val_acc'],
+                    result['test_acc'], result['test_acc'] - reference['test_acc'])
+
+    end_time = time.time()
+    logger.info("Benchmark of the types of the recurrent layers finished!")
+    logger.info("Time elapsed: %f s", end_time - start_time)
+
+    return results
+
+
+def benchmark_model_types(data, hparams, model_types=None, target_val_acc=None, max_epochs=None):
+    """Benchmark the types of the model at equal accuracy.
+
+    For each type a new model is trained until it reaches the target validation accuracy or
+    max_epochs epochs (without other callbacks, see benchmark_input_modes) and evaluated on the test
+    data. The number of epochs and the training time until the target is reached are compared with
+    the stacked LSTM layers. The floating point operations of a prediction are counted from the
+    weights of the model.
+
+    Args:
+        data -- a dictionary with the training, testing and validation data (see main.load_data)
+        hparams -- hyperparameter dictionary
+        model_types -- list with the types of the model, default: ml_models.MODEL_TYPES ('lstm' is
+                       always benchmarked as reference)
+        target_val_acc -- the target validation accuracy, default:
+                          config['benchmark_target_val_acc']
+        max_epochs -- maximum number of epochs per model, default: hparams['num_epochs']
+    Return:
+        results -- list with a dictionary per type (model_type, flops, epochs_to_target,
+                   time_to_target, best_val_acc, epoch_time, latency, val_acc, test_acc, ...),
+                   epochs_to_target and time_to_target are None if the target was not reached
+    """
+    logger = logging.getLogger('RNN-SA.model_benchmark.benchmark_model_types')
+    logger.info("Starting to benchmark the types of the model...")
+    start_time = time.time()
+
+    if target_val_acc is None:
+        target_val_acc = params.config['benchmark_target_val_acc']
+    max_epochs = max_epochs or hparams['num_epochs']
+    logger.info("Target: val_acc >= %f within %d epochs", target_val_acc, max_epochs)
+
+    # the stacked LSTM layers are the reference
+    model_types = ['lstm'] + [model_type for model_type in model_types or ml_models.MODEL_TYPES
+                              if model_type != 'lstm']
+
+    results = []
+    for model_type in model_types:
+        target = TargetAccuracy(target_val_acc)
+        type_hparams = dict(hparams, model_type=model_type, num_epochs=max_epochs)
+        result = _benchmark_model(data, type_hparams, callbacks=[target])
+        result.update(epochs_to_target=target.epochs_to_target,
+                      time_to_target=target.time_to_target, best_val_acc=target.best_val_acc)
+        results.append(result)
+
+    # compare with the stacked LSTM layers
+    reference = results[0]
+    for result in results:
+        logger.info("%-8s: %d FLOPs per task-set (%.2f), %d parameters, %.3f s per epoch, latency "
+                    "%.3f ms", result['model_type'], result['flops'],
+                    result['flops'] / reference['flops'], result['num_params'],
+                    result['epoch_time'], 1000 * result['latency'])
+
+        if result['epochs_to_target'] is None:
+            logger.info("%-8s: target not reached within %d epochs (best val_acc = %f)",
+                        result['model_type'], max_epochs, result['best_val_acc'])
+        elif reference['time_to_target'] is None:
+            logger.info("%-8s: target reached after %d epochs in %.3f s (the reference didn't "
+                        "reach it), test_acc = %f", result['model_type'],
+                        result['epochs_to_target'], result['time_to_target'], result['test_acc'])
+        else:
+            logger.info("%-8s: target reached after %d epochs in %.3f s (speed-up %.2f), "
+                        "test_acc = %f (%+f)", result['model_type'], result['epochs_to_target'],
+                        result['time_to_target'],
+                        reference['time_to_target'] / result['time_to_target'],
+                        result['test_acc'], result['test_acc'] - reference['test_acc'])
+
+    end_time = time.time()
+    logger.info("Benchmark of the types of the model finished!")
+    logger.info("Time elapsed: %f s", end_time - start_time)
+
+    return results
+
+
+def _benchmark_model(data, hparams, callbacks=None):
+    """Train and evaluate a model with the given hyperparameters.
+
+    Args:
+        data -- a dictionary with the training, testing and validation data
+        hparams -- hyperparameter dictionary incl. the input mode, the cell type and the model type
+        callbacks -- list with additional callbacks for the training
+    Return:
+        result -- dictionary with the results (input_mode, cell_type, model_type, flops,
+                  num_params, epoch_time, first_epoch_time, samples_per_sec, latency,
+                  batch_latency, val_acc, test_acc)
+    """
+    input_mode = ml_models.get_input_mode(hparams)
+    verbose = params.config['verbose_training']
+
+    # new graph with the same initial weights for each model
+    keras.backend.clear_session()
+    np.random.seed(WEIGHTS_SEED)
+    tf.set_random_seed(WEIGHTS_SEED)
+
+    model = ml_models.build_model(hparams, params.config)
+    epoch_timer = EpochTimer()
+    callbacks = [epoch_timer] + (callbacks or [])
+
+    if input_mode == 'bucketing':
+        # batches of task-sets with the same number of tasks
+        train_sequence, val_sequence, test_sequence = [
+            data_stream.BucketSequence(data[split + '_X'], data[split + '_y'],
+                                       hparams['batch_size'], shuffle=split == 'train')
+            for split in ['train', 'val', 'test']]
+
+        out = model.fit_generator(train_sequence, steps_per_epoch=len(train_sequence),
+                                  epochs=hparams['num_epochs'], verbose=verbose,
+                                  callbacks=callbacks, validation_data=val_sequence,
+                                  validation_steps=len(val_sequence), shuffle=False)
+        _, test_acc = model.evaluate_generator(test_sequence, steps=len(test_sequence))
+    else:
+        # padded task-sets
+        out = model.fit(data['train_X'], data['train_y'], batch_size=hparams['batch_size'],
+                        epochs=hparams['num_epochs'], verbose=verbose, callbacks=callbacks,
+                        validation_data=[data['val_X'], data['val_y']], shuffle=True)
+        _, test_acc = model.evaluate(data['test_X'], data['test_y'],
+                                     batch_size=hparams['batch_size'], verbose=0)
+
+    # the first epoch includes building the graph, it is reported separately
+    epoch_times = epoch_timer.epoch_times
+    epoch_time = float(np.mean(epoch_times[1:] or epoch_times))
+    return {
+        'input_mode': input_mode,
+        'cell_type': ml_models.get_cell_type(hparams),
+        'model_type': ml_models.get_model_type(hparams),
+        'flops': _count_flops(model, data['train_X'].shape[1]),
+        'num_params': model.count_params(),
+        'epoch_time': epoch_time,
+        'first_epoch_time': epoch_times[0],
+        'samples_per_sec': len(data['train_y']) / epoch_time,
+        'latency': _measure_latency(model, data['test_X'][:1]),
+        'batch_latency': _measure_latency(model, data['test_X'][:hparams['batch_size']]),
+        'val_acc': out.history['val_acc'][-1],
+        'test_acc': test_acc,
+    }
+
+
+def _count_flops(model, time_steps):
+    """Count the floating point operations of the prediction of one task-set.
+
+    Only the matrix multiplications are counted (a multiplication and an addition per weight), the
+    activation functions and the pooling are negligible. Recurrent and time distributed layers are
+    applied to each of the time steps (padded task-sets).
+
+    Args:
+        model -- the Keras model
+        time_steps -- number of time steps (tasks) of a task-set
+    Return:
+        flops -- number of floating point operations
+    """
+    flops = 0
+    for layer in model.layers:
+        if isinstance(layer, keras.layers.TimeDistributed):
+            weights, steps = layer.layer.get_weights(), time_steps
+        elif isinstance(layer, keras.layers.RNN):
+            weights, steps = layer.get_weights(), time_steps
+        else:
+            weights, steps = layer.get_weights(), 1
+
+        # kernels (and recurrent kernels) are the 2-dimensional weights
+        flops += steps * sum(2 * weight.size for weight in weights if weight.ndim == 2)
+    return flops
+
+
+def _measure_latency(model, x):
+    """Measure the inference latency of a model.
+
+    Args:
+        model -- the trained Keras model
+        x -- numpy array with the task-sets of one prediction
+    Return:
+        latency -- median time of a prediction (in seconds)
+    """
+    model.predict(x, batch_size=len(x))  # first prediction builds the predict function
+
+    latencies = []
+    for _ in range(LATENCY_REPEATS):
+        start_time = time.time()
+        model.predict(x, batch_size=len(x))
+        latencies.append(time.time() - start_time)
+    return float(np.median(latencies))
+
+
+if __name__ == "__main__":
+    # determine database directory and name
+    db_dir, db_name = os.getcwd(), "panda_v3.db"
+
+    # create and initialize logger
+    logging_config.init_logging(db_dir, db_name)
+
+    # load the data, compare the input modes, the types of the recurrent layers and of the model
+    data = main.load_data(db_dir, db_name)
+    benchmark_input_modes(data, params.hparams)
+    benchmark_cell_types(data, params.hparams)
+    benchmark_model_types(data, params.hparams)
@@ -0,0 +1,336 @@
+"""Module for the inference of the LSTM model with NumPy only.
+
+Importing TensorFlow and Keras takes seconds, which is too slow for admission decisions. The
+Sequential model built by ml_models._build_LSTM_model (input layer, optional masking, stacked LSTM
+layers, dropout and a sigmoid Dense layer) is therefore exported by export_model() to a compressed
+.npz file with the weights and the architecture. A NumpyLSTMModel loads this file and runs the
+forward pass batched over many task-sets with NumPy:
+    - the input projection of the first LSTM layer is computed for all time steps at once
+    - the recurrence is computed step by step with one matrix product per step
+    - dropout is the identity at inference, masked time steps keep the previous state.
+Only export_model() and compare_with_keras() import Keras (when they are called).
+"""
+
+import json
+import logging
+import os
+import time
+
+import numpy as np
+
+# version of the file format of the exported model
+EXPORT_FORMAT_VERSION = 1
+
+
+def _hard_sigmoid(x):
+    """Hard sigmoid as defined by Keras (default recurrent activation of the LSTM layer)."""
+    return np.clip(0.2 * x + 0.5, 0.0, 1.0)
+
+
+def _sigmoid(x):
+    """Logistic sigmoid."""
+    return 1.0 / (1.0 + np.exp(-x))
+
+
+# activation functions supported by the NumPy inference (Keras name -> function)
+ACTIVATIONS = {
+    'tanh': np.tanh,
+    'sigmoid': _sigmoid,
+    'hard_sigmoid': _hard_sigmoid,
+    'relu': lambda x: np.maximum(x, 0.0),
+    'linear': lambda x: x,
+}
+
+
+class NumpyLSTMModel:
+    """Forward pass of an exported LSTM model with NumPy.
+
+    The model is defined by following attributes:
+        layers -- list with a dictionary per layer (type, activations and weights)
+        time_steps -- number of time steps of the input, None if the length is variable
+        element_size -- number of features per time step
+        mask_value -- value of the padded time steps if the model has a Masking layer, else None
+    """
+
+    def __init__(self, layers, time_steps, element_size, mask_value=None):
+        """Constructor of class NumpyLSTMModel."""
+        self.layers = layers
+        self.time_steps = time_steps
+        self.element_size = element_size
+        self.mask_value = mask_value
+
+    def __str__(self):
+        """Represent model as string."""
+        return "NumpyLSTMModel(input=(%s, %s), layers=[%s])" % (
+            self.time_steps, self.element_size, ", ".join(
+                "%s(%d)" % (layer['type'], layer['kernel'].shape[1] // (
+                    4 if layer['type'] == 'LSTM' else 1)) for layer in self.layers))
+
+    @staticmethod
+    def load(path):
+        """Load an exported model.
+
+        Args:
+            path -- path of the .npz file written by export_model()
+        Return:
+            model -- the NumpyLSTMModel-object
+        """
+        with np.load(path) as archive:
+            architecture = json.loads(str(archive['architecture']))
+            if architecture['version'] != EXPORT_FORMAT_VERSION:
+                raise ValueError("%s has format version %s instead of %d" % (
+                    path, architecture['version'], EXPORT_FORMAT_VERSION))
+
+            layers = []
+            for idx, layer in enumerate(architecture['layers']):
+                for activation in ('activation', 'recurrent_activation'):
+                    if layer.get(activation, 'linear') not in ACTIVATIONS:
+                        raise ValueError("unsupported activation %s" % (layer[activation],))
+
+                weights = {name: archive['layer%d_%s' % (idx, name)] for name in
+                           layer.pop('weights')}
+                layer.update(weights)
+                layers.append(layer)
+
+        return NumpyLSTMModel(layers, architecture['time_steps'], architecture['element_size'],
+                              architecture['mask_value'])
+
+    def predict_proba(self, x, batch_size=None):
+        """Predict the probability that task-sets are schedulable.
+
+        Args:
+            x -- numpy array with the task-sets [num_tasksets X time_steps X num_features]
+            batch_size -- number of task-sets per forward pass, default: all task-sets at once
+        Return:
+            probabilities -- float32 numpy array with the outputs of the model [num_tasksets]
+        """
+        x = np.asarray(x, dtype=np.float32)
+        if x.ndim != 3 or x.shape[2] != self.element_size:
+            raise ValueError("input must have the shape (num_tasksets, time_steps, %d)" % (
+                self.element_size,))
+
+        batch_size = batch_size or max(len(x), 1)
+        outputs = [self._forward(x[start:start + batch_size]) for start in
+                   range(0, len(x), batch_size)]
+
+        return np.concatenate(outputs).reshape(-1) if outputs else np.zeros(0, dtype=np.float32)
+
+    def predict(self, x, batch_size=None, threshold=0.5):
+        """Predict whether task-sets are schedulable.
+
+        Args:
+            x -- numpy array with the task-sets [num_tasksets X time_steps X num_features]
+            batch_size -- number of task-sets per forward pass, default: all task-sets at once
+            threshold -- output above which a task-set is classified as schedulable
+        Return:
+            labels -- numpy array with 1 (schedulable) or 0 (not schedulable) [num_tasksets]
+        """
+        return (self.predict_proba(x, batch_size) > threshold).astype(np.int32)
+
+    def _forward(self, x):
+        """Forward pass of one batch.
+
+        Args:
+            x -- float32 numpy array with the task-sets [batch_size X time_steps X num_features]
+        Return:
+            output -- float32 numpy array with the output of the last layer
+        """
+        # time steps that are processed (all time steps without Masking layer)
+        mask = None
+        if self.mask_value is not None:
+            mask = np.any(x != self.mask_value, axis=2)
+
+        output = x
+        for layer in self.layers:
+            if layer['type'] == 'LSTM':
+                output = _lstm_forward(output, mask, layer)
+            else:  # Dense
+                output = ACTIVATIONS[layer['activation']](
+                    output.dot(layer['kernel']) + layer['bias'])
+
+        return output.astype(np.float32)
+
+
+def _lstm_forward(x, mask, layer):
+    """Forward pass of an LSTM layer (gate order of Keras: input, forget, cell, output).
+
+    Args:
+        x -- numpy array with the input sequences [batch_size X time_steps X input_size]
+        mask -- boolean numpy array with the processed time steps [batch_size X time_steps] or None
+        layer -- dictionary with the weights and activations of the layer
+    Return:
+        output -- the full output sequence if layer['return_sequences'], else the last output
+    """
+    batch_size, time_steps, input_size = x.shape
+    units = layer['recurrent_kernel'].shape[0]
+    activation = ACTIVATIONS[layer['activation']]
+    recurrent_activation = ACTIVATIONS[layer['recurrent_activation']]
+
+    # input projection of all time steps at once
+    projection = (x.reshape(-1, input_size).dot(layer['kernel']) + layer['bias']).reshape(
+        batch_size, time_steps, 4 * units)
+
+    h = np.zeros((batch_size, units), dtype=np.float32)
+    c = np.zeros((batch_size, units), dtype=np.float32)
+    outputs = np.empty((batch_size, time_steps, units), dtype=np.float32) \
+        if layer['return_sequences'] else None
+
+    for step in range(time_steps):
+        z = projection[:, step] + h.dot(layer['recurrent_kernel'])
+        i = recurrent_activation(z[:, :units])
+        f = recurrent_activation(z[:, units:2 * units])
+        c_new = f * c + i * activation(z[:, 2 * units:3 * units])
+        h_new = recurrent_activation(z[:, 3 * units:]) * activation(c_new)
+
+        if mask is not None:  # masked time steps keep the previous state
+            step_mask = mask[:, step, np.newaxis]
+            c_new = np.where(step_mask, c_new, c)
+            h_new = np.where(step_mask, h_new, h)
+
+        h, c = h_new, c_new
+        if outputs is not None:
+            outputs[:, step] = h
+
+    return outputs if outputs is not None else h
+
+
+def export_model(model, path):
+    """Export a Keras LSTM model to a .npz file.
+
+    Supported are the layers of ml_models._build_LSTM_model: InputLayer, Masking, LSTM, Dropout and
+    Dense. Dropout layers are skipped (identity at inference).
+
+    Args:
+        model -- the Keras Sequential model
+        path -- path of the .npz file
+    """
+    logger = logging.getLogger('RNN-SA.numpy_lstm.export_model')
+
+    mask_value = None
+    layers = []
+    arrays = {}
+    for layer in model.layers:
+        layer_type = type(layer).__name__
+        if layer_type in ('InputLayer', 'Dropout'):
+            continue
+        if layer_type == 'Masking':
+            mask_value = float(layer.mask_value)
+            continue
+
+        layer_config = layer.get_config()
+        if layer_type == 'LSTM':
+            if not layer_config['use_bias'] or layer_config['go_backwards'] or \
+                    layer_config['stateful']:
+                raise ValueError("LSTM layer %s has unsupported options" % (layer.name,))
+            names = ['kernel', 'recurrent_kernel', 'bias']
+            description = {
+                'type': 'LSTM',
+                'activation': layer_config['activation'],
+                'recurrent_activation': layer_config['recurrent_activation'],
+                'return_sequences': layer_config['return_sequences'],
+            }
+        elif layer_type == 'Dense':
+            if not layer_config['use_bias']:
+                raise ValueError("Dense layer %s has no bias" % (layer.name,))
+            names = ['kernel', 'bias']
+            description = {'type': 'Dense', 'activation': layer_config['activation']}
+        else:
+            raise ValueError("unsupported layer %s of type %s" % (layer.name, layer_type))
+
+        for activation in ('activation', 'recurrent_activation'):
+            if description.get(activation, 'linear') not in ACTIVATIONS:
+                raise ValueError("unsupported activation %s of layer %s" % (
+                    description[activation], layer.name))
+
+        description['weights'] = names
+        for name, weight in zip(names, layer.get_weights()):
+            arrays['layer%d_%s' % (len(layers), name)] = weight.astype(np.float32)
+        layers.append(description)
+
+    architecture = {
+        'version': EXPORT_FORMAT_VERSION,
+        'time_steps': model.input_shape[1],
+        'element_size': model.input_shape[2],
+        'mask_value': mask_value,
+        'layers': layers,
+    }
+
+    # create directory of the file
+    directory = os.path.dirname(path)
+    if directory and not os.path.exists(directory):
+        os.makedirs(directory)
+
+    # savez_compressed appends .npz if the path has no extension, write to an open file instead
+    with open(path, 'wb') as model_file:
+        np.savez_compressed(model_file, architecture=np.array(json.dumps(architecture)), **arrays)
+
+    logger.info("Exported %d layers to %s (%d bytes)", len(layers), path, os.path.getsize(path))
+
+
+def compare_with_keras(model, numpy_model, x, atol=1e-5, batch_size=1024):
+    """Compare the outputs and the latency of the Keras model and the exported model.
+
+    Args:
+        model -- the Keras model
+        numpy_model -- the exported NumpyLSTMModel-object
+        x -- numpy array with the task-sets [num_tasksets X time_steps X num_features]
+        atol -- maximum absolute difference of the outputs
+        batch_size -- number of task-sets per forward pass
+    Return:
+        result -- dictionary with the maximum absolute difference, the number of different
+                  classes and the time per batch of both models (in seconds)
+    """
+    logger = logging.getLogger('RNN-SA.numpy_lstm.compare_with_keras')
+
+    # first prediction builds the predict function of Keras, it is not measured
+    model.predict(x[:batch_size], batch_size=batch_size)
+    num_batches = max(-(-len(x) // batch_size), 1)
+
+    start_time = time.time()
+    keras_output = model.predict(x, batch_size=batch_size).reshape(-1)
+    keras_time = (time.time() - start_time) / num_batches
+
+    start_time = time.time()
+    numpy_output = numpy_model.predict_proba(x, batch_size=batch_size)
+    numpy_time = (time.time() - start_time) / num_batches
+
+    max_difference = float(np.max(np.abs(keras_output - numpy_output))) if len(x) else 0.0
+    result = {
+        'max_difference': max_difference,
+        'num_different_classes': int(np.sum((keras_output > 0.5) != (numpy_output > 0.5))),
+        'keras_batch_time': keras_time,
+        'numpy_batch_time': numpy_time,
+    }
+    logger.info("max |keras - numpy| = %g, %d different classes, time per batch of %d: keras "
+                "%f s, numpy %f s", max_difference, result['num_different_classes'],
+                batch_size, keras_time, numpy_time)
+
+    if max_difference > atol:
+        raise ValueError("outputs differ by %g (tolerance %g)" % (max_difference, atol))
+
+    return result
+
+
+if __name__ == "__main__":
+    import keras
+
+    import logging_config
+    import main
+    import params
+
+    # determine database directory and name
+    db_dir, db_name = os.getcwd(), "panda_v3.db"
+
+    # create and initialize logger
+    logging_config.init_logging(db_dir, db_name)
+
+    # export the trained model and check it on the test data
+    keras_model = keras.models.load_model(params.config['model_path'])
+    export_model(keras_model, params.config['numpy_model_path'])
+
+    load_start = time.time()
+    exported_model = NumpyLSTMModel.load(params.config['numpy_model_path'])
+    logging.getLogger('RNN-SA.numpy_lstm').info("Loaded %s in %f s", exported_model,
+                                                time.time() - load_start)
+
+    compare_with_keras(keras_model, exported_model, main.load_data(db_dir, db_name)['test_X'])
@@ -6,6 +6,12 @@
          - as a range of values in a tuple (min, max, steps)
          - as a single value in a list
 
+    Hyperparameters hparams_tpe: a regular Python dictionary that declares the search space of the
+    model-based hyperparameter search (hyperparameter_search.TPESampler):
+         - as a set of discreet values in a list
+         - as a range of values in a tuple (min, max)
+         - as a range of values on a logarithmic scale in a tuple (min, max, 'log')
+
     Hyperparameters hparams: regular Python dictionary with static hyperparameters for Keras
     model without the usage of Talos
 
@@ -36,6 +42,22 @@ hparams_talos = {
     'optimizer': ['adam'],  # optimizer (must be a optimizer instance of Keras)
 }
 
+# search space for the model-based hyperparameter search
+hparams_tpe = {
+    ### TRAINING ###
+    'batch_size': (32, 1024, 'log'),  # number of samples per gradient update
+    'num_epochs': [150],  # number of epochs to train the model
+
+    ### MODEL ###
+    'keep_prob': (0.1, 1.0),  # fraction of the input units to keep (not to drop!)
+    'num_cells': (1, 10),  # number of LSTM cells
+    'hidden_layer_size': (10, 1000, 'log'),  # number of neurons in the LSTM layers
+    'hidden_activation': ['tanh'],  # activation function to use
+
+    ### COMPILE ###
+    'optimizer': ['adam'],  # optimizer
+}
+
 # static hyperparameter for Keras model without Talos
 hparams = {
     ### TRAINING ###
@@ -49,6 +71,13 @@ hparams = {
     'hidden_layer_size': 319,   # number of neurons in the LSTM layers
     'hidden_activation': 'tanh',  # activation function to use (must be an
     # instance of Keras)
+    'input_mode': 'padded',  # 'padded' (pad all task-sets to time_steps), 'masking' (skip padded
+    # time steps with a Masking layer) or 'bucketing' (batches of task-sets with equal length)
+    'cell_type': 'lstm',  # type of the recurrent layers: 'lstm', 'lstm_fused', 'lstm_unrolled',
+    # 'gru' or 'simple_rnn' (compare the types with model_benchmark.py)
+    'model_type': 'lstm',  # 'lstm' (stacked recurrent layers) or 'deepsets' (permutation-invariant
+    # set encoder with num_cells dense layers per task)
+    'pooling': 'sum_max',  # pooling of the set encoder over the tasks: 'sum', 'max' or 'sum_max'
 
     ### COMPILE ###
     'optimizer': 'adam',  # optimizer (must be a optimizer instance of Keras)
@@ -74,6 +103,53 @@ config = {
     # ReduceLROnPlateau: reduce learning rate when a metric has stopped improving
     'use_reduceLR': True,  # whether to use the ReduceLROnPlateau callback
 
+    ### DATA ###
+    'data_feeding': 'memory',  # 'memory' = load all data into the memory, 'stream' = stream the
+    # batches from the database during training (for databases larger than the memory)
+    'batches_per_page': 32,  # streaming: number of batches read from the database at once
+    'workers': 1,  # streaming: number of background threads that prefetch the batches
+    'max_queue_size': 10,  # streaming: maximum number of prefetched batches
+    'use_data_cache': True,  # whether the pre-processed data is cached on disk
+    'data_cache_dir': os.path.join(os.getcwd(), "dataset_cache"),  # path to the directory where
+    # the pre-processed data is cached
+    'feature_pipeline_path': os.path.join(os.getcwd(), "experiments", "LSTM", "checkpoints",
+                                          "feature_pipeline.pkl"),  # path to the file where the
+    # fitted pre-processing of the task attributes is saved (next to the model)
+
+    ### HYPERPARAMETER SEARCH ###
+    'search_workers': 4,  # number of trials trained at once in worker processes
+    'search_intra_op_threads': 2,  # TensorFlow threads per operation in each worker
+    'search_inter_op_threads': 1,  # TensorFlow operations executed in parallel in each worker
+    'search_seed': 4,  # random seed of the weights of each trial (None = not fixed)
+    'use_trial_cache': True,  # whether the results of the trials are cached on disk
+    'trial_cache_dir': os.path.join(os.getcwd(), "experiments", "LSTM", "trial_cache"),  # path to
+    # the directory where the results of the trials are cached
+    'halving_min_epochs': 5,  # successive halving: epoch budget of the first round
+    'halving_eta': 3,  # successive halving: 1/eta of the trials survive a round, the epoch budget
+    # of the survivors grows by the factor eta
+    'tpe_num_trials': 50,  # model-based search: maximum number of trials
+    'tpe_target_val_acc': 0.985,  # model-based search: stop as soon as a trial reaches this val_acc
+    # (None = train all trials)
+
+    ### BENCHMARK ###
+    'benchmark_target_val_acc': 0.985,  # model_benchmark.py: the types of the model are trained
+    # until they reach this val_acc (at most num_epochs epochs)
+
+    ### INFERENCE ###
+    'model_path': os.path.join(os.getcwd(), "experiments", "LSTM", "checkpoints",
+                               "weights.best.hdf5"),  # path to the trained model for inference
+    'numpy_model_path': os.path.join(os.getcwd(), "experiments", "LSTM", "checkpoints",
+                                     "weights.best.npz"),  # path to the model exported for the
+    # inference with NumPy (numpy_lstm.py)
+    'hybrid_lower': 0.1,  # hybrid analysis: lower limit of the uncertainty band of the output
+    'hybrid_upper': 0.9,  # hybrid analysis: upper limit of the uncertainty band, task-sets with an
+    # output in [hybrid_lower, hybrid_upper] are checked with the exact RTA
+    'inference_max_batch_size': 1024,  # maximum number of task-sets per micro-batch
+    'inference_max_latency': 0.005,  # maximum time (in seconds) a request waits for other requests
+    'inference_host': '127.0.0.1',  # host of the inference server
+    'inference_port': 8000,  # port of the inference server
+    'inference_socket': None,  # path of a Unix socket for the inference server (instead of TCP)
+
     ### TRAINING ###
     'verbose_training': 2,  # verbosity mode, 0 = silent, 1 = progress bar, 2 = one line per epoch
 
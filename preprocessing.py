@@ -0,0 +1,313 @@
+"""Module for the pre-processing of the task attributes.
+
+The task attributes (rows of the table Task) are pre-processed by a FeaturePipeline:
+    - the used features are selected by their column index
+    - the non-numeric feature PKG is one hot encoded
+    - the features are scaled ('minmax' or 'standard').
+The pipeline is fitted once (on the table Task) and can be saved next to the model, so that new
+task-sets are transformed exactly like the training data without fitting the scaler again.
+"""
+
+import logging
+import os
+import pickle
+
+import numpy as np
+import sklearn.preprocessing
+
+# default features of all task attributes (column names of 'Task')
+DEFAULT_FEATURES = ['Task_ID', 'Priority', 'Deadline', 'Quota', 'CAPS', 'PKG', 'Arg', 'CORES',
+                    'COREOFFSET', 'CRITICALTIME', 'Period', 'Number_of_Jobs', 'OFFSET']
+
+# task attributes that should be used for classifying task-sets
+USE_FEATURES = ['Priority', 'PKG', 'Arg', 'CRITICALTIME', 'Period', 'Number_of_Jobs']
+
+# one hot encoding of task attribute PKG
+PKG_ENCODING = {
+    'cond_mod': [1, 0, 0, 0],
+    'hey': [0, 1, 0, 0],
+    'pi': [0, 0, 1, 0],
+    'tumatmul': [0, 0, 0, 1]
+}
+
+# scaler for the task attributes: 'minmax' (rescaling to [0, 1]) or 'standard' (zero-mean and
+# unit-variance)
+SCALER = 'minmax'
+
+
+class FeaturePipeline(object):
+    """Representation of the pre-processing of the task attributes.
+
+    The pipeline works column-wise on numpy arrays: the used columns are selected in one pass over
+    the task attributes, PKG is encoded through a lookup array and the scaler is fitted only once
+    by fit().
+    """
+
+    def __init__(self, default_features=None, use_features=None, pkg_encoding=None,
+                 scaler=SCALER):
+        """Constructor of class FeaturePipeline.
+
+        Args:
+            default_features -- list with the names of all task attributes (columns of 'Task'),
+                                default: DEFAULT_FEATURES
+            use_features -- list with the names of the used task attributes, default: USE_FEATURES
+            pkg_encoding -- dictionary with the one hot encoding of PKG, default: PKG_ENCODING
+            scaler -- 'minmax' (rescaling to [0, 1]) or 'standard' (zero-mean and unit-variance)
+        """
+        if scaler not in ('minmax', 'standard'):
+            raise ValueError("unknown scaler %s" % (scaler,))
+
+        self.default_features = list(default_features or DEFAULT_FEATURES)
+        self.use_features = list(use_features or USE_FEATURES)
+        self.pkg_encoding = dict(pkg_encoding or PKG_ENCODING)
+        self.scaler = scaler
+
+        unknown_features = set(self.use_features) - set(self.default_features)
+        if unknown_features:
+            raise ValueError("unknown features %s" % (sorted(unknown_features),))
+
+        # column indices of the used features (in the order of the default features)
+        self._columns = [idx for idx, name in enumerate(self.default_features) if name in
+                         self.use_features]
+
+        # lookup array of the one hot encoding: row i is the encoding of self._pkg_names[i]
+        self._pkg_names = sorted(self.pkg_encoding)
+        self._pkg_lookup = np.asarray([self.pkg_encoding[name] for name in self._pkg_names],
+                                      dtype=np.float64)
+
+        self._scaler = None  # the fitted scikit-learn scaler
+
+    def __str__(self):
+        """Represent pipeline as string."""
+        return "FeaturePipeline(features=%s, scaler=%s, fitted=%s)" % (self.feature_names,
+                                                                     self.scaler, self.is_fitted)
+
+    @property
+    def is_fitted(self):
+        """Whether the scaler of the pipeline is fitted."""
+        return self._scaler is not None
+
+    @property
+    def feature_names(self):
+        """Names of the features of the transformed task attributes."""
+        # names of the one hot encoded PKG columns, ordered by the position of the 1
+        pkg_names = sorted(self._pkg_names, key=lambda name: np.argmax(self.pkg_encoding[name]))
+
+        names = []
+        for idx in self._columns:
+            if self.default_features[idx] == 'PKG':
+                names.extend('PKG_' + name for name in pkg_names)
+            else:
+                names.append(self.default_features[idx])
+        return names
+
+    def get_settings(self):
+        """Get the settings of the pipeline.
+
+        Return:
+            settings -- dictionary with the settings (serializable to JSON)
+        """
+        return {
+            'default_features': self.default_features,
+            'use_features': self.use_features,
+            'pkg_encoding': self.pkg_encoding,
+            'scaler': self.scaler,
+        }
+
+    def fit(self, task_attributes):
+        """Fit the scaler of the pipeline.
+
+        Args:
+            task_attributes -- list with the task attributes (rows of the table Task)
+        Return:
+            self -- the fitted FeaturePipeline-object
+        """
+        if self.scaler == 'minmax':
+            # min-max normalization
+            scaler = sklearn.preprocessing.MinMaxScaler(feature_range=(0, 1))
+        else:
+            # standardization
+            scaler = sklearn.preprocessing.StandardScaler()
+
+        self._scaler = scaler.fit(self._encode(task_attributes))
+        return self
+
+    def transform(self, task_attributes):
+        """Transform the task attributes.
+
+        Args:
+            task_attributes -- list with the task attributes (rows of the table Task)
+        Return:
+            features -- float32 numpy array with the pre-processed task attributes [num_tasks X
+                        num_features]
+        """
+        if not self.is_fitted:
+            raise ValueError("FeaturePipeline is not fitted")
+
+        return self._scaler.transform(self._encode(task_attributes)).astype(np.float32)
+
+    def fit_transform(self, task_attributes):
+        """Fit the scaler of the pipeline and transform the task attributes.
+
+        Args:
+            task_attributes -- list with the task attributes (rows of the table Task)
+        Return:
+            features -- float32 numpy array with the pre-processed task attributes [num_tasks X
+                        num_features]
+        """
+        return self.fit(task_attributes).transform(task_attributes)
+
+    def transform_tasksets(self, task_ids, task_attributes, time_steps=None):
+        """Transform task-sets to the input tensor of the model.
+
+        Args:
+            task_ids -- numpy array with the task IDs of the task-sets [num_tasksets X 4],
+                        Task_ID = -1 marks an empty slot
+            task_attributes -- list with the task attributes of (at least) all tasks of the
+                               task-sets
+            time_steps -- number of time steps of the tensor, default: maximum number of tasks
+                          per task-set
+        Return:
+            tasksets -- C-contiguous float32 numpy array with the task-sets [num_tasksets X
+                        time_steps X num_features]
+        """
+        id_idx = self.default_features.index('Task_ID')  # column of the task ID
+        return build_taskset_tensor(task_ids, [row[id_idx] for row in task_attributes],
+                                    self.transform(task_attributes), time_steps)
+
+    def save(self, path):
+        """Save the pipeline to a file.
+
+        Args:
+            path -- path of the file
+        """
+        if not self.is_fitted:
+            raise ValueError("FeaturePipeline is not fitted")
+
+        # create directory of the file
+        directory = os.path.dirname(path)
+        if directory and not os.path.exists(directory):
+            os.makedirs(directory)
+
+        with open(path, 'wb') as pipeline_file:
+            pickle.dump(self, pipeline_file, protocol=pickle.HIGHEST_PROTOCOL)
+
+        logging.getLogger('RNN-SA.preprocessing.FeaturePipeline.save').info(
+            "Saved %s to %s", self, path)
+
+    @staticmethod
+    def load(path):
+        """Load a pipeline from a file.
+
+        Args:
+            path -- path of the file
+        Return:
+            pipeline -- the FeaturePipeline-object
+        """
+        with open(path, 'rb') as pipeline_file:
+            pipeline = pickle.load(pipeline_file)
+
+        if not isinstance(pipeline, FeaturePipeline):
+            raise ValueError("%s does not contain a FeaturePipeline" % (path,))
+
+        return pipeline
+
+    def _encode(self, task_attributes):
+        """Select the used features and do one hot encoding.
+
+        Args:
+            task_attributes -- list with the task attributes (rows of the table Task)
+        Return:
+            encoded -- float64 numpy array with the encoded task attributes [num_tasks X
+                       num_features]
+        """
+        # transpose the rows to columns in one pass
+        columns = list(zip(*task_attributes)) or [()] * len(self.default_features)
+        if len(columns) != len(self.default_features):
+            raise ValueError("task attributes have %d columns instead of %d" % (
+                len(columns), len(self.default_features)))
+
+        encoded = []
+        for idx in self._columns:
+            if self.default_features[idx] == 'PKG':
+                encoded.append(self._encode_pkg(columns[idx]))
+            else:
+                encoded.append(np.asarray(columns[idx], dtype=np.float64).reshape(-1, 1))
+
+        return np.hstack(encoded)
+
+    def _encode_pkg(self, pkg_column):
+        """Do one hot encoding of PKG.
+
+        Args:
+            pkg_column -- column with the values of PKG
+        Return:
+            encoded -- float64 numpy array with the one hot encoded values [num_tasks X
+                       num_packages]
+        """
+        # map every distinct value to a row of the lookup array
+        values, inverse = np.unique(np.asarray(pkg_column, dtype=object).astype(str),
+                                    return_inverse=True)
+        unknown = [str(value) for value in values if value not in self.pkg_encoding]
+        if unknown:
+            raise ValueError("unknown PKG %s" % (unknown,))
+        rows = np.searchsorted(self._pkg_names, values)
+
+        return self._pkg_lookup[rows[inverse.reshape(-1)]].reshape(-1, self._pkg_lookup.shape[1])
+
+
+def build_taskset_tensor(task_ids, feature_task_ids, features, time_steps=None):
+    """Build the tensor of the task-sets.
+
+    This function replaces the task IDs of the task-sets with the attributes of the tasks. The
+    tasks of each task-set are moved to the front (Task_ID = -1 is removed), the remaining time
+    steps are padded with zeros (post-padding). The attributes are gathered at once from one
+    feature matrix.
+
+    Args:
+        task_ids -- numpy array with the task IDs of the task-sets [num_tasksets X 4]
+        feature_task_ids -- list with the task IDs of the rows of features
+        features -- numpy array with the (pre-processed) task attributes [num_tasks X
+                    num_features]
+        time_steps -- number of time steps of the tensor, default: maximum number of tasks per
+                      task-set
+    Return:
+        tasksets -- C-contiguous float32 numpy array with the task-sets [num_tasksets X
+                    time_steps X num_features]
+    """
+    task_ids = np.asarray(task_ids, dtype=np.int64)
+    mask = task_ids != -1  # valid tasks
+
+    # move valid tasks to the front, keep their order
+    order = np.argsort(~mask, axis=1, kind='mergesort')
+    task_ids = np.take_along_axis(task_ids, order, axis=1)
+    mask = np.take_along_axis(mask, order, axis=1)
+
+    # cut to the maximum number of tasks per task-set
+    max_num_tasks = int(mask.sum(axis=1).max()) if len(mask) else 0
+    if time_steps is not None:
+        if max_num_tasks > time_steps:
+            raise ValueError("task-set has more than %d tasks" % (time_steps,))
+        max_num_tasks = time_steps
+    task_ids = task_ids[:, :max_num_tasks]
+    mask = mask[:, :max_num_tasks]
+
+    # pad to the number of time steps
+    if task_ids.shape[1] < max_num_tasks:
+        padding = ((0, 0), (0, max_num_tasks - task_ids.shape[1]))
+        task_ids = np.pad(task_ids, padding, mode='constant', constant_values=-1)
+        mask = np.pad(mask, padding, mode='constant', constant_values=False)
+
+    # lookup table: task ID -> row of the feature matrix, the last row is the padding row
+    feature_task_ids = np.asarray(feature_task_ids, dtype=np.int64)
+    lookup = np.full(max(int(feature_task_ids.max(initial=-1)), int(task_ids.max(initial=-1)))
+                     + 2, len(features), dtype=np.int64)
+    lookup[feature_task_ids] = np.arange(len(features))
+    rows = lookup[np.where(mask, task_ids, -1)]  # Task_ID = -1 -> padding row
+
+    if (rows[mask] == len(features)).any():  # unknown task ID
+        raise ValueError("task-set contains a task that is not in the table Task")
+
+    # gather task attributes, padded time steps are zero
+    padded_features = np.vstack((features, np.zeros((1, features.shape[1]), dtype=features.dtype)))
+    return np.ascontiguousarray(padded_features[rows], dtype=np.float32)
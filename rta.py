@@ -4,11 +4,25 @@ Response Time Analysis Methods:
     rta_audsley: RTA with start value according to Audsley.
     rta_buttazzo: RTA with start value according to Buttazzo.
 The methods only differ in the starting value for response time calculation.
+
+Batch Response Time Analysis Methods:
+    rta_buttazzo_batch: RTA according to Buttazzo for many task-sets given as NumPy arrays.
+    rta_buttazzo_taskset_batch: rta_buttazzo_batch for a TasksetBatch.
+The batch methods give exactly the same results as rta_buttazzo.
+
+Schedulability Pipeline:
+    SchedulabilityPipeline: cascade of fast sufficient tests in front of rta_buttazzo_batch.
+
+Memoization:
+    ResponseTimeCache: reuses response times of tasks across task-sets with the same hp-set.
 """
+import collections
 import logging
 
 import math
 
+import numpy as np
+
 import database_interface
 
 
@@ -75,6 +89,430 @@ def rta_buttazzo(taskset):
     return True
 
 
+def rta_buttazzo_batch(C, T, D, prio, mask, task_ids=None, return_response_times=False):
+    """Response Time Analysis according to Buttazzo for a batch of task-sets.
+
+    Check the schedulability of N task-sets with at most M tasks each at once. The response times
+    of all tasks of all task-sets are calculated through the iterative formula
+        R_(k+1) = C_i + sum( ceil(R_k / T_j) * C_j )
+    with integer arithmetic. The iteration of a task stops as soon as its response time converges
+    or exceeds its deadline. A task-set is schedulable if and only if for all tasks: R_i <= D_i
+
+    The results are the same as the results of rta_buttazzo. In rta_buttazzo a task doesn't
+    interfere with itself, also if it is contained several times in a task-set. To get the same
+    behaviour, the task IDs must be given, otherwise only the task in the same slot is excluded.
+
+    Args:
+        C -- execution times, integer array of shape (N, M)
+        T -- periods, integer array of shape (N, M)
+        D -- deadlines, integer array of shape (N, M)
+        prio -- priorities, integer array of shape (N, M), 1 is the highest priority
+        mask -- boolean array of shape (N, M), True for a task and False for an empty slot
+        task_ids -- IDs of the tasks, integer array of shape (N, M) (optional)
+        return_response_times -- whether the response times should be returned
+    Return:
+        schedulable -- boolean array of shape (N,), schedulability of each task-set
+        response_times -- integer array of shape (N, M) with the response times, 0 for empty
+                          slots (only if return_response_times is True)
+    """
+    C = np.asarray(C, dtype=np.int64)
+    T = np.asarray(T, dtype=np.int64)
+    D = np.asarray(D, dtype=np.int64)
+    prio = np.asarray(prio, dtype=np.int64)
+    mask = np.asarray(mask, dtype=bool)
+
+    C = np.where(mask, C, 0)  # empty slots don't interfere
+    T = np.where(mask, T, 1)  # avoid division by zero for empty slots
+
+    # same_or_higher[n, i, j]: task j has higher or same priority as task i
+    same_or_higher = (prio[:, np.newaxis, :] <= prio[:, :, np.newaxis]) \
+        & mask[:, np.newaxis, :] & mask[:, :, np.newaxis]
+
+    # hp-set of each task: tasks of higher or same priority without the task itself
+    num_tasks = mask.shape[1]
+    if task_ids is None:
+        same_task = np.eye(num_tasks, dtype=bool)[np.newaxis, :, :]
+    else:
+        task_ids = np.asarray(task_ids)
+        same_task = task_ids[:, np.newaxis, :] == task_ids[:, :, np.newaxis]
+    high_prio = same_or_higher & ~same_task
+
+    # start value according to Buttazzo: sum of execution times of tasks with higher or same
+    # priority incl. the task itself
+    response_times = (same_or_higher * C[:, np.newaxis, :]).sum(axis=2)
+
+    # tasks without hp-set: response time = start value
+    # tasks with start value 0: response time doesn't change
+    active = mask & high_prio.any(axis=2) & (response_times != 0)
+
+    while active.any():  # while the response time of any task changes
+        rows = np.flatnonzero(active.any(axis=1))  # task-sets with active tasks
+        r_old = response_times[rows]
+
+        # interference of the hp-set: sum( ceil(R_k / T_j) * C_j ), integer ceiling division
+        interference = -(-r_old[:, :, np.newaxis] // T[rows][:, np.newaxis, :]) \
+            * C[rows][:, np.newaxis, :]
+        r_new = C[rows] + (interference * high_prio[rows]).sum(axis=2)
+
+        # update response times of active tasks
+        row_active = active[rows]
+        r_new = np.where(row_active, r_new, r_old)
+        response_times[rows] = r_new
+
+        # stop iteration if the response time converged or is greater than the deadline
+        active[rows] = row_active & (r_new != r_old) & (r_new <= D[rows])
+
+    response_times = np.where(mask, response_times, 0)
+
+    # task-set is schedulable if no task misses its deadline
+    schedulable = ~((response_times > D) & mask).any(axis=1)
+
+    if return_response_times:
+        return schedulable, response_times
+    return schedulable
+
+
+def rta_buttazzo_taskset_batch(batch, return_response_times=False):
+    """Response Time Analysis according to Buttazzo for a TasksetBatch.
+
+    Args:
+        batch -- the task-sets of type TasksetBatch that should be tested
+        return_response_times -- whether the response times should be returned
+    Return:
+        schedulable -- boolean array, schedulability of each task-set
+        response_times -- array with the response times (only if return_response_times is True)
+    """
+    # Check input argument: must be a TasksetBatch
+    if not isinstance(batch, database_interface.TasksetBatch):  # Invalid input argument
+        raise ValueError("batch must be of type TasksetBatch")
+
+    return rta_buttazzo_batch(batch.execution_times, batch.periods, batch.deadlines,
+                              batch.priorities, batch.mask, task_ids=batch.task_ids,
+                              return_response_times=return_response_times)
+
+
+class ResponseTimeCache:
+    """Response time analysis according to Buttazzo with memoization of the response times.
+
+    The response time of a task depends only on the task itself and the tasks with higher or same
+    priority. Task-sets drawn from a small catalogue of tasks share these hp-sets very often.
+    Therefore the response times are cached with the signature
+        (task ID, sorted IDs of all tasks with higher or same priority incl. the task itself)
+    as key. The cache is bounded: if it is full, the least recently used response time is
+    evicted. The tasks are identified only by their IDs, so a cache must not be used for tasks
+    with different attributes but the same ID (e.g. after the execution times have changed).
+
+    The cache is defined by following attributes:
+        maxsize -- maximum number of cached response times
+        hits -- number of response times taken from the cache
+        misses -- number of response times that had to be calculated
+    """
+
+    def __init__(self, maxsize=100000):
+        """Constructor."""
+        if maxsize < 1:
+            raise ValueError("maxsize must be at least 1")
+
+        self.maxsize = maxsize  # maximum number of cached response times
+        self.hits = 0  # number of response times taken from the cache
+        self.misses = 0  # number of response times that had to be calculated
+        self._response_times = collections.OrderedDict()  # key = signature, value = R
+
+    def __len__(self):
+        """Get number of cached response times."""
+        return len(self._response_times)
+
+    def __str__(self):
+        """Represent statistics of the cache as string."""
+        return "size=%d hits=%d misses=%d hit rate=%.1f%%" % (len(self), self.hits, self.misses,
+                                                              100.0 * self.hit_rate)
+
+    @property
+    def hit_rate(self):
+        """Get fraction of response times taken from the cache."""
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+    def clear(self):
+        """Remove all cached response times and reset the statistics."""
+        self._response_times.clear()
+        self.hits = 0
+        self.misses = 0
+
+    def rta_buttazzo(self, taskset):
+        """Response Time Analysis according to Buttazzo with cached response times.
+
+        Keyword arguments:
+            taskset -- the task-set that should be tested
+        Return value:
+            True/False -- schedulability of task-set
+        """
+        # Check input argument: must be a TaskSet
+        if not isinstance(taskset, database_interface.Taskset):  # Invalid input argument
+            raise ValueError("taskset must be of type Taskset")
+
+        # Check schedulability of all tasks in the task-set
+        for check_task in taskset:  # Iterate over all tasks
+            # Check schedulability of task
+            if self.response_time(taskset, check_task) > check_task.deadline:
+                # Task-set is NOT schedulable
+                return False
+
+        # All tasks are schedulable -> task-set is schedulable
+        return True
+
+    def response_time(self, taskset, check_task):
+        """Get the response time of a task according to Buttazzo.
+
+        Args:
+            taskset -- the complete task-set
+            check_task -- the task for which the response time should be calculated
+        Return:
+            response_time -- response time of check_task
+        """
+        # signature: task and all tasks of higher or same priority
+        key = (check_task.task_id, tuple(sorted(task.task_id for task in taskset
+                                                if task.priority <= check_task.priority)))
+
+        response_time = self._get(key)
+        if response_time is None:  # not cached: calculate response time
+            self.misses += 1
+            start_value = _get_start_value_buttazzo(taskset, check_task)
+            response_time = _caluclate_response_time(taskset, check_task, start_value)
+            self._put(key, response_time)
+        else:
+            self.hits += 1
+
+        return response_time
+
+    def check_taskset_batch(self, batch):
+        """Response Time Analysis according to Buttazzo for a TasksetBatch with cached response
+        times.
+
+        The signatures of all tasks of the batch are built at once. Only for signatures that are
+        neither cached nor already seen in the batch the response time is calculated (with
+        rta_buttazzo_batch on the task-sets where they occur first).
+
+        Args:
+            batch -- the task-sets of type TasksetBatch that should be tested
+        Return:
+            schedulable -- boolean array, schedulability of each task-set
+        """
+        # Check input argument: must be a TasksetBatch
+        if not isinstance(batch, database_interface.TasksetBatch):  # Invalid input argument
+            raise ValueError("batch must be of type TasksetBatch")
+
+        mask = batch.mask
+        prio = batch.priorities
+        task_ids = batch.task_ids
+
+        # signature of each task: task ID and sorted IDs of tasks with higher or same priority,
+        # filled up with -1
+        same_or_higher = (prio[:, np.newaxis, :] <= prio[:, :, np.newaxis]) \
+            & mask[:, np.newaxis, :] & mask[:, :, np.newaxis]
+        hp_ids = np.where(same_or_higher, task_ids[:, np.newaxis, :], np.iinfo(np.int64).max)
+        hp_ids = np.sort(hp_ids, axis=2)
+        hp_ids[hp_ids == np.iinfo(np.int64).max] = -1
+        signatures = np.concatenate((task_ids[:, :, np.newaxis], hp_ids), axis=2)[mask]
+
+        # positions (task-set, slot) of all tasks
+        rows, slots = np.nonzero(mask)
+
+        # unique signatures of the batch
+        if len(signatures):
+            unique_signatures, first_index, inverse, counts = np.unique(
+                signatures, axis=0, return_index=True, return_inverse=True, return_counts=True)
+            inverse = inverse.reshape(-1)
+        else:
+            unique_signatures, first_index, inverse, counts = signatures, rows, rows, rows
+
+        # look up the unique signatures in the cache
+        unique_response_times = np.zeros(len(unique_signatures), dtype=np.int64)
+        missing = []  # indices of the signatures which are not cached
+        for index, signature in enumerate(map(tuple, unique_signatures.tolist())):
+            response_time = self._get(signature)
+            if response_time is None:
+                missing.append(index)
+                self.misses += 1
+                self.hits += int(counts[index]) - 1
+            else:
+                unique_response_times[index] = response_time
+                self.hits += int(counts[index])
+
+        # calculate the missing response times on the task-sets where they occur first
+        if missing:
+            missing = np.asarray(missing)
+            missing_rows = rows[first_index[missing]]
+            missing_slots = slots[first_index[missing]]
+            compute_rows, compute_inverse = np.unique(missing_rows, return_inverse=True)
+            _, response_times = rta_buttazzo_taskset_batch(batch[compute_rows],
+                                                           return_response_times=True)
+            unique_response_times[missing] = response_times[compute_inverse.reshape(-1),
+                                                            missing_slots]
+            for index in missing.tolist():
+                self._put(tuple(unique_signatures[index].tolist()),
+                          int(unique_response_times[index]))
+
+        # task-set is schedulable if no task misses its deadline
+        response_times = np.zeros(mask.shape, dtype=np.int64)
+        response_times[rows, slots] = unique_response_times[inverse]
+        return ~((response_times > batch.deadlines) & mask).any(axis=1)
+
+    def _get(self, key):
+        """Get a cached response time and mark it as recently used (None if not cached)."""
+        response_time = self._response_times.get(key)
+        if response_time is not None:
+            self._response_times.move_to_end(key)
+        return response_time
+
+    def _put(self, key, response_time):
+        """Cache a response time, evict the least recently used one if the cache is full."""
+        self._response_times[key] = response_time
+        self._response_times.move_to_end(key)
+        if len(self._response_times) > self.maxsize:
+            self._response_times.popitem(last=False)
+
+
+class SchedulabilityPipeline:
+    """Schedulability analysis with a cascade of tests.
+
+    The task-sets are first checked with O(n) tests, only the task-sets which can't be decided by
+    these tests are checked with the exact response time analysis (rta_buttazzo_batch):
+        1. utilization: a task-set with utilization U > 1 is not schedulable
+        2. liu_layland: a task-set with U <= n * (2^(1/n) - 1) is schedulable
+        3. hyperbolic: a task-set with prod(U_i + 1) <= 2 is schedulable
+        4. rta: exact response time analysis
+    The results are the same as the results of rta_buttazzo. Therefore each test is only applied
+    to task-sets which fulfil its preconditions:
+        utilization -- positive execution times and periods, D_i <= T_i, no task twice
+        liu_layland, hyperbolic -- positive periods, D_i >= T_i, distinct priorities, priorities
+                                   assigned rate monotonic (shorter period, higher priority)
+    The number of task-sets decided by each test is counted in the dictionary statistics.
+
+    If a ResponseTimeCache is given, the exact response time analysis reuses its cached response
+    times.
+    """
+
+    # tests of the pipeline in the order they are applied
+    STAGES = ('utilization', 'liu_layland', 'hyperbolic', 'rta')
+
+    # safety margin for comparing floating point utilizations with the bounds
+    EPSILON = 1e-9
+
+    def __init__(self, response_time_cache=None):
+        """Constructor."""
+        self.statistics = dict.fromkeys(self.STAGES, 0)  # number of task-sets decided per test
+        self.response_time_cache = response_time_cache  # cache for the exact analysis
+
+    def __str__(self):
+        """Represent statistics of the pipeline as string."""
+        total = max(sum(self.statistics.values()), 1)
+        return ", ".join("%s=%d (%.1f%%)" % (stage, self.statistics[stage],
+                                              100.0 * self.statistics[stage] / total)
+                         for stage in self.STAGES)
+
+    def reset_statistics(self):
+        """Reset the number of task-sets decided by each test."""
+        self.statistics = dict.fromkeys(self.STAGES, 0)
+
+    def merge_statistics(self, statistics):
+        """Add the statistics of another pipeline (e.g. of a worker process)."""
+        for stage in self.STAGES:
+            self.statistics[stage] += statistics[stage]
+
+    def check(self, taskset):
+        """Check the schedulability of a task-set.
+
+        Args:
+            taskset -- the task-set of type Taskset that should be tested
+        Return:
+            True/False -- schedulability of task-set
+        """
+        # Check input argument: must be a TaskSet
+        if not isinstance(taskset, database_interface.Taskset):  # Invalid input argument
+            raise ValueError("taskset must be of type Taskset")
+
+        batch = database_interface.TasksetBatch.from_tasksets([taskset],
+                                                              max_tasks=max(len(taskset), 1))
+        return bool(self.check_taskset_batch(batch)[0])
+
+    def check_taskset_batch(self, batch):
+        """Check the schedulability of a batch of task-sets.
+
+        Args:
+            batch -- the task-sets of type TasksetBatch that should be tested
+        Return:
+            schedulable -- boolean array, schedulability of each task-set
+        """
+        # Check input argument: must be a TasksetBatch
+        if not isinstance(batch, database_interface.TasksetBatch):  # Invalid input argument
+            raise ValueError("batch must be of type TasksetBatch")
+
+        C = batch.execution_times
+        T = batch.periods
+        D = batch.deadlines
+        prio = batch.priorities
+        mask = batch.mask
+        num_tasks = np.maximum(batch.lengths, 1)
+
+        schedulable = np.zeros(len(batch), dtype=bool)
+        undecided = np.ones(len(batch), dtype=bool)
+
+        # preconditions of the tests: conditions must hold for all tasks of a task-set
+        positive_periods = np.where(mask, T > 0, True).all(axis=1)
+        positive_executiontimes = np.where(mask, C > 0, True).all(axis=1)
+        constrained_deadlines = np.where(mask, D <= T, True).all(axis=1)
+        deadlines_after_periods = np.where(mask, D >= T, True).all(axis=1)
+
+        # pairs of different tasks in a task-set
+        pairs = mask[:, np.newaxis, :] & mask[:, :, np.newaxis] \
+            & ~np.eye(mask.shape[1], dtype=bool)[np.newaxis, :, :]
+        distinct_tasks = ~(pairs & (batch.task_ids[:, np.newaxis, :]
+                                    == batch.task_ids[:, :, np.newaxis])).any(axis=(1, 2))
+        distinct_priorities = ~(pairs & (prio[:, np.newaxis, :]
+                                         == prio[:, :, np.newaxis])).any(axis=(1, 2))
+        # rate monotonic: a task with higher priority has a shorter or the same period
+        rate_monotonic = ~(pairs & (prio[:, np.newaxis, :] < prio[:, :, np.newaxis])
+                           & (T[:, np.newaxis, :] > T[:, :, np.newaxis])).any(axis=(1, 2))
+
+        # utilization of each task
+        task_utilizations = np.where(mask, C / np.where(mask & (T > 0), T, 1), 0.0)
+        utilization = task_utilizations.sum(axis=1)
+
+        # 1. utilization test: U > 1 -> not schedulable
+        decided = undecided & positive_periods & positive_executiontimes & constrained_deadlines \
+            & distinct_tasks & (utilization > 1 + self.EPSILON)
+        undecided &= ~decided
+        self.statistics['utilization'] += int(decided.sum())
+
+        # 2. Liu & Layland bound: U <= n * (2^(1/n) - 1) -> schedulable
+        bounds_applicable = positive_periods & deadlines_after_periods & distinct_priorities \
+            & rate_monotonic
+        liu_layland_bound = num_tasks * (np.power(2.0, 1.0 / num_tasks) - 1)
+        decided = undecided & bounds_applicable \
+            & (utilization <= liu_layland_bound - self.EPSILON)
+        schedulable |= decided
+        undecided &= ~decided
+        self.statistics['liu_layland'] += int(decided.sum())
+
+        # 3. hyperbolic bound: prod(U_i + 1) <= 2 -> schedulable
+        decided = undecided & bounds_applicable \
+            & (np.prod(task_utilizations + 1, axis=1) <= 2 - self.EPSILON)
+        schedulable |= decided
+        undecided &= ~decided
+        self.statistics['hyperbolic'] += int(decided.sum())
+
+        # 4. exact response time analysis for the remaining task-sets
+        if undecided.any() and self.response_time_cache is not None:
+            schedulable[undecided] = self.response_time_cache.check_taskset_batch(
+                batch[undecided])
+        elif undecided.any():
+            schedulable[undecided] = rta_buttazzo_taskset_batch(batch[undecided])
+        self.statistics['rta'] += int(undecided.sum())
+
+        return schedulable
+
+
 def _get_start_value_buttazzo(taskset, check_task):
     """Calculate the start value for response time calculation according to Buttazzo.
 
@@ -0,0 +1,171 @@
+"""Module to cache the results of hyperparameter trials on disk.
+
+Repeated or extended hyperparameter searches train many configurations again that were already
+trained. The result of a trial (metrics of the last epoch) is therefore saved as JSON file named by
+a hash of
+    - the hyperparameters of the trial
+    - the fingerprint of the training and validation data
+    - the feature configuration (settings of the pre-processing)
+    - the configuration parameters that change the training (see TRAINING_CONFIG_KEYS)
+    - the random seed of the weights.
+A trial with the same key is not trained again, its stored result is returned instead.
+"""
+
+import hashlib
+import json
+import logging
+import os
+
+import numpy as np
+
+# arrays of the data that are part of the fingerprint
+FINGERPRINT_KEYS = ['train_X', 'train_y', 'val_X', 'val_y']
+
+# configuration parameters that change the result of a trial
+TRAINING_CONFIG_KEYS = ['use_earlystopping', 'use_reduceLR', 'num_classes']
+
+
+def get_data_fingerprint(data):
+    """Get the fingerprint of the training and validation data.
+
+    Args:
+        data -- a dictionary with the training and validation data (see main.load_data)
+    Return:
+        fingerprint -- hexadecimal hash of the shapes, types and content of the arrays
+    """
+    data_hash = hashlib.sha256()
+    for data_key in FINGERPRINT_KEYS:
+        array = np.ascontiguousarray(data[data_key])
+        data_hash.update(("%s %s %s" % (data_key, array.shape, array.dtype)).encode())
+        data_hash.update(memoryview(array).cast('B'))
+    return data_hash.hexdigest()
+
+
+def get_trial_key(hparams, data_fingerprint, feature_settings, training_config, seed):
+    """Get the key of a trial.
+
+    Functions (e.g. activation functions) are hashed by name.
+
+    Args:
+        hparams -- hyperparameter dictionary
+        data_fingerprint -- fingerprint of the data (see get_data_fingerprint)
+        feature_settings -- dictionary with the settings of the pre-processing, must be
+                            serializable to JSON
+        training_config -- dictionary with the configuration parameters of the training (see
+                           TRAINING_CONFIG_KEYS), must be serializable to JSON
+        seed -- random seed of the weights
+    Return:
+        key -- hexadecimal hash of the trial
+    """
+    trial = {
+        'hparams': {name: getattr(value, '__name__', value) if callable(value) else value
+                    for name, value in hparams.items()},
+        'data': data_fingerprint,
+        'features': feature_settings,
+        'training': training_config,
+        'seed': seed,
+    }
+    return hashlib.sha256(json.dumps(trial, sort_keys=True, default=str).encode()).hexdigest()
+
+
+def load(cache_dir, key):
+    """Load the cached result of a trial.
+
+    Args:
+        cache_dir -- directory of the cache
+        key -- the key of the trial
+    Return:
+        result -- dictionary with the metrics of the trial or None if nothing is cached
+    """
+    entry_path = _get_entry_path(cache_dir, key)
+    if not os.path.exists(entry_path):  # nothing cached
+        return None
+
+    with open(entry_path, 'r') as entry_file:
+        return json.load(entry_file)
+
+
+def save(cache_dir, key, result):
+    """Save the result of a trial to the cache.
+
+    Args:
+        cache_dir -- directory of the cache
+        key -- the key of the trial
+        result -- dictionary with the metrics of the trial, values must be serializable to JSON
+    """
+    entry_path = _get_entry_path(cache_dir, key)
+    try:
+        if not os.path.exists(cache_dir):
+            os.makedirs(cache_dir)
+
+        # write to a temporary file first, so that no incomplete entry is read
+        with open(entry_path + '.tmp', 'w') as entry_file:
+            json.dump(result, entry_file, sort_keys=True)
+        os.replace(entry_path + '.tmp', entry_path)
+    except OSError as os_err:
+        logging.getLogger('RNN-SA.trial_cache.save').error(
+            "Could not save trial result to the cache: %s", os_err)
+
+
+def _get_entry_path(cache_dir, key):
+    """Get the path of a cache entry."""
+    return os.path.join(cache_dir, key + '.json')
+
+
+class TrialCache:
+    """Cache of the trial results of one hyperparameter search.
+
+    The data fingerprint, the feature configuration, the training configuration and the seed are
+    fixed for a search, so only the hyperparameters are given to get() and put().
+    """
+
+    def __init__(self, cache_dir, data, feature_settings, training_config, seed):
+        """Constructor of class TrialCache.
+
+        Args:
+            cache_dir -- directory of the cache
+            data -- a dictionary with the training and validation data
+            feature_settings -- dictionary with the settings of the pre-processing
+            training_config -- dictionary with the configuration parameters of the training
+            seed -- random seed of the weights
+        """
+        self.cache_dir = cache_dir
+        self.data_fingerprint = get_data_fingerprint(data)
+        self.feature_settings = feature_settings
+        self.training_config = training_config
+        self.seed = seed
+        self.hits = 0  # number of trials found in the cache
+        self.misses = 0  # number of trials not found in the cache
+
+    def get(self, hparams):
+        """Get the cached result of a trial.
+
+        Args:
+            hparams -- hyperparameter dictionary
+        Return:
+            result -- dictionary with the hyperparameters and the cached metrics or None
+        """
+        metrics = load(self.cache_dir, self._key(hparams))
+        if metrics is None:
+            self.misses += 1
+            return None
+
+        self.hits += 1
+        result = dict(hparams)
+        result.update(metrics)
+        return result
+
+    def put(self, hparams, result, metric_names):
+        """Save the result of a trial.
+
+        Args:
+            hparams -- hyperparameter dictionary
+            result -- dictionary with the metrics of the trial
+            metric_names -- names of the metrics that are saved
+        """
+        save(self.cache_dir, self._key(hparams), {name: result[name] for name in metric_names})
+
+    def _key(self, hparams):
+        """Get the key of a trial."""
+        return get_trial_key(hparams, self.data_fingerprint, self.feature_settings,
+                             self.training_config, self.seed)